@@ -20,17 +20,33 @@ This script intentionally does not modify Jamf objects.
 from __future__ import annotations
 
 import argparse
+import gzip
+import hashlib
 import json
+import math
 import os
+import random
+import re
 import sys
+import tempfile
+import threading
+import time
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass, field
-from datetime import datetime, timezone
-from typing import Any
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from html import escape
+from pathlib import Path
+from typing import Any, Callable
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
 
 class JamfApiError(RuntimeError):
     """Raised when a Jamf API operation fails."""
@@ -45,11 +61,59 @@ class ExtensionAttribute:
     input_type: str = ""
 
 
+@dataclass
+class Criterion:
+    name: str
+    search_type: str = "is"
+    value: str = ""
+    and_or: str = "and"
+    opening_paren: bool = False
+    closing_paren: bool = False
+
+
 @dataclass
 class SmartGroup:
     id: int
     name: str
-    criteria_names: list[str] = field(default_factory=list)
+    criteria: list[Criterion] = field(default_factory=list)
+    member_count: int | None = None
+    error: str = ""
+
+    @property
+    def criteria_names(self) -> list[str]:
+        return [criterion.name for criterion in self.criteria if criterion.name]
+
+    @property
+    def parent_group_names(self) -> list[str]:
+        return [
+            criterion.value
+            for criterion in self.criteria
+            if criterion.name.lower() in GROUP_CRITERIA and criterion.value
+        ]
+
+
+@dataclass
+class AdvancedSearch:
+    id: int
+    name: str
+    criteria: list[Criterion] = field(default_factory=list)
+    display_fields: list[str] = field(default_factory=list)
+    result_count: int | None = None
+    error: str = ""
+
+
+@dataclass
+class ScopedObject:
+    kind: str
+    id: int
+    name: str
+    target_group_ids: list[int] = field(default_factory=list)
+    excluded_group_ids: list[int] = field(default_factory=list)
+    error: str = ""
+
+
+# criteria that nest one computer group inside another (value = the other group's name)
+GROUP_CRITERIA = {"computer group"}
 
 
 def text_or_empty(node: ET.Element | None, xpath: str) -> str:
@@ -72,6 +136,8 @@ class JamfClient:
         password: str | None = None,
         verify_tls: bool = True,
         timeout: int = 30,
+        pool_size: int = 10,
+        max_retries: int = 3,
     ) -> None:
         self.base_url = base_url.rstrip("/")
         self.client_id = client_id
@@ -80,8 +146,37 @@ class JamfClient:
         self.password = password
         self.verify_tls = verify_tls
         self.timeout = timeout
+        self.max_retries = max_retries
         self.session = requests.Session()
+        # one keep-alive connection per worker thread
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.token: str | None = None
+        self.token_refresh_epoch = 0.0
+        self.token_refreshes = 0
+        self._token_lock = threading.Lock()
+
+    def _set_token(self, token: str, lifetime: float) -> None:
+        # renew at 80% of the lifetime so long inventory scans never send an expired token
+        self.token = token
+        self.token_refresh_epoch = time.time() + max(60.0, lifetime) * 0.8
+        self.token_refreshes += 1
+
+    def _current_token(self, stale: str | None = None) -> str:
+        """The bearer token, re-authenticating near expiry or after a 401 for ``stale``.
+
+        Single-flight: one worker thread re-authenticates, the others wait on the
+        lock and pick up the new token instead of authenticating again.
+        """
+        token = self.token
+        if token and token != stale and time.time() < self.token_refresh_epoch:
+            return token
+        with self._token_lock:
+            if self.token and self.token != stale and time.time() < self.token_refresh_epoch:
+                return self.token
+            self.authenticate()
+            return self.token or ""
 
     def authenticate(self) -> None:
         if self.client_id and self.client_secret:
@@ -128,7 +223,7 @@ class JamfClient:
                 data = response.json()
                 access_token = data.get("access_token") or data.get("token")
                 if access_token:
-                    self.token = access_token
+                    self._set_token(access_token, float(data.get("expires_in") or 900))
                     return True
         return False
 
@@ -150,26 +245,65 @@ class JamfClient:
         access_token = data.get("token") or data.get("access_token")
         if not access_token:
             return False
-        self.token = access_token
+        lifetime = 15 * 60.0
+        try:
+            expires = datetime.fromisoformat(str(data.get("expires") or "").replace("Z", "+00:00"))
+            lifetime = (expires - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            pass
+        self._set_token(access_token, lifetime)
         return True
 
-    def get_classic_xml(self, path: str) -> ET.Element:
+    def _get(self, path: str, accept: str, params: dict[str, Any] | None = None) -> requests.Response:
+        """GET with backoff on 429/5xx and connection errors (Retry-After honoured).
+
+        A 401 re-authenticates once and repeats the request, so a run that
+        outlives its token keeps going.
+        """
         if not self.token:
             raise JamfApiError("No access token available. Call authenticate() first.")
         url = f"{self.base_url}{path}"
-        try:
-            response = self.session.get(
+
+        def send(token: str) -> requests.Response:
+            return self.session.get(
                 url,
-                headers={
-                    "Authorization": f"Bearer {self.token}",
-                    "Accept": "application/xml",
-                },
+                params=params,
+                headers={"Authorization": f"Bearer {token}", "Accept": accept},
                 timeout=self.timeout,
                 verify=self.verify_tls,
             )
-            response.raise_for_status()
-        except requests.RequestException as exc:
-            raise JamfApiError(f"GET failed for {path}: {exc}") from exc
+
+        for attempt in range(self.max_retries + 1):
+            retry_after: str | None = None
+            try:
+                token = self._current_token()
+                response = send(token)
+                if response.status_code == 401:
+                    response = send(self._current_token(stale=token))
+                if response.status_code not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get("Retry-After")
+            except requests.HTTPError as exc:
+                raise JamfApiError(f"GET failed for {path}: {exc}") from exc
+            except requests.RequestException as exc:
+                if attempt == self.max_retries:
+                    raise JamfApiError(f"GET failed for {path}: {exc}") from exc
+            delay = min(30.0, 0.5 * (2 ** attempt) + random.random() * 0.25)
+            if retry_after and retry_after.strip().isdigit():
+                delay = float(retry_after)
+            time.sleep(delay)
+        raise JamfApiError(f"GET failed for {path}: retries exhausted")
+
+    def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        response = self._get(path, "application/json", params=params)
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise JamfApiError(f"Failed to parse JSON for {path}: {exc}") from exc
+
+    def get_classic_xml(self, path: str) -> ET.Element:
+        response = self._get(path, "application/xml")
         try:
             return ET.fromstring(response.text)
         except ET.ParseError as exc:
@@ -208,19 +342,1164 @@ def fetch_smart_group_summaries(client: JamfClient) -> list[tuple[int, str]]:
     return results
 
 
+def parse_criteria(root: ET.Element) -> list[Criterion]:
+    """Smart-group criteria in evaluation (priority) order."""
+    nodes = [node for node in root.findall(".//criteria/criterion") if text_or_empty(node, "name")]
+    nodes.sort(key=lambda node: int(text_or_empty(node, "priority") or 0))
+    return [
+        Criterion(
+            name=text_or_empty(node, "name"),
+            search_type=text_or_empty(node, "search_type") or "is",
+            value=text_or_empty(node, "value"),
+            and_or=text_or_empty(node, "and_or").lower() or "and",
+            opening_paren=text_or_empty(node, "opening_paren").lower() == "true",
+            closing_paren=text_or_empty(node, "closing_paren").lower() == "true",
+        )
+        for node in nodes
+    ]
+
+
 def fetch_smart_group_detail(client: JamfClient, group_id: int, name: str) -> SmartGroup:
     root = client.get_classic_xml(f"/JSSResource/computergroups/id/{group_id}")
-    criteria_names: list[str] = []
-    for criterion in root.findall(".//criteria/criterion"):
-        criterion_name = text_or_empty(criterion, "name")
-        if criterion_name:
-            criteria_names.append(criterion_name)
-    return SmartGroup(id=group_id, name=name, criteria_names=criteria_names)
+    size = text_or_empty(root, "computers/size")
+    return SmartGroup(
+        id=group_id,
+        name=name,
+        criteria=parse_criteria(root),
+        member_count=int(size) if size.isdigit() else None,
+    )
+
+
+# kind -> (list path, list element, detail scope path)
+SCOPED_KINDS = {
+    "policy": ("/JSSResource/policies", "policy", "/JSSResource/policies/id/{id}/subset/Scope"),
+    "profile": (
+        "/JSSResource/osxconfigurationprofiles",
+        "os_x_configuration_profile",
+        "/JSSResource/osxconfigurationprofiles/id/{id}/subset/Scope",
+    ),
+}
+
+
+def fetch_scoped_object(client: JamfClient, kind: str, object_id: int, name: str) -> ScopedObject:
+    root = client.get_classic_xml(SCOPED_KINDS[kind][2].format(id=object_id))
+    scope = root.find(".//scope")
+
+    def group_ids(xpath: str) -> list[int]:
+        if scope is None:
+            return []
+        ids = (text_or_empty(node, "id") for node in scope.findall(xpath))
+        return [int(value) for value in ids if value.lstrip("-").isdigit()]
+
+    return ScopedObject(
+        kind=kind,
+        id=object_id,
+        name=name,
+        target_group_ids=group_ids("./computer_groups/computer_group"),
+        excluded_group_ids=group_ids("./exclusions/computer_groups/computer_group"),
+    )
+
+
+def fetch_scoped_objects(client: JamfClient, workers: int = 8, progress: bool | None = None) -> list[ScopedObject]:
+    """Policies and configuration profiles with the computer groups they target or exclude."""
+    objects: list[ScopedObject] = []
+    for kind, (list_path, element, _) in SCOPED_KINDS.items():
+        root = client.get_classic_xml(list_path)
+        summaries = [
+            (int(text_or_empty(node, "id")), text_or_empty(node, "name"))
+            for node in root.findall(f"./{element}")
+            if text_or_empty(node, "id").isdigit()
+        ]
+        results = fetch_parallel(
+            summaries,
+            lambda summary, kind=kind: fetch_scoped_object(client, kind, *summary),
+            workers=workers,
+            label=f"{kind.title()} scopes",
+            progress=progress,
+        )
+        objects.extend(
+            ScopedObject(kind=kind, id=oid, name=name, error=str(result)) if isinstance(result, JamfApiError) else result
+            for (oid, name), result in zip(summaries, results)
+        )
+    return objects
+
+
+class Progress:
+    """Single-line ``label: done/total`` counter on stderr (only when it is a terminal)."""
+
+    def __init__(self, label: str, total: int, enabled: bool | None = None) -> None:
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.enabled = sys.stderr.isatty() if enabled is None else enabled
+
+    def step(self) -> None:
+        self.done += 1
+        if self.enabled:
+            print(f"\r{self.label}: {self.done}/{self.total}", end="", file=sys.stderr, flush=True)
+
+    def close(self) -> None:
+        if self.enabled and self.total:
+            print(file=sys.stderr)
+
+
+def _status_code(exc: JamfApiError) -> int | None:
+    """HTTP status behind a JamfApiError raised for an error response, if any."""
+    return getattr(getattr(exc.__cause__, "response", None), "status_code", None)
+
+
+def fetch_parallel(
+    items: list[Any],
+    fetch: Callable[[Any], Any],
+    workers: int = 8,
+    label: str = "Requests",
+    progress: bool | None = None,
+) -> list[Any | JamfApiError]:
+    """Run ``fetch(item)`` for every item with up to ``workers`` in flight.
+
+    Results come back in ``items`` order; an item whose fetch raised JamfApiError
+    (after the client's own retries) yields the exception instead of a result.
+    """
+    results: list[Any] = [None] * len(items)
+    bar = Progress(label, len(items), progress)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(fetch, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except JamfApiError as exc:
+                results[index] = exc
+            bar.step()
+    bar.close()
+    return results
+
+
+def fetch_smart_group_details(
+    client: JamfClient,
+    summaries: list[tuple[int, str]],
+    workers: int = 8,
+    progress: bool | None = None,
+) -> list[SmartGroup]:
+    """Fetch group details in parallel, in ``summaries`` order.
+
+    A group that still fails after the client's retries comes back as a
+    SmartGroup with ``error`` set instead of aborting the run.
+    """
+    results = fetch_parallel(
+        summaries,
+        lambda summary: fetch_smart_group_detail(client, *summary),
+        workers=workers,
+        label="Smart groups",
+        progress=progress,
+    )
+    return [
+        SmartGroup(id=group_id, name=name, error=str(result)) if isinstance(result, JamfApiError) else result
+        for (group_id, name), result in zip(summaries, results)
+    ]
+
+
+ADVANCED_SEARCH_PAGE_SIZE = 100
+
+
+def parse_advanced_search(record: dict[str, Any]) -> AdvancedSearch:
+    """One /api/v1/advanced-searches record (definition only, no results)."""
+    criteria = sorted(record.get("criteria") or [], key=lambda item: int(item.get("priority") or 0))
+    return AdvancedSearch(
+        id=int(record.get("id") or 0),
+        name=str(record.get("name") or ""),
+        criteria=[
+            Criterion(
+                name=str(item["name"]),
+                search_type=str(item.get("searchType") or "is"),
+                value=str(item.get("value") or ""),
+                and_or=str(item.get("andOr") or "and").lower(),
+                opening_paren=bool(item.get("openingParen")),
+                closing_paren=bool(item.get("closingParen")),
+            )
+            for item in criteria
+            if item.get("name")
+        ],
+        display_fields=[
+            str(item.get("name") if isinstance(item, dict) else item)
+            for item in record.get("displayFields") or []
+            if (item.get("name") if isinstance(item, dict) else item)
+        ],
+    )
+
+
+def fetch_advanced_search(client: JamfClient, search_id: int, name: str) -> AdvancedSearch:
+    # Classic returns the search results with the definition, so each GET also runs the search
+    root = client.get_classic_xml(f"/JSSResource/advancedcomputersearches/id/{search_id}")
+    size = text_or_empty(root, "computers/size")
+    return AdvancedSearch(
+        id=search_id,
+        name=name,
+        criteria=parse_criteria(root),
+        display_fields=[
+            text_or_empty(node, "name")
+            for node in root.findall("./display_fields/display_field")
+            if text_or_empty(node, "name")
+        ],
+        result_count=int(size) if size.isdigit() else None,
+    )
+
+
+def fetch_advanced_searches(
+    client: JamfClient,
+    workers: int = 8,
+    progress: bool | None = None,
+    run_searches: bool = False,
+) -> list[AdvancedSearch]:
+    """Advanced computer search definitions: criteria and display fields.
+
+    Read from the Jamf Pro API listing, which returns definitions without
+    running any search; pages after the first are fetched in parallel.
+    ``run_searches`` uses the Classic per-search GET instead, which also
+    gives result counts but makes Jamf run every search. Servers without
+    the listing (404) fall back to the Classic path with a warning; a page
+    that still fails comes back as an AdvancedSearch with ``error`` set.
+    """
+    if run_searches:
+        return fetch_classic_advanced_searches(client, workers=workers, progress=progress)
+
+    def fetch_page(page: int) -> dict[str, Any]:
+        return client.get_json(
+            "/api/v1/advanced-searches", params={"page": page, "page-size": ADVANCED_SEARCH_PAGE_SIZE}
+        ) or {}
+
+    def page_error(page: int, exc: JamfApiError) -> AdvancedSearch:
+        return AdvancedSearch(id=0, name=f"Advanced search listing page {page + 1}", error=str(exc))
+
+    try:
+        first = fetch_page(0)
+    except JamfApiError as exc:
+        if _status_code(exc) != 404:
+            return [page_error(0, exc)]
+        print(
+            "Warning: /api/v1/advanced-searches is not available; reading searches from the Classic API, "
+            "which runs each search on the server",
+            file=sys.stderr,
+        )
+        return fetch_classic_advanced_searches(client, workers=workers, progress=progress)
+    searches = [parse_advanced_search(record) for record in first.get("results") or []]
+    total = first.get("totalCount")
+    if isinstance(total, int) and total > ADVANCED_SEARCH_PAGE_SIZE:
+        pages = list(range(1, math.ceil(total / ADVANCED_SEARCH_PAGE_SIZE)))
+        for page, result in zip(
+            pages,
+            fetch_parallel(pages, fetch_page, workers=workers, label="Advanced search pages", progress=progress),
+        ):
+            if isinstance(result, JamfApiError):
+                searches.append(page_error(page, result))
+            else:
+                searches.extend(parse_advanced_search(record) for record in result.get("results") or [])
+    return searches
+
+
+def fetch_classic_advanced_searches(
+    client: JamfClient,
+    workers: int = 8,
+    progress: bool | None = None,
+) -> list[AdvancedSearch]:
+    """Classic per-search detail, fetched in parallel; each request runs that search on the server."""
+    root = client.get_classic_xml("/JSSResource/advancedcomputersearches")
+    summaries = [
+        (int(text_or_empty(node, "id")), text_or_empty(node, "name"))
+        for node in root.findall("./advanced_computer_search")
+        if text_or_empty(node, "id").isdigit()
+    ]
+    results = fetch_parallel(
+        summaries,
+        lambda summary: fetch_advanced_search(client, *summary),
+        workers=workers,
+        label="Advanced searches",
+        progress=progress,
+    )
+    return [
+        AdvancedSearch(id=search_id, name=name, error=str(result)) if isinstance(result, JamfApiError) else result
+        for (search_id, name), result in zip(summaries, results)
+    ]
+
+
+class HyperLogLog:
+    """Approximate distinct-value counter in 2**precision bytes (about 1.04/sqrt(2**precision) error)."""
+
+    def __init__(self, precision: int = 10) -> None:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+        x = int.from_bytes(digest, "big")
+        index = x >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = x & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = len(self.registers)
+        zeros = self.registers.count(0)
+        if zeros == m:
+            return 0
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # small-range (linear counting) correction
+        return round(estimate)
+
+
+class SizeHistogram:
+    """Value-size counts: exact below 64 bytes, eighth-of-an-octave buckets above.
+
+    Memory depends on the spread of sizes, not on how many values were seen;
+    percentiles are reported as the bucket's upper bound (at most ~12% high).
+    """
+
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.total = 0
+
+    def add(self, size: int) -> None:
+        if size >= 64:
+            shift = size.bit_length() - 4
+            size = (((size >> shift) + 1) << shift) - 1
+        self.counts[size] = self.counts.get(size, 0) + 1
+        self.total += 1
+
+    def percentile(self, q: float) -> int:
+        if not self.total:
+            return 0
+        target = q * self.total
+        seen = 0
+        for size in sorted(self.counts):
+            seen += self.counts[size]
+            if seen >= target:
+                return size
+        return max(self.counts)
+
+
+@dataclass
+class EAPopulation:
+    filled: int = 0
+    value_bytes: int = 0
+    distinct: HyperLogLog = field(default_factory=HyperLogLog)
+    sizes: SizeHistogram = field(default_factory=SizeHistogram)
+
+
+@dataclass
+class InventoryScan:
+    computers: int = 0
+    pages: int = 0
+    by_id: dict[int, EAPopulation] = field(default_factory=dict)
+    by_name: dict[str, EAPopulation] = field(default_factory=dict)
+
+    def fold_page(self, results: list[dict[str, Any]]) -> None:
+        """Fold one computers-inventory page into the per-EA counters; the page can then be dropped."""
+        self.pages += 1
+        for computer in results:
+            self.computers += 1
+            for entry in computer.get("extensionAttributes") or []:
+                values = [str(v) for v in entry.get("values") or [] if v is not None and str(v).strip()]
+                if not values:
+                    continue
+                definition_id = str(entry.get("definitionId") or "")
+                if definition_id.isdigit():
+                    stats = self.by_id.setdefault(int(definition_id), EAPopulation())
+                else:
+                    stats = self.by_name.setdefault(str(entry.get("name") or ""), EAPopulation())
+                value = "\n".join(values)
+                size = len(value.encode("utf-8"))
+                stats.filled += 1
+                stats.value_bytes += size
+                stats.distinct.add(value)
+                stats.sizes.add(size)
+
+    def stats_for(self, ea_id: int, name: str) -> EAPopulation:
+        return self.by_id.get(ea_id) or self.by_name.get(name) or EAPopulation()
+
+    def summary(self) -> dict[str, Any]:
+        return {"computers_scanned": self.computers, "pages": self.pages}
+
+
+def scan_inventory_extension_attributes(
+    client: JamfClient,
+    page_size: int = 200,
+    progress: bool | None = None,
+    snapshot: InventorySnapshot | None = None,
+) -> InventoryScan:
+    """Stream /api/v1/computers-inventory (EXTENSION_ATTRIBUTES section) page by page.
+
+    With ``snapshot``, the built-in fields it needs are requested too and each page
+    is also folded into the snapshot's columns.
+    """
+    scan = InventoryScan()
+    sections = ["EXTENSION_ATTRIBUTES"] + (SNAPSHOT_SECTIONS if snapshot is not None else [])
+    bar: Progress | None = None
+    page = 0
+    while True:
+        data = client.get_json(
+            "/api/v1/computers-inventory",
+            params={"section": sections, "page": page, "page-size": page_size, "sort": "id:asc"},
+        ) or {}
+        results = data.get("results") or []
+        total = data.get("totalCount")
+        if bar is None:
+            bar = Progress("Inventory pages", math.ceil((total or 0) / page_size), progress)
+        scan.fold_page(results)
+        if snapshot is not None:
+            snapshot.fold_page(results)
+        bar.step()
+        page += 1
+        if not results or (isinstance(total, int) and page * page_size >= total):
+            break
+    if bar is not None:
+        bar.close()
+    return scan
+
+
+LARGE_VALUE_BYTES = 1024
+
+
+def population_flag(row: dict[str, Any]) -> str:
+    """empty / constant / large: EAs collected on every inventory that add little or cost a lot."""
+    if not row["fill_rate_percent"]:
+        return "empty"
+    flags = []
+    if row["distinct_values"] <= 1:
+        flags.append("constant")
+    if row["value_bytes_p95"] >= LARGE_VALUE_BYTES:
+        flags.append("large")
+    return ",".join(flags)
+
+
+def merge_population(rows: list[dict[str, Any]], scan: InventoryScan) -> None:
+    """Add fill rate, distinct-value estimate and value-size stats to each report row."""
+    for row in rows:
+        stats = scan.stats_for(row["id"], row["name"])
+        row["fill_rate_percent"] = round(stats.filled / scan.computers * 100, 2) if scan.computers else 0.0
+        row["distinct_values"] = min(stats.distinct.count(), stats.filled)
+        row["value_bytes_total"] = stats.value_bytes
+        row["value_bytes_p95"] = stats.sizes.percentile(0.95)
+        row["population_flag"] = population_flag(row)
+
+
+# Built-in criteria the snapshot can evaluate: criterion name -> (inventory section, JSON path).
+# EA criteria need no mapping; every EA becomes a column under its display name.
+SNAPSHOT_FIELDS: dict[str, tuple[str, tuple[str, ...]]] = {
+    "Computer Name": ("GENERAL", ("general", "name")),
+    "Last Check-in": ("GENERAL", ("general", "lastContactTime")),
+    "Last Inventory Update": ("GENERAL", ("general", "reportDate")),
+    "Site": ("GENERAL", ("general", "site", "name")),
+    "Model": ("HARDWARE", ("hardware", "model")),
+    "Model Identifier": ("HARDWARE", ("hardware", "modelIdentifier")),
+    "Serial Number": ("HARDWARE", ("hardware", "serialNumber")),
+    "Architecture Type": ("HARDWARE", ("hardware", "processorArchitecture")),
+    "Operating System Version": ("OPERATING_SYSTEM", ("operatingSystem", "version")),
+    "Operating System Build": ("OPERATING_SYSTEM", ("operatingSystem", "build")),
+}
+SNAPSHOT_SECTIONS = sorted({section for section, _ in SNAPSHOT_FIELDS.values()})
+SNAPSHOT_FORMAT = 1
+
+
+class Column:
+    """Dictionary-encoded column: each distinct value stored once, one int code per computer."""
+
+    def __init__(self, values: list[str] | None = None, codes: list[int] | None = None) -> None:
+        self.values: list[str] = values or []
+        self.codes = array("I", codes or [])
+        self._index = {value: code for code, value in enumerate(self.values)}
+
+    def append(self, value: str) -> None:
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def pad(self, rows: int) -> None:
+        while len(self.codes) < rows:
+            self.append("")
+
+
+@dataclass
+class InventorySnapshot:
+    """Inventory held column by column, plus the smart-group definitions it was taken with."""
+
+    generated_at: str = ""
+    computer_ids: list[int] = field(default_factory=list)
+    columns: dict[str, Column] = field(default_factory=dict)
+    groups: list[SmartGroup] = field(default_factory=list)
+
+    def fold_page(self, results: list[dict[str, Any]]) -> None:
+        for computer in results:
+            values: dict[str, str] = {}
+            for name, (_, path) in SNAPSHOT_FIELDS.items():
+                node: Any = computer
+                for key in path:
+                    node = node.get(key) if isinstance(node, dict) else None
+                if node is not None:
+                    values[name] = str(node)
+            for entry in computer.get("extensionAttributes") or []:
+                name = str(entry.get("name") or "")
+                if name:
+                    values[name] = "\n".join(str(v) for v in entry.get("values") or [] if v is not None)
+            row = len(self.computer_ids)
+            self.computer_ids.append(int(computer.get("id") or 0))
+            for name, value in values.items():
+                column = self.columns.get(name)
+                if column is None:
+                    column = self.columns[name] = Column()
+                    column.pad(row)
+                column.append(value.strip())
+            for column in self.columns.values():
+                column.pad(row + 1)
+
+    def save(self, path: str) -> None:
+        data = {
+            "format": SNAPSHOT_FORMAT,
+            "generated_at": self.generated_at,
+            "computer_ids": self.computer_ids,
+            "columns": {name: {"values": col.values, "codes": col.codes.tolist()} for name, col in self.columns.items()},
+            "groups": [
+                {"id": g.id, "name": g.name, "member_count": g.member_count, "criteria": [asdict(c) for c in g.criteria]}
+                for g in self.groups
+            ],
+        }
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as fh:
+            json.dump(data, fh, separators=(",", ":"))
+
+    @staticmethod
+    def load(path: str) -> InventorySnapshot:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path}: unsupported snapshot format {data.get('format')!r}")
+        return InventorySnapshot(
+            generated_at=data["generated_at"],
+            computer_ids=data["computer_ids"],
+            columns={name: Column(col["values"], col["codes"]) for name, col in data["columns"].items()},
+            groups=[
+                SmartGroup(
+                    id=g["id"],
+                    name=g["name"],
+                    member_count=g.get("member_count"),
+                    criteria=[Criterion(**c) for c in g["criteria"]],
+                )
+                for g in data["groups"]
+            ],
+        )
+
+
+class UnsupportedCriterion(ValueError):
+    """A criterion the snapshot cannot evaluate (field not captured, unknown operator, static group)."""
+
+
+def _ordered_key(value: str) -> tuple[int, ...] | float | None:
+    """Version-aware sort key: dotted numbers compare part by part, else as a float."""
+    if re.fullmatch(r"\d+(?:\.\d+)*", value):
+        return tuple(int(part) for part in value.split("."))
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_date(value: str) -> date | None:
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def value_predicate(search_type: str, target: str, today: date) -> Callable[[str], bool]:
+    """Jamf operator -> test on one stored value (string comparisons are case-insensitive, as in Jamf)."""
+    op = search_type.lower()
+    wanted = target.lower()
+    if op == "is":
+        return lambda value: value.lower() == wanted
+    if op == "is not":
+        return lambda value: value.lower() != wanted
+    if op in ("like", "has"):
+        return lambda value: wanted in value.lower()
+    if op in ("not like", "does not have"):
+        return lambda value: wanted not in value.lower()
+    if op in ("matches regex", "does not match regex"):
+        try:
+            pattern = re.compile(target, re.IGNORECASE)
+        except re.error as exc:
+            raise UnsupportedCriterion(f"invalid regex {target!r}: {exc}") from None
+        negate = op.startswith("does not")
+        return lambda value: bool(pattern.search(value)) != negate
+    compare = {
+        "greater than": lambda a, b: a > b,
+        "less than": lambda a, b: a < b,
+        "greater than or equal": lambda a, b: a >= b,
+        "less than or equal": lambda a, b: a <= b,
+    }.get(op)
+    if compare is not None:
+        bound = _ordered_key(target)
+        if bound is None:
+            raise UnsupportedCriterion(f"{search_type} needs a number or version, got {target!r}")
+
+        def ordered(value: str) -> bool:
+            key = _ordered_key(value)
+            if key is None or type(key) is not type(bound):
+                return False
+            return compare(key, bound)
+
+        return ordered
+    if op in ("more than x days ago", "less than x days ago", "before (yyyy-mm-dd)", "after (yyyy-mm-dd)"):
+        if op.endswith("days ago"):
+            if not target.isdigit():
+                raise UnsupportedCriterion(f"{search_type} needs a day count, got {target!r}")
+            cutoff: date | None = today - timedelta(days=int(target))
+        else:
+            cutoff = _parse_date(target)
+            if cutoff is None:
+                raise UnsupportedCriterion(f"{search_type} needs a date, got {target!r}")
+        older = op.startswith(("more", "before"))
+
+        def dated(value: str) -> bool:
+            when = _parse_date(value)
+            return when is not None and (when < cutoff if older else when > cutoff)
+
+        return dated
+    raise UnsupportedCriterion(f"operator {search_type!r} not supported")
+
+
+class GroupEvaluator:
+    """Predict smart-group membership from an inventory snapshot without asking Jamf.
+
+    Each criterion is evaluated once per distinct value of its column, then expanded
+    to a row bitmap (an int, bit n = computer n) in one pass over the codes; and/or
+    and parentheses are plain bitwise ops. Bitmaps are cached per criterion and per
+    group, so shared criteria and nested groups cost nothing extra.
+    """
+
+    def __init__(self, snapshot: InventorySnapshot, groups: list[SmartGroup] | None = None) -> None:
+        self.snapshot = snapshot
+        self.rows = len(snapshot.computer_ids)
+        self.all_rows = (1 << self.rows) - 1
+        self.groups = {group.name: group for group in (snapshot.groups if groups is None else groups)}
+        self.today = _parse_date(snapshot.generated_at) or datetime.now(timezone.utc).date()
+        self._criteria: dict[tuple[str, str, str], int] = {}
+        self._groups: dict[str, int] = {}
+        self._active: set[str] = set()
+
+    def column_bitmap(self, column: Column, test: Callable[[str], bool]) -> int:
+        matches = [test(value) for value in column.values]
+        if all(matches):
+            return self.all_rows
+        if not any(matches):
+            return 0
+        bits = bytearray((self.rows + 7) // 8)
+        for row, code in enumerate(column.codes):
+            if matches[code]:
+                bits[row >> 3] |= 1 << (row & 7)
+        return int.from_bytes(bits, "little")
+
+    def criterion_bitmap(self, criterion: Criterion) -> int:
+        if criterion.name.lower() in GROUP_CRITERIA:
+            members = self.group_bitmap(criterion.value)
+            return self.all_rows & ~members if criterion.search_type.lower().startswith("not") else members
+        key = (criterion.name, criterion.search_type.lower(), criterion.value)
+        if key not in self._criteria:
+            column = self.snapshot.columns.get(criterion.name)
+            if column is None:
+                raise UnsupportedCriterion(f"{criterion.name!r} is not in the snapshot")
+            test = value_predicate(criterion.search_type, criterion.value, self.today)
+            self._criteria[key] = self.column_bitmap(column, test)
+        return self._criteria[key]
+
+    def group_bitmap(self, name: str) -> int:
+        if name in self._groups:
+            return self._groups[name]
+        group = self.groups.get(name)
+        if group is None:
+            raise UnsupportedCriterion(f"group {name!r} is static or not in the snapshot")
+        if name in self._active:
+            raise UnsupportedCriterion(f"group {name!r} nests itself")
+        self._active.add(name)
+        try:
+            bitmap = self.combine(group.criteria)
+        finally:
+            self._active.discard(name)
+        self._groups[name] = bitmap
+        return bitmap
+
+    def combine(self, criteria: list[Criterion]) -> int:
+        """Join criterion bitmaps the way Jamf builds its SQL: parentheses first, then and, then or."""
+        if not criteria:
+            return self.all_rows
+        tokens: list[Any] = []
+        depth = 0
+        for index, criterion in enumerate(criteria):
+            if index:
+                tokens.append("or" if criterion.and_or == "or" else "and")
+            if criterion.opening_paren:
+                tokens.append("(")
+                depth += 1
+            tokens.append(criterion)
+            if criterion.closing_paren and depth:
+                tokens.append(")")
+                depth -= 1
+        tokens.extend([")"] * depth)
+        position = 0
+
+        def any_of() -> int:
+            nonlocal position
+            result = all_of()
+            while position < len(tokens) and tokens[position] == "or":
+                position += 1
+                result |= all_of()
+            return result
+
+        def all_of() -> int:
+            nonlocal position
+            result = operand()
+            while position < len(tokens) and tokens[position] == "and":
+                position += 1
+                result &= operand()
+            return result
+
+        def operand() -> int:
+            nonlocal position
+            token = tokens[position]
+            position += 1
+            if isinstance(token, Criterion):
+                return self.criterion_bitmap(token)
+            result = any_of()  # token == "("
+            position += 1  # its ")"
+            return result
+
+        return any_of()
+
+    def evaluate(self, group: SmartGroup) -> dict[str, Any]:
+        row: dict[str, Any] = {
+            "id": group.id,
+            "name": group.name,
+            "criteria": len(group.criteria),
+            "jamf_members": group.member_count,
+            "predicted_members": None,
+            "predicted_percent": None,
+            "flag": "unknown",
+            "reason": "",
+        }
+        try:
+            members = bin(self.group_bitmap(group.name)).count("1")
+        except UnsupportedCriterion as exc:
+            row["reason"] = str(exc)
+            return row
+        row["predicted_members"] = members
+        row["predicted_percent"] = round(members / self.rows * 100, 2) if self.rows else 0.0
+        row["flag"] = "matches none" if members == 0 else "matches all" if members == self.rows else ""
+        return row
+
+
+def evaluate_snapshot(
+    snapshot: InventorySnapshot,
+    what_if: dict[str, list[Criterion]] | None = None,
+) -> list[dict[str, Any]]:
+    """Predicted size of every snapshot group; with ``what_if``, also the size after replacing criteria.
+
+    Groups nested on a changed group are re-evaluated too, so the effect of a
+    change shows everywhere it reaches.
+    """
+    baseline = GroupEvaluator(snapshot)
+    rows = [baseline.evaluate(group) for group in snapshot.groups]
+    if what_if:
+        changed = {group.name: group for group in snapshot.groups}
+        for name, criteria in what_if.items():
+            original = changed.get(name)
+            changed[name] = SmartGroup(
+                id=original.id if original else 0,
+                name=name,
+                criteria=criteria,
+                member_count=original.member_count if original else None,
+            )
+            if original is None:
+                rows.append({**baseline.evaluate(changed[name]), "flag": "new", "reason": ""})
+        modified = GroupEvaluator(snapshot, list(changed.values()))
+        for row in rows:
+            after = modified.evaluate(changed[row["name"]])
+            row["what_if_members"] = after["predicted_members"]
+            row["what_if_flag"] = after["flag"] or after["reason"]
+    return sorted(
+        rows,
+        key=lambda row: (row["predicted_members"] is None, -(row["predicted_members"] or 0), row["name"].lower()),
+    )
+
+
+def print_group_predictions(rows: list[dict[str, Any]], computers: int, limit: int | None = None) -> None:
+    what_if = any("what_if_members" in row for row in rows)
+    if what_if:
+        rows = [row for row in rows if row["flag"] == "new" or row["what_if_members"] != row["predicted_members"]]
+    header = f"{'Group':<40}  {'Crit':>4}  {'Predicted':>9}  {'%':>7}  {'Jamf':>6}"
+    if what_if:
+        header += f"  {'What-if':>7}"
+    print(header + "  Flag")
+    print("-" * (len(header) + 14))
+
+    def number(value: Any) -> str:
+        return "-" if value is None else str(value)
+
+    for row in rows[:limit] if limit else rows:
+        percent = "-" if row["predicted_percent"] is None else f"{row['predicted_percent']:.2f}%"
+        line = (
+            f"{row['name'][:40]:<40}  {row['criteria']:>4}  {number(row['predicted_members']):>9}"
+            f"  {percent:>7}  {number(row['jamf_members']):>6}"
+        )
+        if what_if:
+            line += f"  {number(row['what_if_members']):>7}"
+        flag = row["what_if_flag"] if what_if else row["reason"] or row["flag"]
+        print(f"{line}  {flag}".rstrip())
+    print()
+    print(f"Computers in snapshot: {computers}")
+    if what_if:
+        print(f"Smart groups changed by the what-if criteria: {len(rows)}")
+    else:
+        evaluated = sum(1 for row in rows if row["predicted_members"] is not None)
+        print(f"Smart groups evaluated: {evaluated} of {len(rows)}")
+
+
+def load_what_if(path: str) -> dict[str, list[Criterion]]:
+    """{"Group name": [{"name": ..., "search_type": ..., "value": ..., "and_or": ...}, ...]}"""
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    return {name: [Criterion(**criterion) for criterion in criteria] for name, criteria in data.items()}
+
+
+def evaluate_snapshot_file(path: str, what_if_path: str | None, json_out: str | None, limit: int | None) -> int:
+    try:
+        snapshot = InventorySnapshot.load(path)
+        what_if = load_what_if(what_if_path) if what_if_path else None
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        print(f"Error: cannot load snapshot: {exc}", file=sys.stderr)
+        return 2
+    rows = evaluate_snapshot(snapshot, what_if)
+    print_group_predictions(rows, len(snapshot.computer_ids), limit)
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as fh:
+            json.dump(
+                {"snapshot": path, "snapshot_generated_at": snapshot.generated_at,
+                 "computers": len(snapshot.computer_ids), "groups": rows},
+                fh,
+                indent=2,
+            )
+        print(f"Wrote JSON report to {json_out}")
+    return 0
+
+
+# Known-expensive commands in EA scripts: (name, pattern, estimated seconds per run).
+# Rough wall-clock costs on a typical Mac; good enough to rank, not to predict.
+SCRIPT_COST_PATTERNS: list[tuple[str, re.Pattern[str], float]] = [
+    ("system_profiler (full or slow data type)", re.compile(
+        r"\bsystem_profiler\b(?![^\n|;]*\bSP(?!Applications|InstallHistory|Fonts|Frameworks|Extensions|Logs)\w+DataType)"), 20.0),
+    ("system_profiler", re.compile(r"\bsystem_profiler\b[^\n|;]*\bSP\w+DataType"), 2.0),
+    ("recursive find from /", re.compile(r"\bfind\s+(?:-[HLPEX]\s+)*/(?:\s|$)(?![^\n|;]*-maxdepth)"), 60.0),
+    ("recursive find", re.compile(r"\bfind\s+(?:-[HLPEX]\s+)*[\"']?/(?:Users|Applications|Library|System|private|opt|usr)\b(?![^\n|;]*-maxdepth)"), 5.0),
+    ("du over a tree", re.compile(r"\bdu\s+-[a-zA-Z]*[sh]"), 10.0),
+    ("mdfind", re.compile(r"\bmdfind\b"), 1.0),
+    ("softwareupdate -l", re.compile(r"\bsoftwareupdate\s+(?:[^\n|;]*\s)?(?:-l|--list)\b"), 30.0),
+    ("network call", re.compile(r"\b(?:curl|wget|nc|nslookup|dig|host|ping|ssh|scp|ldapsearch)\b\s"), 2.0),
+    ("log show", re.compile(r"\blog\s+show\b"), 10.0),
+    ("pkgutil listing", re.compile(r"\bpkgutil\s+--(?:pkgs|files|pkg-info)"), 1.0),
+    ("profiles query", re.compile(r"\bprofiles\s+(?:status|show|list)\b"), 0.5),
+    ("diskutil", re.compile(r"\bdiskutil\b"), 0.3),
+    ("osascript", re.compile(r"\bosascript\b"), 0.3),
+    ("directory service lookup", re.compile(r"\b(?:dscl|dseditgroup|sysadminctl)\b"), 0.05),
+]
+SLEEP_PATTERN = re.compile(r"\bsleep\s+(\d+(?:\.\d+)?)")
+LOOP_OPEN = re.compile(r"^\s*(?:for|while|until)\b")
+LOOP_CLOSE = re.compile(r"^\s*done\b")
+LOOP_ONE_LINE = re.compile(r"[;&|]\s*done\b")  # for x in a b; do ...; done
+LOOP_FACTOR = 5          # assumed iterations for a command inside a loop
+BASE_RUN_SECONDS = 0.05  # interpreter start-up
+
+
+@dataclass
+class ScriptCost:
+    seconds: float = 0.0
+    findings: list[str] = field(default_factory=list)
+
+
+def analyze_script_cost(script: str) -> ScriptCost:
+    """Estimate one run of an EA script from the expensive commands it contains.
+
+    Whole-line comments are ignored; commands inside a for/while/until loop
+    count LOOP_FACTOR times. ``sleep N`` adds N seconds. Shell loops close at
+    ``done`` (a one-line loop never opens); Python loops close at the next line
+    indented no deeper than their header.
+    """
+    cost = ScriptCost(seconds=BASE_RUN_SECONDS if script.strip() else 0.0)
+    loops: list[int | None] = []  # open loops: None for shell, header indent for Python
+    for line in script.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        while loops and loops[-1] is not None and indent <= loops[-1]:
+            loops.pop()
+        depth = len(loops)
+        factor = LOOP_FACTOR if depth else 1  # a loop header itself runs once
+        for name, pattern, seconds in SCRIPT_COST_PATTERNS:
+            if pattern.search(line):
+                cost.seconds += seconds * factor
+                cost.findings.append(f"{name} (in loop)" if depth else name)
+                break
+        for match in SLEEP_PATTERN.finditer(line):
+            cost.seconds += float(match.group(1)) * factor
+            cost.findings.append(f"sleep {match.group(1)}" + (" (in loop)" if depth else ""))
+        if LOOP_OPEN.match(line) and not LOOP_ONE_LINE.search(line):
+            loops.append(indent if line.rstrip().endswith(":") else None)
+        elif LOOP_CLOSE.match(line) and None in loops:
+            del loops[len(loops) - 1 - loops[::-1].index(None)]
+    cost.seconds = round(cost.seconds, 2)
+    return cost
+
+
+def fetch_extension_attribute_script(client: JamfClient, ea_id: int) -> tuple[str, bool]:
+    """(script body, enabled) from a Classic EA detail; empty body for non-script input types."""
+    root = client.get_classic_xml(f"/JSSResource/computerextensionattributes/id/{ea_id}")
+    enabled = text_or_empty(root, "enabled").lower() != "false"
+    return text_or_empty(root, "input_type/script"), enabled
+
+
+def fetch_fleet_size(client: JamfClient) -> int:
+    root = client.get_classic_xml("/JSSResource/computers")
+    size = text_or_empty(root, "size")
+    return int(size) if size.isdigit() else len(root.findall("./computer"))
+
+
+def merge_script_costs(
+    rows: list[dict[str, Any]],
+    scripts: dict[int, tuple[str, bool] | JamfApiError],
+    fleet_size: int,
+) -> None:
+    """Add per-run cost, fleet cost per inventory cycle and a usage-weighted score to each row.
+
+    cost_score = seconds per run × fleet size × (1 + smart groups using the EA):
+    an expensive EA that also drives many groups is the riskiest to leave slow.
+    """
+    for row in rows:
+        script = scripts.get(row["id"])
+        if isinstance(script, JamfApiError):
+            cost, enabled = ScriptCost(findings=[f"error: {script}"]), True
+        elif script is None:
+            cost, enabled = ScriptCost(), True
+        else:
+            cost, enabled = analyze_script_cost(script[0]), script[1]
+        fleet_seconds = cost.seconds * fleet_size if enabled else 0.0
+        row["script_seconds"] = cost.seconds
+        row["script_findings"] = cost.findings
+        row["script_enabled"] = enabled
+        row["fleet_hours_per_inventory"] = round(fleet_seconds / 3600, 2)
+        row["cost_score"] = round(fleet_seconds * (1 + row["smart_group_count"]), 1)
+
+
+def print_script_costs(rows: list[dict[str, Any]], fleet_size: int, limit: int = 10) -> None:
+    costly = sorted(
+        (row for row in rows if row.get("script_seconds")),
+        key=lambda row: (-row["cost_score"], row["name"].lower()),
+    )[:limit]
+    print()
+    print(f"Most expensive EA scripts (fleet size {fleet_size}, score = s/run x fleet x (1 + smart groups))")
+    for row in costly:
+        findings = ", ".join(dict.fromkeys(row["script_findings"])) or "baseline"
+        if not row["script_enabled"]:
+            findings += "; EA disabled"
+        print(
+            f"  {row['name'][:30]:<30}  {row['script_seconds']:>7g} s/run  "
+            f"{row['fleet_hours_per_inventory']:>7g} fleet h  score {row['cost_score']:g}  [{findings}]"
+        )
+    if not costly:
+        print("  (no script-based EAs)")
+
+
+def analyze_script_paths(paths: list[str]) -> int:
+    """Offline: estimate run cost for local EA scripts (files or directories of *.sh/*.zsh/*.py)."""
+    files: list[Path] = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.suffix in (".sh", ".zsh", ".py") and p.is_file()))
+        elif path.is_file():
+            files.append(path)
+        else:
+            print(f"Not found: {raw}", file=sys.stderr)
+            return 2
+    costs = [(analyze_script_cost(f.read_text(encoding="utf-8", errors="replace")), f) for f in files]
+    for cost, f in sorted(costs, key=lambda item: (-item[0].seconds, str(item[1]))):
+        print(f"{cost.seconds:>8g} s  {f}  [{', '.join(dict.fromkeys(cost.findings)) or 'baseline'}]")
+    return 0
+
+
+# Relative cost of one smart-group criterion by operator, as Jamf turns it into SQL:
+# equality is an indexed lookup, like/has a substring scan, regex the slowest;
+# numeric and date comparisons sit in between. Unknown operators count as a scan.
+OPERATOR_COST: dict[str, float] = {
+    "is": 1.0,
+    "is not": 1.0,
+    "member of": 1.0,
+    "not member of": 1.5,
+    "greater than": 1.5,
+    "less than": 1.5,
+    "greater than or equal": 1.5,
+    "less than or equal": 1.5,
+    "more than x days ago": 1.5,
+    "less than x days ago": 1.5,
+    "before (yyyy-mm-dd)": 1.5,
+    "after (yyyy-mm-dd)": 1.5,
+    "like": 3.0,
+    "not like": 3.0,
+    "has": 3.0,
+    "does not have": 3.0,
+    "matches regex": 5.0,
+    "does not match regex": 5.0,
+}
+SCAN_OPERATOR_COST = 3.0
+EA_CRITERION_FACTOR = 2.0  # EA values live in their own value table: an extra join per criterion
+DEPTH_FACTOR = 0.25        # each nesting level adds a quarter: Jamf re-resolves the chain on every change
+
+
+def smart_group_costs(smart_groups: list[SmartGroup], ea_names: set[str]) -> list[dict[str, Any]]:
+    """Static evaluation-cost estimate per smart group, most expensive first.
+
+    cost = sum of criterion costs (operator cost, x EA_CRITERION_FACTOR for EA
+    criteria) plus the cost of every nested group it pulls in, scaled by
+    (1 + DEPTH_FACTOR x nesting depth). When Jamf reported a member count,
+    weighted_cost multiplies by 1 + log10(1 + members), so a big group ranks
+    above an equally complex empty one without drowning out complexity.
+    """
+    groups = {group.name: group for group in smart_groups if not group.error}
+    memo: dict[str, tuple[float, int]] = {}
+    active: set[str] = set()
+
+    def resolve(name: str) -> tuple[float, int]:
+        """(criteria cost including nested groups, nesting depth)."""
+        if name in memo:
+            return memo[name]
+        group = groups.get(name)
+        if group is None or name in active:
+            return 0.0, 0  # static group (plain membership lookup) or circular nesting
+        active.add(name)
+        cost, depth = 0.0, 0
+        for criterion in group.criteria:
+            cost += OPERATOR_COST.get(criterion.search_type.lower(), SCAN_OPERATOR_COST) * (
+                EA_CRITERION_FACTOR if criterion.name in ea_names else 1.0
+            )
+            if criterion.name.lower() in GROUP_CRITERIA:
+                nested_cost, nested_depth = resolve(criterion.value)
+                cost += nested_cost
+                depth = max(depth, nested_depth + 1)
+        active.discard(name)
+        memo[name] = cost, depth
+        return memo[name]
+
+    rows = []
+    for group in groups.values():
+        cost, depth = resolve(group.name)
+        cost *= 1 + DEPTH_FACTOR * depth
+        weight = 1 + math.log10(1 + group.member_count) if group.member_count is not None else 1.0
+        operators = [criterion.search_type.lower() for criterion in group.criteria]
+        rows.append({
+            "id": group.id,
+            "name": group.name,
+            "criteria": len(group.criteria),
+            "ea_criteria": sum(1 for criterion in group.criteria if criterion.name in ea_names),
+            "scan_operators": sum(1 for op in operators if OPERATOR_COST.get(op, SCAN_OPERATOR_COST) >= SCAN_OPERATOR_COST),
+            "nesting_depth": depth,
+            "members": group.member_count,
+            "cost": round(cost, 2),
+            "weighted_cost": round(cost * weight, 2),
+        })
+    return sorted(rows, key=lambda row: (-row["weighted_cost"], -row["cost"], row["name"].lower()))
+
+
+def print_group_costs(rows: list[dict[str, Any]], limit: int = 10) -> None:
+    print()
+    print("Most expensive smart groups to evaluate (criteria cost x nesting, weighted by membership)")
+    for row in rows[:limit]:
+        members = "?" if row["members"] is None else row["members"]
+        print(
+            f"  {row['name'][:30]:<30}  weighted {row['weighted_cost']:>7g}  cost {row['cost']:>6g}  "
+            f"[{row['criteria']} criteria, {row['ea_criteria']} EA, {row['scan_operators']} like/regex, "
+            f"depth {row['nesting_depth']}, {members} members]"
+        )
+    if not rows:
+        print("  (no smart groups)")
+
+
+class DependencyClosure:
+    """Downstream objects of each smart group: nesting groups, then policies/profiles scoped to them.
+
+    closure(group) = direct dependents at depth 1, plus each dependent group's
+    own closure one level deeper. Results are memoized per group, so every
+    group is expanded once however many EAs or parents reach it, keeping the
+    whole analysis close to linear in groups + edges.
+    """
+
+    def __init__(self, smart_groups: list[SmartGroup], scoped: list[ScopedObject]) -> None:
+        by_name = {group.name: group.id for group in smart_groups}
+        self.dependents: dict[int, list[tuple[str, int, str, str]]] = {}
+        for group in smart_groups:
+            for parent_name in group.parent_group_names:
+                parent_id = by_name.get(parent_name)
+                if parent_id is not None and parent_id != group.id:
+                    self.dependents.setdefault(parent_id, []).append(("group", group.id, group.name, "criteria"))
+        for obj in scoped:
+            for group_id in obj.target_group_ids:
+                self.dependents.setdefault(group_id, []).append((obj.kind, obj.id, obj.name, "target"))
+            for group_id in obj.excluded_group_ids:
+                self.dependents.setdefault(group_id, []).append((obj.kind, obj.id, obj.name, "exclusion"))
+        self._memo: dict[int, dict[tuple[str, int], tuple[int, str, str]]] = {}
+        self._active: set[int] = set()
+
+    def closure(self, group_id: int) -> dict[tuple[str, int], tuple[int, str, str]]:
+        """(kind, id) -> (depth, name, role) of everything downstream of one group."""
+        if group_id in self._memo:
+            return self._memo[group_id]
+        if group_id in self._active:
+            return {}  # circular nesting: Jamf rejects it, but never loop on bad data
+        self._active.add(group_id)
+        result: dict[tuple[str, int], tuple[int, str, str]] = {}
+        for kind, oid, name, role in self.dependents.get(group_id, []):
+            self._merge(result, (kind, oid), (1, name, role))
+            if kind == "group":
+                for key, (depth, sub_name, sub_role) in self.closure(oid).items():
+                    self._merge(result, key, (depth + 1, sub_name, sub_role))
+        self._active.discard(group_id)
+        self._memo[group_id] = result
+        return result
+
+    @staticmethod
+    def _merge(result: dict[tuple[str, int], tuple[int, str, str]], key: tuple[str, int], value: tuple[int, str, str]) -> None:
+        if key not in result or value[0] < result[key][0]:
+            result[key] = value
+
+
+def blast_radius(group_ids: list[int], closure: DependencyClosure, groups: dict[int, str]) -> list[dict[str, Any]]:
+    """Everything downstream of an EA that is used directly by ``group_ids`` (depth 1 = those groups)."""
+    merged: dict[tuple[str, int], tuple[int, str, str]] = {}
+    for group_id in group_ids:
+        DependencyClosure._merge(merged, ("group", group_id), (1, groups[group_id], "criteria"))
+        for key, (depth, name, role) in closure.closure(group_id).items():
+            DependencyClosure._merge(merged, key, (depth + 1, name, role))
+    return [
+        {"type": kind, "id": oid, "name": name, "depth": depth, "via": role}
+        for (kind, oid), (depth, name, role) in sorted(merged.items(), key=lambda item: (item[1][0], item[0]))
+    ]
 
 
 def analyze_usage(
     extension_attributes: list[ExtensionAttribute],
     smart_groups: list[SmartGroup],
+    scoped: list[ScopedObject] | None = None,
+    searches: list[AdvancedSearch] | None = None,
 ) -> list[dict[str, Any]]:
     usage: dict[int, dict[str, Any]] = {
         ea.id: {
@@ -232,10 +1511,12 @@ def analyze_usage(
             "smart_group_count": 0,
             "criteria_hits": 0,
             "smart_group_names": [],
+            "smart_group_ids": [],
         }
         for ea in extension_attributes
     }
     ea_name_to_id = {ea.name: ea.id for ea in extension_attributes}
+    smart_groups = [group for group in smart_groups if not group.error]
 
     for group in smart_groups:
         matched_ids: set[int] = set()
@@ -248,6 +1529,7 @@ def analyze_usage(
         for ea_id in matched_ids:
             usage[ea_id]["smart_group_count"] += 1
             usage[ea_id]["smart_group_names"].append(group.name)
+            usage[ea_id]["smart_group_ids"].append(group.id)
 
     total_groups = len(smart_groups)
     rows = list(usage.values())
@@ -259,18 +1541,132 @@ def analyze_usage(
         else:
             row["coverage_percent"] = 0.0
 
+    if searches is not None:
+        for row in rows:
+            row.update(advanced_search_count=0, search_criteria_hits=0, search_display_hits=0, advanced_search_names=[])
+        for search in searches:
+            if search.error:
+                continue
+            matched_ids: set[int] = set()
+            for criterion in search.criteria:
+                if criterion.name in ea_name_to_id:
+                    usage[ea_name_to_id[criterion.name]]["search_criteria_hits"] += 1
+                    matched_ids.add(ea_name_to_id[criterion.name])
+            for field_name in search.display_fields:
+                if field_name in ea_name_to_id:
+                    usage[ea_name_to_id[field_name]]["search_display_hits"] += 1
+                    matched_ids.add(ea_name_to_id[field_name])
+            for ea_id in matched_ids:
+                usage[ea_id]["advanced_search_count"] += 1
+                usage[ea_id]["advanced_search_names"].append(search.name)
+
+    if scoped is not None:
+        closure = DependencyClosure(smart_groups, [obj for obj in scoped if not obj.error])
+        group_names = {group.id: group.name for group in smart_groups}
+        for row in rows:
+            downstream = blast_radius(row["smart_group_ids"], closure, group_names)
+            row["blast_radius"] = downstream
+            row["nested_groups"] = sum(1 for item in downstream if item["type"] == "group" and item["depth"] > 1)
+            row["downstream_policies"] = sum(1 for item in downstream if item["type"] == "policy")
+            row["downstream_profiles"] = sum(1 for item in downstream if item["type"] == "profile")
+            row["max_depth"] = max((item["depth"] for item in downstream), default=0)
+
     return sorted(
         rows,
         key=lambda row: (
-            row["smart_group_count"],
-            row["criteria_hits"],
+            row["smart_group_count"] + row.get("advanced_search_count", 0),
+            row["criteria_hits"] + row.get("search_criteria_hits", 0) + row.get("search_display_hits", 0),
             row["name"].lower(),
         ),
         reverse=True,
     )
 
 
-def print_table(rows: list[dict[str, Any]], total_groups: int, limit: int | None = None) -> None:
+EXPENSIVE_SCRIPT_SECONDS = 5.0
+
+
+def expensive_ea_reason(row: dict[str, Any]) -> str:
+    """Why an EA is costly to collect (needs --script-cost and/or --inventory-scan data), or ''."""
+    reasons = []
+    if row.get("script_enabled", True) and row.get("script_seconds", 0) >= EXPENSIVE_SCRIPT_SECONDS:
+        reasons.append(f"{row['script_seconds']:g} s/run script")
+    if "large" in row.get("population_flag", ""):
+        reasons.append(f"p95 value {row['value_bytes_p95']} B")
+    return ", ".join(reasons)
+
+
+def advanced_search_rows(searches: list[AdvancedSearch], rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Searches that reference EAs, those touching expensive EAs first, then by result count."""
+    by_name = {row["name"]: row for row in rows}
+    results = []
+    for search in searches:
+        if search.error:
+            continue
+        criteria_eas = sorted({criterion.name for criterion in search.criteria if criterion.name in by_name})
+        display_eas = sorted({name for name in search.display_fields if name in by_name})
+        if not criteria_eas and not display_eas:
+            continue
+        expensive = [
+            {"name": name, "reason": reason}
+            for name in sorted(set(criteria_eas) | set(display_eas))
+            if (reason := expensive_ea_reason(by_name[name]))
+        ]
+        results.append({
+            "id": search.id,
+            "name": search.name,
+            "criteria_eas": criteria_eas,
+            "display_eas": display_eas,
+            "result_count": search.result_count,
+            "expensive_eas": expensive,
+        })
+    return sorted(results, key=lambda row: (-len(row["expensive_eas"]), -(row["result_count"] or 0), row["name"].lower()))
+
+
+def print_advanced_searches(section: dict[str, Any], limit: int = 10) -> None:
+    print()
+    print(
+        f"Advanced searches: {section['searches_scanned']} scanned, {len(section['searches'])} reference EAs, "
+        f"{section['searches_with_expensive_eas']} use expensive EAs"
+    )
+    for search in section["searches"][:limit]:
+        if not search["expensive_eas"]:
+            break
+        results = "" if search["result_count"] is None else f"{search['result_count']} results  "
+        expensive = "; ".join(f"{item['name']} ({item['reason']})" for item in search["expensive_eas"])
+        print(f"  ! {search['name'][:40]:<40}  {results}[{expensive}]")
+    for error in section["search_errors"]:
+        print(f"  ERROR {error['id']:>6}  {error['name']}: {error['error']}")
+
+
+def error_rows(smart_groups: list[SmartGroup]) -> list[dict[str, Any]]:
+    return [
+        {"id": group.id, "name": group.name, "error": group.error}
+        for group in smart_groups
+        if group.error
+    ]
+
+
+# Optional table columns, shown when the rows carry the key: (key, header, width, format)
+OPTIONAL_COLUMNS: list[tuple[str, str, int, str]] = [
+    ("fill_rate_percent", "Fill", 7, "{:.1f}%"),
+    ("distinct_values", "Distinct", 8, "{}"),
+    ("value_bytes_p95", "p95 B", 7, "{}"),
+    ("population_flag", "Flag", 14, "{}"),
+    ("advanced_search_count", "Searches", 8, "{}"),
+    ("nested_groups", "Nested", 6, "{}"),
+    ("downstream_policies", "Policies", 8, "{}"),
+    ("downstream_profiles", "Profiles", 8, "{}"),
+    ("script_seconds", "Est s/run", 9, "{:g}"),
+    ("fleet_hours_per_inventory", "Fleet h", 8, "{:g}"),
+]
+
+
+def print_table(
+    rows: list[dict[str, Any]],
+    total_groups: int,
+    limit: int | None = None,
+    errors: list[dict[str, Any]] | None = None,
+) -> None:
     display_rows = rows if limit is None else rows[:limit]
     headers = [
         "Rank",
@@ -280,13 +1676,16 @@ def print_table(rows: list[dict[str, Any]], total_groups: int, limit: int | None
         "Coverage",
     ]
     widths = [4, 30, 12, 13, 8]
+    extra = [column for column in OPTIONAL_COLUMNS if rows and column[0] in rows[0]]
     print(
         f"{headers[0]:<{widths[0]}}  {headers[1]:<{widths[1]}}  "
         f"{headers[2]:>{widths[2]}}  {headers[3]:>{widths[3]}}  {headers[4]:>{widths[4]}}"
+        + "".join(f"  {header:>{width}}" for _, header, width, _ in extra)
     )
     print(
         f"{'-' * widths[0]}  {'-' * widths[1]}  "
         f"{'-' * widths[2]}  {'-' * widths[3]}  {'-' * widths[4]}"
+        + "".join(f"  {'-' * width}" for _, _, width, _ in extra)
     )
     for idx, row in enumerate(display_rows, start=1):
         print(
@@ -295,80 +1694,295 @@ def print_table(rows: list[dict[str, Any]], total_groups: int, limit: int | None
             f"{row['smart_group_count']:>{widths[2]}}  "
             f"{row['criteria_hits']:>{widths[3]}}  "
             f"{row['coverage_percent']:>{widths[4]}.2f}%"
+            + "".join(f"  {fmt.format(row[key]):>{width}}" for key, _, width, fmt in extra)
         )
     print()
     print(f"Total extension attributes: {len(rows)}")
     print(f"Total smart groups scanned: {total_groups}")
+    if errors:
+        print(f"Smart groups that could not be read: {len(errors)}")
+        for error in errors:
+            print(f"  ERROR  {error['id']:>6}  {error['name']}: {error['error']}")
 
 
-def write_json(path: str, rows: list[dict[str, Any]], total_groups: int) -> None:
+def write_json(
+    path: str,
+    rows: list[dict[str, Any]],
+    total_groups: int,
+    errors: list[dict[str, Any]] | None = None,
+    sections: dict[str, Any] | None = None,
+) -> None:
     payload = {
         "generated_at": datetime.now(timezone.utc).isoformat(),
         "total_extension_attributes": len(rows),
         "total_smart_groups": total_groups,
         "rows": rows,
+        "smart_group_errors": errors or [],
+        **(sections or {}),
     }
     with open(path, "w", encoding="utf-8") as handle:
         json.dump(payload, handle, indent=2)
 
 
-def write_html(path: str, rows: list[dict[str, Any]], total_groups: int) -> None:
-    max_groups = max((row["smart_group_count"] for row in rows), default=0)
-    html: list[str] = [
+HTML_PAGE_SIZE = 100
+DEFAULT_HTML_MAX_BYTES = 5_000_000
+# per-row lists that can grow without bound; inlined only while the page stays under budget
+HTML_DETAIL_KEYS = ("smart_group_names", "advanced_search_names", "blast_radius", "script_findings")
+
+HTML_STYLE = """
+body { font-family: -apple-system, BlinkMacSystemFont, sans-serif; margin: 2rem; background: #f5f7fb; color: #162033; }
+.wrap { max-width: 1100px; margin: 0 auto; }
+.card { background: white; border-radius: 14px; padding: 1.25rem 1.5rem; box-shadow: 0 10px 30px rgba(17, 24, 39, 0.08); margin-bottom: 1rem; }
+h1, h2 { margin: 0 0 0.75rem 0; }
+.meta { display: flex; gap: 1rem; flex-wrap: wrap; color: #51607a; font-size: 0.95rem; margin-bottom: 1rem; }
+table { width: 100%; border-collapse: collapse; }
+th, td { text-align: left; padding: 0.65rem 0.5rem; border-bottom: 1px solid #e5eaf3; vertical-align: top; }
+th { color: #3b4a66; font-size: 0.9rem; letter-spacing: 0.02em; }
+th[data-sort] { cursor: pointer; }
+.bar { width: 220px; height: 12px; border-radius: 999px; background: #e7edf7; overflow: hidden; }
+.bar span { display: block; height: 12px; background: linear-gradient(90deg, #2a6df4, #4f9cf9); border-radius: 999px; }
+.small { color: #6b7a93; font-size: 0.9rem; }
+.groups { color: #4a5872; font-size: 0.92rem; }
+.tools { display: flex; gap: 0.75rem; align-items: center; margin-bottom: 0.75rem; }
+.tools input { flex: 1; padding: 0.45rem 0.6rem; border: 1px solid #d5dcea; border-radius: 8px; }
+"""
+
+# Renders the embedded rows: r = [rank, id, name, type, coverage, ...columns, group preview, detail].
+# detail is an object, 0 (moved to the sidecar JSON) or null (nothing more to show).
+HTML_SCRIPT = """
+(function () {
+  const data = JSON.parse(document.getElementById('ea-data').textContent);
+  const cols = data.columns, rows = data.rows, first = 5, preview = first + cols.length;
+  const maxGroups = rows.reduce((m, r) => Math.max(m, r[first]), 0);
+  const tbody = document.getElementById('ea-rows'), pager = document.getElementById('ea-pager');
+  let view = rows, sortIndex = 0, sortDir = 1, page = 0;
+  function fmt(v, kind) {
+    if (v === null || v === undefined || v === '') return '\\u2014';
+    return kind === 'pct1' ? Number(v).toFixed(1) + '%' : String(v);
+  }
+  function cell(tr, text, cls) {
+    const td = document.createElement('td');
+    if (cls) td.className = cls;
+    if (text !== undefined) td.textContent = text;
+    tr.appendChild(td);
+    return td;
+  }
+  function line(parent, text, cls) {
+    const div = document.createElement('div');
+    div.className = cls || 'small';
+    div.textContent = text;
+    parent.appendChild(div);
+  }
+  function detail(td, d) {
+    if (d === 0) { line(td, 'More detail in ' + data.sidecar); return; }
+    if (!d) return;
+    const box = document.createElement('details'), summary = document.createElement('summary');
+    summary.textContent = 'Detail';
+    box.appendChild(summary);
+    if (d.smart_group_names) line(box, 'Groups: ' + d.smart_group_names.join(', '));
+    if (d.advanced_search_names) line(box, 'Advanced searches: ' + d.advanced_search_names.join(', '));
+    if (d.blast_radius) d.blast_radius.forEach(b => line(box, b.type + ' ' + b.name + ' (depth ' + b.depth + ', ' + b.via + ')'));
+    if (d.script_findings) line(box, 'Script: ' + d.script_findings.join(', '));
+    td.appendChild(box);
+  }
+  function render() {
+    const pages = Math.max(1, Math.ceil(view.length / data.pageSize));
+    page = Math.min(page, pages - 1);
+    tbody.replaceChildren();
+    for (const r of view.slice(page * data.pageSize, (page + 1) * data.pageSize)) {
+      const tr = document.createElement('tr');
+      cell(tr, r[0]);
+      const name = cell(tr), strong = document.createElement('strong');
+      strong.textContent = r[2];
+      name.appendChild(strong);
+      line(name, 'ID ' + r[1] + ' \\u00b7 ' + (r[3] || 'Unknown type'));
+      cols.forEach((c, i) => {
+        const td = cell(tr, fmt(r[first + i], c[2]));
+        if (i === 0) line(td, Number(r[4]).toFixed(2) + '% of smart groups');
+      });
+      const bar = cell(tr), outer = document.createElement('div'), inner = document.createElement('span');
+      outer.className = 'bar';
+      inner.style.width = (maxGroups ? Math.floor(r[first] / maxGroups * 100) : 0) + '%';
+      outer.appendChild(inner);
+      bar.appendChild(outer);
+      const groups = cell(tr, (r[preview].join(', ') + (r[first] > r[preview].length ? ', ...' : '')) || '\\u2014', 'groups');
+      detail(groups, r[preview + 1]);
+      tbody.appendChild(tr);
+    }
+    pager.textContent = view.length + ' of ' + rows.length + ' extension attributes \\u00b7 page ' + (page + 1) + ' of ' + pages;
+  }
+  function sort() {
+    view = view.slice().sort((a, b) => {
+      const x = a[sortIndex], y = b[sortIndex];
+      return (typeof x === 'string' ? x.localeCompare(y) : (x ?? -Infinity) - (y ?? -Infinity)) * sortDir;
+    });
+  }
+  document.getElementById('ea-filter').addEventListener('input', e => {
+    const q = e.target.value.toLowerCase();
+    view = rows.filter(r => (r[2] + '\\n' + r[preview].join('\\n')).toLowerCase().includes(q));
+    sort();
+    page = 0;
+    render();
+  });
+  document.querySelectorAll('th[data-sort]').forEach(th => th.addEventListener('click', () => {
+    const index = Number(th.dataset.sort);
+    sortDir = index === sortIndex ? -sortDir : (index === 0 || index === 2 ? 1 : -1);
+    sortIndex = index;
+    sort();
+    render();
+  }));
+  document.getElementById('ea-prev').addEventListener('click', () => { if (page > 0) { page--; render(); } });
+  document.getElementById('ea-next').addEventListener('click', () => { page++; render(); });
+  render();
+})();
+"""
+
+
+def _script_json(value: Any) -> str:
+    """Compact JSON that is safe inside a <script> element."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).replace("<", "\\u003c")
+
+
+def write_html(
+    path: str,
+    rows: list[dict[str, Any]],
+    total_groups: int,
+    errors: list[dict[str, Any]] | None = None,
+    sections: dict[str, Any] | None = None,
+    max_bytes: int = DEFAULT_HTML_MAX_BYTES,
+) -> str | None:
+    """Stream the HTML report: rows are written one by one as a single compact JSON array
+    that the page sorts, filters and paginates client-side.
+
+    Per-row detail (all group names, blast radius, script findings) is inlined while the
+    file stays under ``max_bytes``; after that it goes to ``<report>.detail.json`` next
+    to the page. Returns the sidecar path if one was written.
+    """
+    extra = [column for column in OPTIONAL_COLUMNS if rows and column[0] in rows[0]]
+    columns = [["smart_group_count", "Smart Groups", "text"], ["criteria_hits", "Criteria Hits", "text"]] + [
+        [key, header, "pct1" if fmt.endswith("%") else "text"] for key, header, _, fmt in extra
+    ]
+    meta = "".join(
+        f"<div>{escape(key.replace('_', ' ').title())}: {escape(str(value))}</div>"
+        for section in (sections or {}).values()
+        if isinstance(section, dict)
+        for key, value in section.items()
+        if not isinstance(value, (dict, list))
+    )
+    headers = "".join(f"<th data-sort='{5 + index}'>{escape(label)}</th>" for index, (_, label, _) in enumerate(columns))
+    sidecar_path = str(Path(path).with_suffix(".detail.json"))
+    head = "\n".join([
         "<!doctype html>",
         "<html lang='en'>",
         "<head>",
         "<meta charset='utf-8'>",
         "<meta name='viewport' content='width=device-width, initial-scale=1'>",
         "<title>Jamf Extension Attribute Usage Report</title>",
-        "<style>",
-        "body { font-family: -apple-system, BlinkMacSystemFont, sans-serif; margin: 2rem; background: #f5f7fb; color: #162033; }",
-        ".wrap { max-width: 1100px; margin: 0 auto; }",
-        ".card { background: white; border-radius: 14px; padding: 1.25rem 1.5rem; box-shadow: 0 10px 30px rgba(17, 24, 39, 0.08); margin-bottom: 1rem; }",
-        "h1, h2 { margin: 0 0 0.75rem 0; }",
-        ".meta { display: flex; gap: 1rem; flex-wrap: wrap; color: #51607a; font-size: 0.95rem; margin-bottom: 1rem; }",
-        "table { width: 100%; border-collapse: collapse; }",
-        "th, td { text-align: left; padding: 0.65rem 0.5rem; border-bottom: 1px solid #e5eaf3; vertical-align: top; }",
-        "th { color: #3b4a66; font-size: 0.9rem; letter-spacing: 0.02em; }",
-        ".bar { width: 220px; height: 12px; border-radius: 999px; background: #e7edf7; overflow: hidden; }",
-        ".bar span { display: block; height: 12px; background: linear-gradient(90deg, #2a6df4, #4f9cf9); border-radius: 999px; }",
-        ".small { color: #6b7a93; font-size: 0.9rem; }",
-        ".groups { color: #4a5872; font-size: 0.92rem; }",
-        "</style>",
+        f"<style>{HTML_STYLE}</style>",
         "</head>",
         "<body>",
         "<div class='wrap'>",
         "<div class='card'>",
         "<h1>Jamf Extension Attribute Usage Report</h1>",
-        f"<div class='meta'><div>Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</div><div>Extension Attributes: {len(rows)}</div><div>Smart Groups: {total_groups}</div></div>",
+        f"<div class='meta'><div>Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</div>"
+        f"<div>Extension Attributes: {len(rows)}</div><div>Smart Groups: {total_groups}</div>{meta}</div>",
         "<p class='small'>Read-only ranking of computer extension attributes by unique smart-group references.</p>",
         "</div>",
         "<div class='card'>",
+        "<div class='tools'><input id='ea-filter' type='search' placeholder='Filter by EA or group name'>"
+        "<button id='ea-prev'>&larr;</button><span id='ea-pager' class='small'></span><button id='ea-next'>&rarr;</button></div>",
         "<table>",
-        "<thead><tr><th>Rank</th><th>Name</th><th>Smart Groups</th><th>Criteria Hits</th><th>Visual</th><th>Groups</th></tr></thead>",
-        "<tbody>",
-    ]
+        f"<thead><tr><th data-sort='0'>Rank</th><th data-sort='2'>Name</th>{headers}<th>Visual</th><th>Groups</th></tr></thead>",
+        "<tbody id='ea-rows'></tbody>",
+        "</table>",
+        "</div>",
+    ])
 
-    for idx, row in enumerate(rows, start=1):
-        bar_width = 0 if max_groups == 0 else int((row["smart_group_count"] / max_groups) * 100)
-        group_names = ", ".join(row["smart_group_names"][:8])
-        if len(row["smart_group_names"]) > 8:
-            group_names += ", ..."
-        html.append(
-            "<tr>"
-            f"<td>{idx}</td>"
-            f"<td><strong>{row['name']}</strong><div class='small'>ID {row['id']} · {row['data_type'] or 'Unknown type'}</div></td>"
-            f"<td>{row['smart_group_count']}<div class='small'>{row['coverage_percent']:.2f}% of smart groups</div></td>"
-            f"<td>{row['criteria_hits']}</td>"
-            f"<td><div class='bar'><span style='width:{bar_width}%;'></span></div></td>"
-            f"<td class='groups'>{group_names or '&mdash;'}</td>"
-            "</tr>"
+    tail: list[str] = []
+    if sections and "group_cost" in sections:
+        tail.append("<div class='card'><h2>Most expensive smart groups to evaluate</h2><table>")
+        tail.append(
+            "<thead><tr><th>Group</th><th>Weighted cost</th><th>Cost</th><th>Criteria</th>"
+            "<th>EA criteria</th><th>Like/regex</th><th>Depth</th><th>Members</th></tr></thead><tbody>"
+        )
+        tail.extend(
+            f"<tr><td>{escape(group['name'])}</td><td>{group['weighted_cost']:g}</td><td>{group['cost']:g}</td>"
+            f"<td>{group['criteria']}</td><td>{group['ea_criteria']}</td><td>{group['scan_operators']}</td>"
+            f"<td>{group['nesting_depth']}</td><td>{'&mdash;' if group['members'] is None else group['members']}</td></tr>"
+            for group in sections["group_cost"]["groups"][:25]
+        )
+        tail.append("</tbody></table></div>")
+    if sections and "advanced_searches" in sections:
+        tail.append("<div class='card'><h2>Advanced searches referencing EAs</h2><table>")
+        tail.append("<thead><tr><th>Search</th><th>Results</th><th>EA criteria</th><th>EA display fields</th><th>Expensive EAs</th></tr></thead><tbody>")
+        tail.extend(
+            f"<tr><td>{'&#9888; ' if search['expensive_eas'] else ''}{escape(search['name'])}</td>"
+            f"<td>{'&mdash;' if search['result_count'] is None else search['result_count']}</td>"
+            f"<td class='groups'>{escape(', '.join(search['criteria_eas'])) or '&mdash;'}</td>"
+            f"<td class='groups'>{escape(', '.join(search['display_eas'])) or '&mdash;'}</td>"
+            f"<td class='groups'>{escape('; '.join(item['name'] + ' (' + item['reason'] + ')' for item in search['expensive_eas'])) or '&mdash;'}</td></tr>"
+            for search in sections["advanced_searches"]["searches"][:100]
         )
+        tail.append("</tbody></table></div>")
+    if errors:
+        tail.append("<div class='card'><h2>Smart groups that could not be read</h2><ul>")
+        tail.extend(
+            f"<li>{escape(error['name'])} (ID {error['id']}): <span class='small'>{escape(error['error'])}</span></li>"
+            for error in errors
+        )
+        tail.append("</ul></div>")
+    tail.extend(["</div>", f"<script>{HTML_SCRIPT}</script>", "</body>", "</html>"])
+    tail_text = "\n".join(tail)
 
-    html.extend(["</tbody>", "</table>", "</div>", "</div>", "</body>", "</html>"])
+    written = 0
+    sidecar = None
+    with ExitStack() as stack:
+        handle = stack.enter_context(open(path, "w", encoding="utf-8"))
 
-    with open(path, "w", encoding="utf-8") as handle:
-        handle.write("\n".join(html))
+        def emit(text: str) -> None:
+            nonlocal written
+            handle.write(text)
+            written += len(text.encode("utf-8"))
+
+        emit(head)
+        emit(
+            "\n<script type='application/json' id='ea-data'>"
+            + _script_json({"columns": columns, "pageSize": HTML_PAGE_SIZE, "sidecar": Path(sidecar_path).name})[:-1]
+            + ',"rows":['
+        )
+        def core_of(index: int, row: dict[str, Any]) -> str:
+            """The always-inlined part of a row, as an unterminated JSON array."""
+            return ("," if index else "") + _script_json(
+                [index + 1, row["id"], row["name"], row["data_type"], row["coverage_percent"]]
+                + [row.get(key) for key, _, _ in columns]
+                + [row["smart_group_names"][:8]]
+            )[:-1] + ","
+
+        # sized up front (and discarded) so detail is only inlined into space the rows will not need
+        remaining = sum(len(core_of(index, row).encode("utf-8")) + len("0]") for index, row in enumerate(rows))
+        reserve = len(tail_text.encode("utf-8")) + len("]}</script>\n")
+        for index, row in enumerate(rows):
+            core = core_of(index, row)
+            core_bytes = len(core.encode("utf-8"))
+            remaining -= core_bytes + len("0]")
+            details = {key: row[key] for key in HTML_DETAIL_KEYS if row.get(key) and (
+                key != "smart_group_names" or len(row[key]) > 8
+            )}
+            detail = _script_json(details) if details else "null"
+            if details and written + core_bytes + len(detail.encode("utf-8")) + 1 + remaining + reserve > max_bytes:
+                if sidecar is None:
+                    sidecar = stack.enter_context(open(sidecar_path, "w", encoding="utf-8"))
+                    sidecar.write('{"report":' + json.dumps(Path(path).name) + ',"rows":{')
+                else:
+                    sidecar.write(",")
+                sidecar.write(json.dumps(str(row["id"])) + ":" + json.dumps(details, separators=(",", ":")))
+                detail = "0"
+            emit(core + detail + "]")
+        emit("]}</script>\n")
+        emit(tail_text)
+        if sidecar is not None:
+            sidecar.write("}}")
+    return sidecar_path if sidecar is not None else None
 
 
 def run_self_test() -> int:
@@ -419,16 +2033,361 @@ def run_self_test() -> int:
             SmartGroup(
                 id=int(text_or_empty(node, "id")),
                 name=text_or_empty(node, "name"),
-                criteria_names=[
-                    text_or_empty(c, "name")
-                    for c in node.findall(".//criteria/criterion")
-                    if text_or_empty(c, "name")
-                ],
+                criteria=parse_criteria(node),
             )
         )
     rows = analyze_usage(eas, groups)
     print_table(rows, total_groups=len(groups))
-    return 0
+
+    class FlakyClient:
+        """Stands in for JamfClient: group 12 fails, the others resolve out of order."""
+
+        def get_classic_xml(self, path: str) -> ET.Element:
+            group_id = int(path.rsplit("/", 1)[1])
+            time.sleep(0.01 * (3 - group_id % 3))
+            if group_id == 12:
+                raise JamfApiError(f"GET failed for {path}: 500 Server Error")
+            return ET.fromstring(group_one_xml if group_id == 10 else group_two_xml)
+
+    fetched = fetch_smart_group_details(
+        FlakyClient(),  # type: ignore[arg-type]
+        [(10, "Needs Attention"), (12, "Broken"), (11, "Token Exceptions")],
+        workers=3,
+        progress=False,
+    )
+    failures = []
+    if [group.id for group in fetched] != [10, 12, 11]:
+        failures.append("parallel fetch must keep summary order")
+    if error_rows(fetched) != [{"id": 12, "name": "Broken", "error": "GET failed for /JSSResource/computergroups/id/12: 500 Server Error"}]:
+        failures.append("failed group must become an error row")
+    if analyze_usage(eas, fetched) != rows:
+        failures.append("error rows must not change the ranking")
+
+    class TokenSession:
+        """Stands in for requests.Session: tokens are numbered, the server revokes token 1 after 2 GETs."""
+
+        def __init__(self) -> None:
+            self.issued = 0
+            self.gets = 0
+
+        def mount(self, *_: Any) -> None:
+            pass
+
+        def post(self, *_: Any, **__: Any) -> requests.Response:
+            self.issued += 1
+            response = requests.Response()
+            response.status_code = 200
+            response._content = json.dumps({"access_token": f"t{self.issued}", "expires_in": 1200}).encode()
+            return response
+
+        def get(self, url: str, headers: dict[str, str], **_: Any) -> requests.Response:
+            self.gets += 1
+            response = requests.Response()
+            response.url = url
+            revoked = headers["Authorization"] == "Bearer t1" and self.gets > 2
+            response.status_code = 401 if revoked else 200
+            response._content = b"{}"
+            return response
+
+    token_client = JamfClient("https://jamf.example", client_id="id", client_secret="secret", max_retries=0)
+    token_client.session = TokenSession()  # type: ignore[assignment]
+    token_client.authenticate()
+    for _ in range(4):
+        token_client.get_json("/api/v1/computers-inventory")
+    if (token_client.token, token_client.token_refreshes) != ("t2", 2):
+        failures.append(f"a 401 must re-authenticate once: {token_client.token}, {token_client.token_refreshes}")
+    token_client.token_refresh_epoch = time.time() - 1
+    token_client.get_json("/api/v1/computers-inventory")
+    if token_client.token != "t3":
+        failures.append("a token past its refresh point must be renewed before the request")
+
+    counter = HyperLogLog()
+    for value in range(20000):
+        counter.add(f"serial-{value}")
+    if abs(counter.count() - 20000) > 20000 * 0.08:
+        failures.append(f"HyperLogLog estimate {counter.count()} too far from 20000")
+
+    class PagedClient:
+        """Stands in for JamfClient: 5 computers over pages of 2."""
+
+        def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+            page = (params or {})["page"]
+            computers = [
+                {"id": str(cid), "extensionAttributes": [
+                    {"definitionId": "1", "name": "Secure Token Holders", "values": [f"user{cid}"]},
+                    {"definitionId": "2", "name": "Compliance Failed Results", "values": ["none"]},
+                    {"definitionId": "3", "name": "Last Restart", "values": [""]},
+                ]}
+                for cid in range(1, 6)
+            ]
+            return {"totalCount": 5, "results": computers[page * 2:page * 2 + 2]}
+
+    scan = scan_inventory_extension_attributes(PagedClient(), page_size=2, progress=False)  # type: ignore[arg-type]
+    merge_population(rows, scan)
+    population = {row["name"]: (row["fill_rate_percent"], row["distinct_values"], row["population_flag"]) for row in rows}
+    if scan.pages != 3 or population != {
+        "Secure Token Holders": (100.0, 5, ""),
+        "Compliance Failed Results": (100.0, 1, "constant"),
+        "Last Restart": (0.0, 0, "empty"),
+    }:
+        failures.append(f"inventory scan stats unexpected: {population}")
+
+    def member_of(group_name: str) -> list[Criterion]:
+        return [Criterion("Computer Group", "member of", group_name)]
+
+    nested = [
+        SmartGroup(id=10, name="Needs Attention", criteria=[Criterion("Secure Token Holders", "is", "yes")]),
+        SmartGroup(id=20, name="Needs Attention - Laptops", criteria=member_of("Needs Attention")),
+        SmartGroup(id=30, name="Needs Attention - Laptops - Pilot", criteria=member_of("Needs Attention - Laptops")),
+        SmartGroup(id=40, name="Also Pilot", criteria=member_of("Needs Attention - Laptops")),
+    ]
+    scoped_objects = [
+        ScopedObject(kind="policy", id=1, name="Remediate", target_group_ids=[30, 40]),
+        ScopedObject(kind="profile", id=2, name="Restrictions", excluded_group_ids=[10]),
+    ]
+    radius_rows = {row["name"]: row for row in analyze_usage(eas, nested, scoped_objects)}
+    radius = [(item["type"], item["id"], item["depth"]) for item in radius_rows["Secure Token Holders"]["blast_radius"]]
+    if radius != [("group", 10, 1), ("group", 20, 2), ("profile", 2, 2), ("group", 30, 3), ("group", 40, 3), ("policy", 1, 4)]:
+        failures.append(f"blast radius unexpected: {radius}")
+    if radius_rows["Last Restart"]["blast_radius"] or radius_rows["Secure Token Holders"]["max_depth"] != 4:
+        failures.append("blast radius depth/emptiness unexpected")
+    cyclic = [
+        SmartGroup(id=1, name="A", criteria=member_of("B")),
+        SmartGroup(id=2, name="B", criteria=member_of("A")),
+    ]
+    if sorted(DependencyClosure(cyclic, []).closure(1)) != [("group", 1), ("group", 2)]:
+        failures.append("blast radius cycle guard unexpected")
+
+    rng = random.Random(7)
+    inventory = [
+        {
+            "id": str(cid),
+            "general": {"name": rng.choice(["lab-", "mac-"]) + str(cid), "lastContactTime": f"2026-0{rng.randint(1, 3)}-15T10:00:00Z"},
+            "hardware": {"model": rng.choice(["MacBook Air (M2)", "MacBook Pro (16-inch)", "Mac mini"])},
+            "operatingSystem": {"version": rng.choice(["13.6.1", "14.2", "14.10", "15.0"])},
+            "extensionAttributes": [{"name": "Secure Token Holders", "values": [rng.choice(["yes", "no", ""])]}]
+            + ([{"name": "Late EA", "values": ["x"]}] if cid > 150 and cid % 2 else []),
+        }
+        for cid in range(1, 301)
+    ]
+    expected_sizes: dict[str, Callable[[dict[str, Any]], bool]] = {
+        "Sonoma+": lambda c: tuple(map(int, c["operatingSystem"]["version"].split("."))) >= (14,),
+        "Tokens and (old or air)": lambda c: c["extensionAttributes"][0]["values"][0] == "yes"
+        and (c["operatingSystem"]["version"].startswith("13") or "air" in c["hardware"]["model"].lower()),
+        "Mini or pro and token": lambda c: c["hardware"]["model"] == "Mac mini"
+        or ("Pro" in c["hardware"]["model"] and c["extensionAttributes"][0]["values"][0] == "yes"),
+        "Sonoma+ without tokens": lambda c: expected_sizes["Sonoma+"](c) and not expected_sizes["Tokens and (old or air)"](c),
+        "Stale": lambda c: c["general"]["lastContactTime"] < "2026-02-15",
+        "Lab": lambda c: c["general"]["name"].startswith("lab-"),
+        "No late EA": lambda c: len(c["extensionAttributes"]) == 1,
+        "Nothing": lambda c: False,
+        "Everything": lambda c: True,
+    }
+    token_yes = Criterion("Secure Token Holders", "is", "YES")
+    snapshot = InventorySnapshot(
+        generated_at="2026-03-17T00:00:00+00:00",
+        groups=[
+            SmartGroup(1, "Sonoma+", [Criterion("Operating System Version", "greater than or equal", "14")], 120),
+            SmartGroup(2, "Tokens and (old or air)", [
+                token_yes,
+                Criterion("Operating System Version", "less than", "14", opening_paren=True),
+                Criterion("Model", "like", "air", and_or="or", closing_paren=True),
+            ]),
+            SmartGroup(3, "Mini or pro and token", [
+                Criterion("Model", "is", "Mac mini"),
+                Criterion("Model", "like", "Pro", and_or="or"),
+                token_yes,
+            ]),
+            SmartGroup(4, "Sonoma+ without tokens", member_of("Sonoma+") + [
+                Criterion("Computer Group", "not member of", "Tokens and (old or air)"),
+            ]),
+            SmartGroup(5, "Stale", [Criterion("Last Check-in", "more than x days ago", "30")]),
+            SmartGroup(6, "Lab", [Criterion("Computer Name", "matches regex", r"^lab-\d+$")]),
+            SmartGroup(7, "No late EA", [Criterion("Late EA", "is", "")]),
+            SmartGroup(8, "Nothing", [Criterion("Model", "is", "Mac Pro (2013)")]),
+            SmartGroup(9, "Everything", [Criterion("Operating System Version", "like", "1")]),
+            SmartGroup(10, "Unknown", [Criterion("FileVault 2 Status", "is", "Encrypted")]),
+        ],
+    )
+    snapshot.fold_page(inventory[:150])
+    snapshot.fold_page(inventory[150:])
+    predictions = {row["name"]: row for row in evaluate_snapshot(snapshot)}
+    for name, matches in expected_sizes.items():
+        if predictions[name]["predicted_members"] != sum(1 for computer in inventory if matches(computer)):
+            failures.append(f"snapshot evaluation of {name!r} unexpected: {predictions[name]}")
+    if (predictions["Nothing"]["flag"], predictions["Everything"]["flag"], predictions["Unknown"]["flag"]) != (
+        "matches none", "matches all", "unknown"
+    ):
+        failures.append("snapshot flags unexpected")
+    costs = {row["name"]: row for row in smart_group_costs(snapshot.groups, {"Secure Token Holders", "Late EA"})}
+    if costs["Sonoma+ without tokens"]["nesting_depth"] != 1 or costs["Sonoma+ without tokens"]["cost"] != round(
+        ((1.0 + 1.5) + (1.5 + 1.0 * 2 + 1.5 + 3.0)) * (1 + DEPTH_FACTOR), 2
+    ):
+        failures.append(f"nested group cost unexpected: {costs['Sonoma+ without tokens']}")
+    if costs["Sonoma+"]["weighted_cost"] != round(1.5 * (1 + math.log10(121)), 2) or costs["Lab"]["scan_operators"] != 1:
+        failures.append(f"group cost weighting unexpected: {costs['Sonoma+']}, {costs['Lab']}")
+    if smart_group_costs(cyclic, set())[0]["nesting_depth"] != 2:
+        failures.append("group cost cycle guard unexpected")
+    with tempfile.TemporaryDirectory() as tmp:
+        page = os.path.join(tmp, "report.html")
+        many = analyze_usage(
+            [ExtensionAttribute(i, f"EA </script> Überwachung {i}") for i in range(200)],
+            [SmartGroup(g, f"Gruppe Größe {g}", [Criterion(f"EA </script> Überwachung {g % 200}")]) for g in range(2000)],
+        )
+        sidecar = write_html(page, many, total_groups=2000, max_bytes=60_000)
+        with open(page, encoding="utf-8") as fh:
+            embedded = re.search(r"id='ea-data'>(.*?)</script>", fh.read(), re.S)
+        data = json.loads(embedded.group(1)) if embedded else {"rows": []}
+        moved = {str(row[1]) for row in data["rows"] if row[-1] == 0}
+        with open(sidecar or os.devnull, encoding="utf-8") as fh:
+            overflow = json.load(fh)["rows"] if sidecar else {}
+        if len(data["rows"]) != 200 or not moved or set(overflow) != moved or os.path.getsize(page) > 60_000:
+            failures.append("HTML budget/sidecar split unexpected")
+        if write_html(page, many, total_groups=2000) is not None:
+            failures.append("HTML under budget must not write a sidecar")
+        saved = os.path.join(tmp, "snapshot.json.gz")
+        snapshot.save(saved)
+        if evaluate_snapshot(InventorySnapshot.load(saved)) != evaluate_snapshot(snapshot):
+            failures.append("snapshot save/load round trip changed the predictions")
+    what_if = {row["name"]: row for row in evaluate_snapshot(
+        snapshot, {"Sonoma+": [Criterion("Operating System Version", "greater than or equal", "15")]}
+    )}
+    only_sequoia = sum(1 for computer in inventory if computer["operatingSystem"]["version"] == "15.0")
+    if what_if["Sonoma+"]["what_if_members"] != only_sequoia or (
+        what_if["Sonoma+ without tokens"]["what_if_members"] >= what_if["Sonoma+ without tokens"]["predicted_members"]
+    ) or what_if["Lab"]["what_if_members"] != what_if["Lab"]["predicted_members"]:
+        failures.append("what-if criteria did not propagate as expected")
+
+    fixtures = Path(__file__).resolve().parents[3] / "Computer Extensions"
+    fixture_costs = {
+        str(path.relative_to(fixtures)): analyze_script_cost(path.read_text(encoding="utf-8"))
+        for path in sorted(fixtures.glob("**/*.sh"))
+    }
+    if not fixture_costs:
+        failures.append(f"no EA script fixtures found under {fixtures}")
+    else:
+        if "profiles query" not in fixture_costs["Inventory/OS/enrollment_type.sh"].findings:
+            failures.append("enrollment_type.sh should be flagged for its profiles query")
+        if "directory service lookup (in loop)" not in fixture_costs["Security/SecureToken/securetoken.sh"].findings:
+            failures.append("securetoken.sh should be flagged for dscl inside its user loop")
+        if fixture_costs["Health/uptime.sh"].findings:
+            failures.append("uptime.sh should have no expensive commands")
+    expensive = analyze_script_cost(
+        "#!/bin/bash\n# system_profiler (comment)\nsystem_profiler SPApplicationsDataType\n"
+        "find / -name '*.app'\nsoftwareupdate -l\nfor u in a b; do\n  curl -s https://example.com/$u\ndone\nsleep 5\n"
+    )
+    if expensive.seconds != 20 + 60 + 30 + 2 * LOOP_FACTOR + 5 + BASE_RUN_SECONDS:
+        failures.append(f"expensive script estimate unexpected: {expensive}")
+    after_one_liner = analyze_script_cost("for u in a b; do echo $u; done\ncurl -s https://example.com\n")
+    if after_one_liner.seconds != 2 + BASE_RUN_SECONDS or after_one_liner.findings != ["network call"]:
+        failures.append(f"one-line loop must not weight later commands: {after_one_liner}")
+    after_python_loop = analyze_script_cost(
+        "for user in users:\n    os.system('dscl . read ' + user)\nos.system('curl -s https://example.com')\n"
+    )
+    if after_python_loop.findings != ["directory service lookup (in loop)", "network call"]:
+        failures.append(f"Python loop must close at dedent: {after_python_loop}")
+    if any(cost.seconds >= expensive.seconds for cost in fixture_costs.values()):
+        failures.append("a repository EA fixture outranks the synthetic expensive script")
+    merge_script_costs(rows, {1: ("sleep 2", True), 2: ("sleep 2", False)}, fleet_size=100)
+    scores = {row["name"]: row["cost_score"] for row in rows}
+    if scores != {"Secure Token Holders": 205 * 3, "Compliance Failed Results": 0, "Last Restart": 0}:
+        failures.append(f"script cost scores unexpected: {scores}")
+
+    class SearchClient:
+        """Stands in for JamfClient: two searches referencing EAs, one unrelated, one failing."""
+
+        def get_classic_xml(self, path: str) -> ET.Element:
+            if path.endswith("advancedcomputersearches"):
+                return ET.fromstring(
+                    "<advanced_computer_searches>" + "".join(
+                        f"<advanced_computer_search><id>{i}</id><name>Search {i}</name></advanced_computer_search>"
+                        for i in (1, 2, 3, 4)
+                    ) + "</advanced_computer_searches>"
+                )
+            search_id = int(path.rsplit("/", 1)[1])
+            if search_id == 4:
+                raise JamfApiError(f"GET failed for {path}: 500 Server Error")
+            criteria = {1: "Last Restart", 2: "Operating System Version", 3: "Model"}[search_id]
+            display = {1: ["Last Restart", "Computer Name"], 2: ["Last Restart", "Compliance Failed Results"], 3: ["Model"]}
+            return ET.fromstring(
+                f"<advanced_computer_search><criteria><criterion><name>{criteria}</name><priority>0</priority>"
+                f"<search_type>is</search_type><value>x</value></criterion></criteria><display_fields>"
+                + "".join(f"<display_field><name>{name}</name></display_field>" for name in display[search_id])
+                + f"</display_fields><computers><size>{search_id * 100}</size></computers></advanced_computer_search>"
+            )
+
+    searches = fetch_advanced_searches(SearchClient(), workers=2, progress=False, run_searches=True)  # type: ignore[arg-type]
+    search_usage = analyze_usage(eas, groups, searches=searches)
+    ranking = [(row["name"], row["advanced_search_count"], row["search_criteria_hits"], row["search_display_hits"]) for row in search_usage]
+    if ranking != [
+        ("Last Restart", 2, 1, 2),  # 2 searches tie 2 smart groups; more references win
+        ("Secure Token Holders", 0, 0, 0),
+        ("Compliance Failed Results", 1, 0, 1),
+    ]:
+        failures.append(f"advanced search counts/ranking unexpected: {ranking}")
+    next(row for row in search_usage if row["name"] == "Last Restart")["script_seconds"] = 30.0
+    search_rows = advanced_search_rows(searches, search_usage)
+    if [(row["id"], [item["name"] for item in row["expensive_eas"]], row["result_count"]) for row in search_rows] != [
+        (2, ["Last Restart"], 200),
+        (1, ["Last Restart"], 100),
+    ] or searches[3].error == "":
+        failures.append(f"advanced search highlighting unexpected: {search_rows}")
+
+    class SearchListingClient:
+        """Stands in for JamfClient: 250 search definitions over pages of 100."""
+
+        def __init__(self) -> None:
+            self.paths: list[str] = []
+
+        def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+            self.paths.append(path)
+            page = (params or {})["page"]
+            records = [
+                {"id": str(i), "name": f"Search {i}", "displayFields": ["Computer Name", "Last Restart"],
+                 "criteria": [{"name": "Secure Token Holders", "priority": 0, "andOr": "and", "searchType": "like", "value": "a"}]}
+                for i in range(page * 100 + 1, min(250, page * 100 + 100) + 1)
+            ]
+            return {"totalCount": 250, "results": records}
+
+    listing = SearchListingClient()
+    listed = fetch_advanced_searches(listing, workers=3, progress=False)  # type: ignore[arg-type]
+    if len(listed) != 250 or set(listing.paths) != {"/api/v1/advanced-searches"} or [
+        criterion.name for criterion in listed[0].criteria
+    ] != ["Secure Token Holders"] or listed[0].display_fields != ["Computer Name", "Last Restart"]:
+        failures.append("advanced search definitions must come from the paged Jamf Pro API listing")
+
+    class FlakyListingClient(SearchListingClient):
+        """Page 2 of the listing keeps failing after the client's retries."""
+
+        def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+            if (params or {})["page"] == 1:
+                raise JamfApiError(f"GET failed for {path}: 500 Server Error")
+            return super().get_json(path, params)
+
+    partial = fetch_advanced_searches(FlakyListingClient(), workers=3, progress=False)  # type: ignore[arg-type]
+    if len(partial) != 151 or [search.name for search in partial if search.error] != [
+        "Advanced search listing page 2"
+    ]:
+        failures.append("a failed listing page must become an error row, not abort the run")
+
+    class NoListingClient(SearchClient):
+        """A server without /api/v1/advanced-searches."""
+
+        def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+            response = requests.Response()
+            response.status_code = 404
+            try:
+                raise requests.HTTPError("404 Not Found", response=response)
+            except requests.HTTPError as exc:
+                raise JamfApiError(f"GET failed for {path}: {exc}") from exc
+
+    fallback = fetch_advanced_searches(NoListingClient(), workers=2, progress=False)  # type: ignore[arg-type]
+    if [search.id for search in fallback] != [1, 2, 3, 4] or fallback[0].result_count != 100:
+        failures.append("a missing search listing must fall back to the Classic searches")
+
+    for failure in failures:
+        print(f"Self-test failed: {failure}", file=sys.stderr)
+    return 1 if failures else 0
 
 
 def parse_args() -> argparse.Namespace:
@@ -442,8 +2401,74 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--password", default=os.getenv("JAMF_PASSWORD"))
     parser.add_argument("--json-out", help="Optional path for JSON output")
     parser.add_argument("--html-out", help="Optional path for HTML output")
+    parser.add_argument(
+        "--html-max-bytes",
+        type=int,
+        default=DEFAULT_HTML_MAX_BYTES,
+        help=f"HTML size budget; per-EA detail past it goes to a sidecar .detail.json (default: {DEFAULT_HTML_MAX_BYTES})",
+    )
     parser.add_argument("--top", type=int, default=None, help="Limit terminal output to top N rows")
     parser.add_argument("--timeout", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=8, help="Parallel smart-group detail requests (default: 8)")
+    parser.add_argument("--max-retries", type=int, default=3, help="Retries per request on 429/5xx (default: 3)")
+    parser.add_argument(
+        "--inventory-scan",
+        action="store_true",
+        help="Also stream /api/v1/computers-inventory for EA fill rate, distinct values and value sizes",
+    )
+    parser.add_argument("--page-size", type=int, default=200, help="Inventory scan page size (default: 200)")
+    parser.add_argument(
+        "--advanced-searches",
+        action="store_true",
+        help="Also count EA criteria and display fields in advanced computer searches (definitions only)",
+    )
+    parser.add_argument(
+        "--run-classic-searches",
+        action="store_true",
+        help="With --advanced-searches: read each search via the Classic API for result counts (runs every search)",
+    )
+    parser.add_argument(
+        "--group-cost",
+        action="store_true",
+        help="Also rank smart groups by static evaluation cost (criteria, operators, nesting, EA criteria, members)",
+    )
+    parser.add_argument(
+        "--snapshot-out",
+        metavar="FILE",
+        help="Also save a columnar inventory snapshot with the smart-group criteria (.gz to compress)",
+    )
+    parser.add_argument(
+        "--evaluate-snapshot",
+        metavar="FILE",
+        help="Offline: predict smart-group sizes from a saved snapshot, no Jamf access",
+    )
+    parser.add_argument(
+        "--what-if",
+        metavar="FILE",
+        help="With --evaluate-snapshot: JSON of replacement criteria per group name, shows the size change",
+    )
+    parser.add_argument(
+        "--blast-radius",
+        action="store_true",
+        help="Also fetch policy/profile scopes and list everything downstream of each EA (nested groups, policies, profiles)",
+    )
+    parser.add_argument(
+        "--script-cost",
+        action="store_true",
+        help="Also fetch EA scripts and estimate their per-run and fleet-wide execution cost",
+    )
+    parser.add_argument(
+        "--fleet-size",
+        type=int,
+        default=None,
+        help="Computers running inventory (default: inventory scan count, else the computer list size)",
+    )
+    parser.add_argument(
+        "--analyze-scripts",
+        nargs="+",
+        metavar="PATH",
+        help="Offline: estimate run cost for local EA scripts or directories, no Jamf access",
+    )
     parser.add_argument("--insecure", action="store_true", help="Disable TLS verification")
     parser.add_argument("--self-test", action="store_true", help="Run parser/report self-test without Jamf access")
     return parser.parse_args()
@@ -453,6 +2478,10 @@ def main() -> int:
     args = parse_args()
     if args.self_test:
         return run_self_test()
+    if args.analyze_scripts:
+        return analyze_script_paths(args.analyze_scripts)
+    if args.evaluate_snapshot:
+        return evaluate_snapshot_file(args.evaluate_snapshot, args.what_if, args.json_out, args.top)
     if not args.url:
         print("Error: provide --url or set JAMF_URL", file=sys.stderr)
         return 2
@@ -465,28 +2494,106 @@ def main() -> int:
         password=args.password,
         verify_tls=not args.insecure,
         timeout=args.timeout,
+        pool_size=args.workers,
+        max_retries=args.max_retries,
     )
     try:
         client.authenticate()
         extension_attributes = fetch_extension_attributes(client)
         smart_group_summaries = fetch_smart_group_summaries(client)
-        smart_groups = [
-            fetch_smart_group_detail(client, group_id, group_name)
-            for group_id, group_name in smart_group_summaries
-        ]
-        rows = analyze_usage(extension_attributes, smart_groups)
+        smart_groups = fetch_smart_group_details(client, smart_group_summaries, workers=args.workers)
+        scoped = fetch_scoped_objects(client, workers=args.workers) if args.blast_radius else None
+        searches = (
+            fetch_advanced_searches(client, workers=args.workers, run_searches=args.run_classic_searches)
+            if args.advanced_searches
+            else None
+        )
+        rows = analyze_usage(extension_attributes, smart_groups, scoped, searches)
+        sections: dict[str, Any] = {}
+        if scoped is not None:
+            sections["blast_radius"] = {
+                "policies_scanned": sum(1 for obj in scoped if obj.kind == "policy" and not obj.error),
+                "profiles_scanned": sum(1 for obj in scoped if obj.kind == "profile" and not obj.error),
+                "scope_errors": [
+                    {"type": obj.kind, "id": obj.id, "name": obj.name, "error": obj.error} for obj in scoped if obj.error
+                ],
+            }
+        if args.group_cost:
+            group_costs = smart_group_costs(smart_groups, {ea.name for ea in extension_attributes})
+            sections["group_cost"] = {"groups_ranked": len(group_costs), "groups": group_costs}
+        if args.inventory_scan or args.snapshot_out:
+            snapshot = None
+            if args.snapshot_out:
+                snapshot = InventorySnapshot(
+                    generated_at=datetime.now(timezone.utc).isoformat(),
+                    groups=[group for group in smart_groups if not group.error],
+                )
+            scan = scan_inventory_extension_attributes(client, page_size=args.page_size, snapshot=snapshot)
+            if args.inventory_scan:
+                merge_population(rows, scan)
+                sections["inventory_scan"] = scan.summary()
+            if snapshot is not None:
+                snapshot.save(args.snapshot_out)
+        if args.script_cost:
+            fleet_size = args.fleet_size
+            if fleet_size is None:
+                fleet_size = scan.computers if args.inventory_scan else fetch_fleet_size(client)
+            script_eas = [ea for ea in extension_attributes if ea.input_type.lower() == "script"]
+            bodies = fetch_parallel(
+                [ea.id for ea in script_eas],
+                lambda ea_id: fetch_extension_attribute_script(client, ea_id),
+                workers=args.workers,
+                label="EA scripts",
+            )
+            merge_script_costs(rows, dict(zip((ea.id for ea in script_eas), bodies)), fleet_size)
+            sections["script_cost"] = {"fleet_size": fleet_size, "scripts_analyzed": len(script_eas)}
+        if searches is not None:
+            search_rows = advanced_search_rows(searches, rows)
+            sections["advanced_searches"] = {
+                "searches_scanned": sum(1 for search in searches if not search.error),
+                "searches_with_expensive_eas": sum(1 for search in search_rows if search["expensive_eas"]),
+                "searches": search_rows,
+                "search_errors": [
+                    {"id": search.id, "name": search.name, "error": search.error} for search in searches if search.error
+                ],
+            }
     except JamfApiError as exc:
         print(f"Jamf API error: {exc}", file=sys.stderr)
         return 1
 
-    print_table(rows, total_groups=len(smart_groups), limit=args.top)
+    errors = error_rows(smart_groups)
+    total_groups = len(smart_groups) - len(errors)
+    print_table(rows, total_groups=total_groups, limit=args.top, errors=errors)
+    if "inventory_scan" in sections:
+        print(f"Computers scanned for EA values: {sections['inventory_scan']['computers_scanned']}")
+    if "blast_radius" in sections:
+        radius = sections["blast_radius"]
+        print(
+            f"Blast radius: {radius['policies_scanned']} policies and {radius['profiles_scanned']} profiles scanned"
+            + (f", {len(radius['scope_errors'])} could not be read" if radius["scope_errors"] else "")
+        )
+    if "script_cost" in sections:
+        print_script_costs(rows, sections["script_cost"]["fleet_size"])
+    if "advanced_searches" in sections:
+        print_advanced_searches(sections["advanced_searches"], limit=args.top or 10)
+    if "group_cost" in sections:
+        print_group_costs(sections["group_cost"]["groups"], limit=args.top or 10)
+    if args.snapshot_out:
+        print(f"Wrote inventory snapshot ({scan.computers} computers) to {args.snapshot_out}")
 
     if args.json_out:
-        write_json(args.json_out, rows, total_groups=len(smart_groups))
+        write_json(args.json_out, rows, total_groups=total_groups, errors=errors, sections=sections)
         print(f"Wrote JSON report to {args.json_out}")
     if args.html_out:
-        write_html(args.html_out, rows, total_groups=len(smart_groups))
+        sidecar = write_html(
+            args.html_out, rows, total_groups=total_groups, errors=errors, sections=sections,
+            max_bytes=args.html_max_bytes,
+        )
         print(f"Wrote HTML report to {args.html_out}")
+        if sidecar:
+            print(f"Wrote detail that did not fit --html-max-bytes to {sidecar}")
+        if os.path.getsize(args.html_out) > args.html_max_bytes:
+            print("Warning: the HTML rows alone exceed --html-max-bytes; use --json-out for the full data", file=sys.stderr)
     return 0
 
 
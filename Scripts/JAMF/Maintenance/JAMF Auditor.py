@@ -23,8 +23,11 @@
 #   • Prefers OAuth client credentials (/api/oauth/token, falls back to /oauth/token).
 #   • If client credentials aren’t available/valid, falls back to user/password
 #     via /api/v1/auth/token (Basic → Bearer).
-#   • Parses policy JSON and scope XML; detects script/package references in policies.
-#   • Produces console tables (default) or JSON (--format json) suitable for piping to files/CI.
+#   • Token refresh is single-flight across worker threads and starts at 80% of expires_in.
+#   • Parses policy JSON (scope included — one GET per policy; the XML Scope subset is
+#     only fetched when the JSON carries no scope block); detects script/package references.
+#   • Produces console tables (default), JSON (--format json) or streamed JSON Lines
+#     (--format jsonl) suitable for piping to files/CI/log shippers.
 #
 # REQUIREMENTS
 #   • Python 3 (MacAdmins Python recommended). The script will auto-relaunch under
@@ -57,15 +60,40 @@
 #   /usr/local/bin/managed_python3 "JAMF Auditor.py" --move-to-archive --archive-category "z_Archive"
 #
 # USEFUL FLAGS
-#   --format table|json        Output style (default: table)
-#   --out <file>               Write JSON to file when --format json
+#   --format table|json|jsonl  Output style (default: table); jsonl streams one record per finding
+#   --out <file>               Write JSON/JSONL to file (jsonl: file only, not stdout)
+#   --gzip                     gzip --out (implied by a .gz suffix)
+#   --reports <a,b,...>        Run only these reports ('all' adds the opt-in ones); fetch only what they need
+#   --history-days <n>         stale_policies window (default: 90); that report scans every computer's history
+#   --checkin-minutes <n>      policy_load: recurring check-in interval (default: 15)
 #   --inspect-policy <id>      Print raw scope/flags/refs for one policy (JSON)
 #   --inspect-profile <id>     Print raw scope for one profile (JSON)
 #   --inspect-scope            Include scope details during inspections
 #   --why-policy <id>          Friendly “why” bundle for a policy (JSON)
 #   --why-profile <id>         Friendly “why” bundle for a profile (JSON)
+#   --why-script|--why-package|--why-group <id>
+#                              Who references this object (shared dependency graph, JSON)
+#   --graph-out <file>         Export the dependency graph (.graphml or JSON)
+#   --compare-url <url>        Drift report vs a second instance (JAMF_COMPARE_URL / JAMF_COMPARE_* creds)
+#   --compare-types <a,b>      policy,profile,script,package,group (default: all)
+#   --serve [host:]port        Local HTTP/JSON why/inspect/unused query server (warm, auto-refreshing)
+#   --serve-interval <sec>     Background refresh interval for --serve (default: 900)
+#   --self-test                Parser parity checks on recorded fixtures (no Jamf access)
+#   --benchmark                Time parsers + audit-state memory (tracemalloc) on synthetic data (no Jamf access)
 #   --move-to-archive          Move unscoped/unused objects to archive category
 #   --archive-category <name>  Override archive category (default: z_Archive)
+#   --plan-out <file>          Write intended archive moves (with original categories) as JSON
+#   --apply-plan <file>        Apply a plan concurrently under --rate-limit; journals every move
+#   --undo-journal <file>      Replay a journal backwards to restore original categories
+#   --journal <file>           Journal path for --move-to-archive/--apply-plan
+#   --rate-limit <n>           Max category PUTs per second (default: 5)
+#   --max-concurrency <n>      Adaptive detail-fetch concurrency ceiling (default: 16)
+#   --min-concurrency <n>      Adaptive detail-fetch concurrency floor (default: 2)
+#   --max-retries <n>          Retries per object on 429/5xx/network errors (default: 3)
+#   --cache-dir <dir>          Opt-in on-disk detail cache (ETag/Last-Modified or content hash)
+#   --cache-max-mb <n>         Cache size cap with LRU eviction (default: 256)
+#   --cache-max-age <hours>    Ignore cache entries older than this (default: 168)
+#   --refresh                  Bypass cached entries for this run
 #   --timeout <sec>            HTTP timeout (default: 30)
 #   --insecure                 Skip TLS verification (labs)
 #   --debug-auth|--debug-list  Verbose auth/listing logs to stderr
@@ -80,19 +108,27 @@
 # OUTPUT (JSON mode)
 #   Top-level keys include: stats, unscoped_policies, unscoped_profiles,
 #   unused_scripts, unused_packages, unused_groups,
-#   policies_no_triggers_and_not_selfservice, active_policies_selfservice_enabled.
+#   policies_no_triggers_and_not_selfservice, active_policies_selfservice_enabled,
+#   plus any opt-in reports selected with --reports (e.g. zero_effective_scope_policies,
+#   duplicate_packages, duplicate_scripts).
 #
 # SAFETY / NOTES
 #   • Read-only by default; nothing is changed unless --move-to-archive is provided.
-#   • Archive moves update only the object’s category (non-destructive, reversible).
+#   • Archive moves update only the object’s category (non-destructive, reversible via
+#     the append-only journal and --undo-journal).
 #   • Errors return non-zero; see stderr for HTTP/permission details.
 #
 # Reference: internal implementation and flags are documented inline in this file.
 ###############################################
 
-import os, sys, base64, json, time
+import os, sys, base64, json, time, heapq, random, threading, hashlib, tempfile, gzip, re, gc, tracemalloc
+from array import array
+from email.utils import parsedate_to_datetime
 from typing import Dict, Optional, Set, Any, List, Tuple
 from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape as xml_escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
 
 # Try to relaunch under managed_python3 if present
 try:
@@ -104,12 +140,24 @@ except Exception:
 
 import argparse
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # ----------------------------- HTTP/Auth -----------------------------
 
+# seconds before retrying a failed proactive token refresh (the current token stays in use)
+TOKEN_REFRESH_BACKOFF = 30.0
+
 class JamfClient:
-    def __init__(self, base_url, client_id, client_secret, user, password, timeout=30, verify_tls=True, debug_auth=False):
+    """Jamf API client safe to share across worker threads.
+
+    The bearer token is refreshed single-flight: one thread re-authenticates
+    while the others either keep using the still-valid token (proactive refresh
+    at refresh_fraction of its lifetime) or wait on the lock for the new one
+    (token expired or rejected with 401). The token is sent per request rather
+    than through the shared session.headers.
+    """
+    def __init__(self, base_url, client_id, client_secret, user, password, timeout=30, verify_tls=True, debug_auth=False,
+                 refresh_fraction=0.8):
         self.base_url = base_url.rstrip('/')
         self.client_id = client_id
         self.client_secret = client_secret
@@ -118,10 +166,22 @@ class JamfClient:
         self.timeout = timeout
         self.verify_tls = verify_tls
         self.debug_auth = debug_auth
+        self.refresh_fraction = refresh_fraction
         self.session = requests.Session()
         self.session.headers.update({"Accept": "application/json"})
         self.token = None
         self.token_expiry_epoch = 0
+        self.token_refresh_epoch = 0
+        self.token_refreshes = 0
+        self._token_lock = threading.Lock()
+
+    def _set_token(self, token, lifetime: float):
+        now = time.time()
+        # epochs first: a thread that sees the new token must not find it already due for refresh
+        self.token_refresh_epoch = now + lifetime * self.refresh_fraction
+        self.token_expiry_epoch = now + max(30.0, lifetime - min(60.0, lifetime * 0.1))
+        self.token = token
+        self.token_refreshes += 1
 
     def _auth_with_userpass(self):
         url = f"{self.base_url}/api/v1/auth/token"
@@ -132,8 +192,7 @@ class JamfClient:
             print(f"[auth] POST {url} -> {r.status_code}", file=sys.stderr)
         r.raise_for_status()
         data = r.json()
-        self.token = data.get("token") or data.get("access_token")
-        self.token_expiry_epoch = time.time() + 14*60
+        self._set_token(data.get("token") or data.get("access_token"), 15*60)
 
     def _auth_with_client_credentials(self):
         url = f"{self.base_url}/api/oauth/token"
@@ -151,13 +210,11 @@ class JamfClient:
             return 401
         r.raise_for_status()
         data = r.json()
-        self.token = data.get("access_token") or data.get("token")
-        self.token_expiry_epoch = time.time() + max(60, int(data.get("expires_in", 900)) - 60)
+        self._set_token(data.get("access_token") or data.get("token"), max(60, int(data.get("expires_in", 900))))
         return 200
 
-    def ensure_token(self):
-        if self.token and time.time() < self.token_expiry_epoch:
-            return
+    def _refresh_token(self):
+        # caller holds _token_lock
         used = None
         if self.client_id and self.client_secret:
             status = self._auth_with_client_credentials()
@@ -176,33 +233,145 @@ class JamfClient:
             raise RuntimeError("No credentials set")
         if self.debug_auth:
             print(f"[auth] using method: {used}", file=sys.stderr)
-        self.session.headers["Authorization"] = f"Bearer {self.token}"
 
-    def get(self, path, params=None, accept: Optional[str]=None) -> requests.Response:
-        self.ensure_token()
-        url = f"{self.base_url}{path}"
-        headers = {}
-        if accept:
-            headers["Accept"] = accept
-        r = self.session.get(url, params=params, headers=headers or None, timeout=self.timeout, verify=self.verify_tls)
+    def ensure_token(self) -> str:
+        tok = self.token
+        now = time.time()
+        if tok and now < self.token_refresh_epoch:
+            return tok
+        if tok and now < self.token_expiry_epoch:
+            # proactive refresh: one thread renews, the rest keep the still-valid token
+            if self._token_lock.acquire(blocking=False):
+                try:
+                    if self.token == tok and time.time() >= self.token_refresh_epoch:
+                        self._refresh_token()
+                except Exception as e:
+                    # back off so a failing auth endpoint isn't hit once per request until expiry
+                    self.token_refresh_epoch = min(self.token_expiry_epoch, time.time() + TOKEN_REFRESH_BACKOFF)
+                    if self.debug_auth:
+                        print(f"[auth] early refresh failed, keeping current token: {e}", file=sys.stderr)
+                finally:
+                    self._token_lock.release()
+            return self.token or tok
+        with self._token_lock:
+            if self.token and time.time() < self.token_expiry_epoch:
+                return self.token
+            self._refresh_token()
+            return self.token
+
+    def invalidate_token(self, stale: Optional[str]):
+        # only drop the token the 401 was issued against; a newer one is already fine
+        with self._token_lock:
+            if self.token == stale:
+                self.token = None
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], **kw) -> requests.Response:
+        tok = self.ensure_token()
+        r = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {tok}"},
+                                 timeout=self.timeout, verify=self.verify_tls, **kw)
         if r.status_code == 401:
-            self.token = None
-            self.ensure_token()
-            r = self.session.get(url, params=params, headers=headers or None, timeout=self.timeout, verify=self.verify_tls)
+            self.invalidate_token(tok)
+            tok = self.ensure_token()
+            r = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {tok}"},
+                                     timeout=self.timeout, verify=self.verify_tls, **kw)
         r.raise_for_status()
         return r
 
+    def get(self, path, params=None, accept: Optional[str]=None, headers: Optional[Dict[str, str]]=None) -> requests.Response:
+        headers = dict(headers or {})
+        if accept:
+            headers["Accept"] = accept
+        return self._send("GET", f"{self.base_url}{path}", headers, params=params)
+
     def put_xml(self, path: str, xml_body: str) -> requests.Response:
-        self.ensure_token()
-        url = f"{self.base_url}{path}"
         headers = {"Accept": "application/xml", "Content-Type": "application/xml"}
-        r = self.session.put(url, data=xml_body.encode("utf-8"), headers=headers, timeout=self.timeout, verify=self.verify_tls)
-        if r.status_code == 401:
-            self.token = None
-            self.ensure_token()
-            r = self.session.put(url, data=xml_body.encode("utf-8"), headers=headers, timeout=self.timeout, verify=self.verify_tls)
-        r.raise_for_status()
-        return r
+        return self._send("PUT", f"{self.base_url}{path}", headers, data=xml_body.encode("utf-8"))
+
+# ----------------------------- Compact records -----------------------
+
+class Record:
+    """__slots__ base with read-only dict-style access (o["id"], o.get("name")).
+
+    Audit state is held in these instead of per-object dicts; code written
+    against the old dicts keeps working, and to_dict() gives the same JSON.
+    """
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: as_plain(getattr(self, k)) for k in self._fields}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class ObjRef(Record):
+    __slots__ = _fields = ("id", "name")
+    def __init__(self, oid: int, name: str):
+        self.id, self.name = oid, name
+
+class GroupRef(Record):
+    __slots__ = _fields = ("id", "name", "is_smart")
+    def __init__(self, oid: int, name: str, is_smart: bool):
+        self.id, self.name, self.is_smart = oid, name, is_smart
+
+class ComputerRef(Record):
+    __slots__ = _fields = ("id", "name", "building", "department")
+    def __init__(self, oid: int, name: str, building: str, department: str):
+        # building/department repeat across the fleet: intern so each name is stored once
+        self.id, self.name = oid, name
+        self.building, self.department = sys.intern(building), sys.intern(department)
+
+def pack_ids(ids) -> Any:
+    """Immutable id sequence: () / small tuple, or array('i') (4 bytes per id) for long lists."""
+    if not ids:
+        return ()
+    if len(ids) < 16:
+        return tuple(ids)
+    try:
+        return array("i", ids)
+    except (TypeError, OverflowError):
+        return tuple(ids)
+
+class Scope(Record):
+    """One parsed scope (see _empty_scope) with id lists packed by pack_ids."""
+    __slots__ = _fields = ("all_computers", "targets_groups", "targets_computers", "targets_buildings",
+                           "targets_departments", "excl_groups", "excl_computers")
+    def __init__(self, sc: Dict[str, Any]):
+        self.all_computers = sc.get("all_computers", False)
+        for k in self._fields[1:]:
+            setattr(self, k, pack_ids(sc.get(k)))
+
+class PolicyFlags(Record):
+    __slots__ = _fields = ("enabled", "any_trigger", "self_service_enabled", "name", "frequency", "triggers")
+    def __init__(self, flags: Dict[str, Any]):
+        self.enabled = flags.get("enabled", False)
+        self.any_trigger = flags.get("any_trigger", False)
+        self.self_service_enabled = flags.get("self_service_enabled", False)
+        self.name = flags.get("name")
+        self.frequency = sys.intern(flags["frequency"]) if isinstance(flags.get("frequency"), str) else flags.get("frequency")
+        self.triggers = tuple(flags.get("triggers") or ())
+
+def as_plain(v: Any) -> Any:
+    """JSON-ready copy of records / packed id sequences."""
+    if isinstance(v, Record):
+        return v.to_dict()
+    if isinstance(v, (array, tuple)):
+        return [as_plain(x) for x in v]
+    if isinstance(v, dict):
+        return {k: as_plain(x) for k, x in v.items()}
+    return v
 
 # ----------------------------- Helpers -------------------------------
 
@@ -243,10 +412,11 @@ def list_generic(j, path, top, inner, key="id", name="name"):
             if k in i and isinstance(i[k], dict):
                 d = i[k]; break
         if key in d:
-            entry = {"id": int(d[key]), "name": d.get(name,"")}
             if "is_smart" in d:
-                entry["is_smart"] = d["is_smart"] if isinstance(d["is_smart"], bool) else str(d["is_smart"]).lower()=="true"
-            out.append(entry)
+                is_smart = d["is_smart"] if isinstance(d["is_smart"], bool) else str(d["is_smart"]).lower()=="true"
+                out.append(GroupRef(int(d[key]), d.get(name,""), is_smart))
+            else:
+                out.append(ObjRef(int(d[key]), d.get(name,"")))
     return out
 
 def list_policies(j, debug=False):  return list_generic(j, "/JSSResource/policies", "policies", "policy")
@@ -254,17 +424,160 @@ def list_profiles(j, debug=False):  return list_generic(j, "/JSSResource/osxconf
 def list_scripts(j, debug=False):   return list_generic(j, "/JSSResource/scripts", "scripts", "script")
 def list_packages(j, debug=False):  return list_generic(j, "/JSSResource/packages", "packages", "package")
 def list_groups(j, debug=False):    return list_generic(j, "/JSSResource/computergroups", "computer_groups", "computer_group")
+def list_buildings(j, debug=False): return list_generic(j, "/JSSResource/buildings", "buildings", "building")
+def list_departments(j, debug=False): return list_generic(j, "/JSSResource/departments", "departments", "department")
+
+def list_computers(j, debug=False):
+    # basic subset carries building/department names, needed to resolve building/department scopes
+    items = normalize_list(jload(j.get("/JSSResource/computers/subset/basic")), "computers", "computer")
+    out = []
+    for d in items:
+        cid = _to_int(d.get("id"))
+        if cid is not None:
+            out.append(ComputerRef(cid, d.get("name", ""), d.get("building") or "", d.get("department") or ""))
+    return out
+
+# ----------------------------- Fetch scheduling ----------------------
+
+THROTTLE_STATUSES = (429, 503)
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# exceptions without an HTTP status that are worth another attempt
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+def _http_status(exc: BaseException) -> Optional[int]:
+    resp = getattr(exc, "response", None)
+    return getattr(resp, "status_code", None)
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    resp = getattr(exc, "response", None)
+    val = (getattr(resp, "headers", None) or {}).get("Retry-After")
+    if not val:
+        return None
+    try:
+        return max(0.0, float(val))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(val).timestamp() - time.time())
+    except Exception:
+        return None
+
+class FetchScheduler:
+    """AIMD-controlled worker pool shared by the detail-fetch phases.
+
+    Concurrency grows by one per window of clean completions and is halved on
+    429/503 (or cut back when latency climbs well past the observed baseline),
+    at most once per window.
+    Throttled and transient failures are re-queued with backoff; Retry-After
+    pauses all new submissions until it elapses.
+    """
+    def __init__(self, min_concurrency=2, max_concurrency=16, start=8, max_retries=3,
+                 latency_factor=3.0, debug=False):
+        self.min_c = max(1, min_concurrency)
+        self.max_c = max(self.min_c, max_concurrency)
+        self.limit = float(min(self.max_c, max(self.min_c, start)))
+        self.max_retries = max_retries
+        self.latency_factor = latency_factor
+        self.debug = debug
+        self.base_latency: Optional[float] = None
+        self.ewma_latency: Optional[float] = None
+        self.pause_until = 0.0
+        self._since_cut = int(self.limit)
+        self.stats = {"requests": 0, "throttled": 0, "retried": 0, "failed": 0, "peak_concurrency": int(self.limit)}
+
+    def _log(self, msg):
+        if self.debug:
+            print(f"[fetch] {msg}", file=sys.stderr)
+
+    def _on_success(self, latency: float):
+        self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+        if self.base_latency is None or self.ewma_latency < self.base_latency:
+            self.base_latency = self.ewma_latency
+        if self.ewma_latency > self.latency_factor * self.base_latency:
+            self._decrease(0.8, f"latency {self.ewma_latency:.2f}s vs baseline {self.base_latency:.2f}s")
+        else:
+            # additive increase: +1 per full window of completions
+            self.limit = min(self.max_c, self.limit + 1.0 / max(1.0, self.limit))
+            self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], int(self.limit))
+
+    def _decrease(self, factor: float, why: str):
+        # at most one cut per window of completions, so one slow burst doesn't collapse the pool
+        if self._since_cut < int(self.limit):
+            return
+        self._since_cut = 0
+        before = int(self.limit)
+        self.limit = max(float(self.min_c), self.limit * factor)
+        if int(self.limit) != before:
+            self._log(f"concurrency {before} -> {int(self.limit)} ({why})")
+
+    def run(self, items: List[Any], fn, label="item", on_failure=None):
+        """Run fn(item) for every item. Returns (results, failures) as lists of (item, value|exc).
+
+        on_failure(item, exc) is called as soon as an item has used up its retries.
+        """
+        results: List[Tuple[Any, Any]] = []
+        failures: List[Tuple[Any, BaseException]] = []
+        ready: List[Tuple[float, int, int, Any]] = [(0.0, n, 0, it) for n, it in enumerate(items)]
+        heapq.heapify(ready)
+        seq = len(items)
+        inflight: Dict[Any, Tuple[int, Any, float]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_c) as ex:
+            while ready or inflight:
+                now = time.time()
+                while ready and len(inflight) < int(self.limit) and now >= self.pause_until and ready[0][0] <= now:
+                    _, _, attempt, it = heapq.heappop(ready)
+                    inflight[ex.submit(fn, it)] = (attempt, it, time.time())
+                    self.stats["requests"] += 1
+                if not inflight:
+                    time.sleep(max(0.01, min(max(self.pause_until, ready[0][0]) - now, 1.0)))
+                    continue
+                done, _ = wait(list(inflight), timeout=0.25, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    attempt, it, started = inflight.pop(fut)
+                    self._since_cut += 1
+                    try:
+                        results.append((it, fut.result()))
+                        self._on_success(time.time() - started)
+                        continue
+                    except Exception as e:
+                        exc = e
+                    status = _http_status(exc)
+                    if status in THROTTLE_STATUSES:
+                        self.stats["throttled"] += 1
+                        self._decrease(0.5, f"HTTP {status}")
+                        wait_s = retry_after_seconds(exc)
+                        if wait_s is not None:
+                            self.pause_until = max(self.pause_until, time.time() + wait_s)
+                    retryable = (isinstance(exc, TRANSIENT_ERRORS) if status is None
+                                 else status in RETRYABLE_STATUSES)
+                    if retryable and attempt < self.max_retries:
+                        self.stats["retried"] += 1
+                        delay = retry_after_seconds(exc)
+                        if delay is None:
+                            delay = min(30.0, (2 ** attempt) * 0.5 + random.random() * 0.25)
+                        seq += 1
+                        heapq.heappush(ready, (time.time() + delay, seq, attempt + 1, it))
+                        self._log(f"{label} retry {attempt + 1}/{self.max_retries} in {delay:.1f}s: {exc}")
+                    else:
+                        self.stats["failed"] += 1
+                        failures.append((it, exc))
+                        if on_failure:
+                            on_failure(it, exc)
+        return results, failures
 
 # ----------------------------- Scope parsing -------------------------
 
-def parse_scope_subset(xml_text: str) -> Dict[str, Any]:
-    root = ET.fromstring(xml_text)
-    scope = root.find(".//scope")
-    out = {
+def _empty_scope() -> Dict[str, Any]:
+    return {
         "all_computers": False,
         "targets_groups": [], "targets_computers": [], "targets_buildings": [], "targets_departments": [],
         "excl_groups": [], "excl_computers": []
     }
+
+def parse_scope_subset(xml_text: str) -> Dict[str, Any]:
+    root = ET.fromstring(xml_text)
+    scope = root.find(".//scope")
+    out = _empty_scope()
     if scope is None: return out
     ac = (scope.findtext("all_computers") or "").strip().lower()
     out["all_computers"] = ac == "true"
@@ -288,6 +601,58 @@ def parse_scope_subset(xml_text: str) -> Dict[str, Any]:
         except: pass
     return out
 
+# (scope key, JSON list key, JSON item key) — mirrors the XML paths above
+SCOPE_JSON_FIELDS = [
+    ("targets_groups",      ("computer_groups",),               "computer_group"),
+    ("targets_computers",   ("computers",),                     "computer"),
+    ("targets_buildings",   ("buildings",),                     "building"),
+    ("targets_departments", ("departments",),                   "department"),
+    ("excl_groups",         ("exclusions", "computer_groups"),  "computer_group"),
+    ("excl_computers",      ("exclusions", "computers"),        "computer"),
+]
+
+def _scope_ids(items: Any, inner: str) -> List[int]:
+    # Classic JSON gives [{"id":..}], but some proxies keep the XML wrapper ({"computer": {...}})
+    if isinstance(items, dict):
+        items = items.get(inner, [])
+    if isinstance(items, dict):
+        items = [items]
+    out: List[int] = []
+    for it in items if isinstance(items, list) else []:
+        if isinstance(it, dict) and isinstance(it.get(inner), dict):
+            it = it[inner]
+        vid = _to_int(it.get("id")) if isinstance(it, dict) else None
+        if vid is not None:
+            out.append(vid)
+    return out
+
+def parse_scope_json(raw_detail: Any) -> Optional[Dict[str, Any]]:
+    """Scope dict from a policy/profile JSON detail; None when the payload carries no scope block."""
+    root = raw_detail
+    if isinstance(raw_detail, dict):
+        for k in ("policy", "os_x_configuration_profile"):
+            if isinstance(raw_detail.get(k), dict):
+                root = raw_detail[k]; break
+    scope = root.get("scope") if isinstance(root, dict) else None
+    if not isinstance(scope, dict):
+        return None
+    out = _empty_scope()
+    out["all_computers"] = _truthy(scope.get("all_computers"))
+    for key, path, inner in SCOPE_JSON_FIELDS:
+        node: Any = scope
+        for part in path:
+            node = node.get(part) if isinstance(node, dict) else None
+        out[key] = _scope_ids(node, inner)
+    return out
+
+def fetch_policy_scope(j, pid: int, raw_detail: Any) -> Dict[str, Any]:
+    # Single request when the JSON detail carries scope; XML subset only as fallback
+    sc = parse_scope_json(raw_detail)
+    if sc is None:
+        rx = j.get(f"/JSSResource/policies/id/{pid}/subset/Scope", accept="application/xml")
+        sc = parse_scope_subset(rx.text)
+    return sc
+
 # ---------------------- Policy refs & trigger checks -----------------
 
 def _to_int(val):
@@ -295,6 +660,7 @@ def _to_int(val):
     except Exception: return None
 
 def _walk(obj: Any, path: Tuple[str, ...]=()) -> List[Tuple[Tuple[str,...], Any]]:
+    # reference (materializing) traversal; kept for the --self-test parity check and --benchmark
     out = []
     if isinstance(obj, dict):
         out.append((path, obj))
@@ -308,7 +674,7 @@ def _walk(obj: Any, path: Tuple[str, ...]=()) -> List[Tuple[Tuple[str,...], Any]
         out.append((path, obj))
     return out
 
-def collect_policy_refs_from_json(raw_detail: Any) -> Tuple[Set[int], Set[int]]:
+def _collect_policy_refs_walk(raw_detail: Any) -> Tuple[Set[int], Set[int]]:
     s_ids: Set[int] = set()
     p_ids: Set[int] = set()
     for path, node in _walk(raw_detail):
@@ -330,6 +696,59 @@ def collect_policy_refs_from_json(raw_detail: Any) -> Tuple[Set[int], Set[int]]:
                 if is_pkg_ctx:   p_ids.add(vid)
     return s_ids, p_ids
 
+# key -> (adds script ctx, adds package ctx); policy payloads reuse a small set of keys
+_KEY_CTX: Dict[Any, Tuple[bool, bool]] = {}
+
+def _key_ctx(k) -> Tuple[bool, bool]:
+    ctx = _KEY_CTX.get(k)
+    if ctx is None:
+        low = str(k).lower()
+        ctx = ("script" in low, "package" in low)
+        if len(_KEY_CTX) < 4096:
+            _KEY_CTX[k] = ctx
+    return ctx
+
+def iter_policy_refs(raw_detail: Any):
+    """Yield (id, in_script_ctx, in_package_ctx) for every id-like node under a script/package key.
+
+    Context flags are inherited down the traversal instead of being recomputed
+    from the full path, and an explicit stack avoids per-level path copies and
+    nested-generator overhead. Same matching rules as the reference _walk scan.
+    """
+    stack: List[Tuple[Any, bool, bool]] = [(raw_detail, False, False)]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node, in_s, in_p = pop()
+        if isinstance(node, dict):
+            if (in_s or in_p) and "id" in node:
+                vid = _to_int(node.get("id"))
+                if vid is not None:
+                    yield vid, in_s, in_p
+            for k, v in node.items():
+                ks, kp = _key_ctx(k)
+                cs, cp = in_s or ks, in_p or kp
+                if cs or cp or isinstance(v, (dict, list)):
+                    push((v, cs, cp))
+        elif isinstance(node, list):
+            for v in node:
+                if in_s or in_p or isinstance(v, (dict, list)):
+                    push((v, in_s, in_p))
+        elif in_s or in_p:
+            if isinstance(node, int):
+                yield node, in_s, in_p
+            elif isinstance(node, str):
+                vid = _to_int(node)
+                if vid is not None:
+                    yield vid, in_s, in_p
+
+def collect_policy_refs_from_json(raw_detail: Any) -> Tuple[Set[int], Set[int]]:
+    s_ids: Set[int] = set()
+    p_ids: Set[int] = set()
+    for vid, in_s, in_p in iter_policy_refs(raw_detail):
+        if in_s: s_ids.add(vid)
+        if in_p: p_ids.add(vid)
+    return s_ids, p_ids
+
 def _truthy(v) -> bool:
     if isinstance(v, bool): return v
     if isinstance(v, (int, float)): return v != 0
@@ -357,15 +776,15 @@ def extract_policy_flags(raw_detail: Dict[str, Any]) -> Dict[str, Any]:
     # Enabled flag
     enabled = _truthy(general.get("enabled"))
 
-    # Any triggers?
-    any_trigger = False
+    # Which triggers?
+    triggers = []
     for k in TRIGGER_KEYS:
         val = general.get(k)
         if val is None and k == "custom_triggers":
             val = general.get("other_triggers") or general.get("other_trigger")
         if _truthy(val):
-            any_trigger = True
-            break
+            triggers.append(k)
+    any_trigger = bool(triggers)
 
     # SS enabled?
     ss_enabled = _truthy(self_service.get("use_for_self_service"))
@@ -376,37 +795,320 @@ def extract_policy_flags(raw_detail: Dict[str, Any]) -> Dict[str, Any]:
         "self_service_enabled": ss_enabled,
         "name": general.get("name"),
         "frequency": general.get("frequency"),
+        "triggers": triggers,
     }
 
-# ----------------------------- Movers --------------------------------
+# ----------------------------- Detail cache --------------------------
 
-def move_policy_to_category(j, policy_id: int, category: str):
-    payload = f"<policy><general><category><name>{category}</name></category></general></policy>"
-    j.put_xml(f"/JSSResource/policies/id/{policy_id}", payload)
-    print(f"[moved] Policy {policy_id} -> {category}")
+# bump when a derive_* function changes shape, so cached facts are re-derived
+FACTS_VERSION = 3
 
-def move_profile_to_category(j, profile_id: int, category: str):
-    payload = f"<os_x_configuration_profile><general><category><name>{category}</name></category></general></os_x_configuration_profile>"
-    j.put_xml(f"/JSSResource/osxconfigurationprofiles/id/{profile_id}", payload)
-    print(f"[moved] Profile {profile_id} -> {category}")
+class DetailCache:
+    """Opt-in on-disk cache of detail responses plus the facts derived from them.
 
-def move_script_to_category(j, script_id: int, category: str):
-    try:
-        payload = f"<script><category><name>{category}</name></category></script>"
-        j.put_xml(f"/JSSResource/scripts/id/{script_id}", payload)
-    except Exception:
-        payload = f"<script><category_name>{category}</category_name></script>"
-        j.put_xml(f"/JSSResource/scripts/id/{script_id}", payload)
-    print(f"[moved] Script {script_id} -> {category}")
+    One JSON file per object under <cache_dir>/<kind>/<id>.json holding the raw
+    body, its sha256, the server's ETag/Last-Modified and the derived facts.
+    Entries are revalidated every run: a conditional GET when validators exist
+    (304 → cached facts), otherwise the body is refetched and its hash compared.
+    Entries older than max_age are ignored; file mtime doubles as the LRU clock
+    and prune() evicts least-recently-used entries down to max_bytes.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024,
+                 max_age: float = 7 * 86400, refresh: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.refresh = refresh
+        self.stats = {"not_modified": 0, "hash_hits": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, kind: str, oid: int) -> str:
+        return os.path.join(self.cache_dir, kind, f"{int(oid)}.json")
+
+    def _bump(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def lookup(self, kind: str, oid: int) -> Optional[Dict[str, Any]]:
+        if self.refresh:
+            return None
+        path = self._path(kind, oid)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("stored_at", 0) > self.max_age or entry.get("facts_version") != FACTS_VERSION:
+            return None
+        return entry
+
+    def store(self, kind: str, oid: int, resp: requests.Response, body: str, content_hash: str, facts: Any):
+        path = self._path(kind, oid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "stored_at": time.time(),
+            "facts_version": FACTS_VERSION,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "body": body,
+            "facts": facts,
+        }
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def touch(self, kind: str, oid: int):
+        try: os.utime(self._path(kind, oid))
+        except OSError: pass
 
-def move_package_to_category(j, package_id: int, category: str):
+    def prune(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for fn in files:
+                fp = os.path.join(root, fn)
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fp))
+        total = sum(e[1] for e in entries)
+        for _, size, fp in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fp); total -= size; self.stats["evicted"] += 1
+            except OSError:
+                pass
+
+def fetch_detail_facts(j, cache: Optional[DetailCache], kind: str, oid: int, path: str, derive, accept: Optional[str]=None):
+    """GET a detail object and return derive(body); reuses cached facts when the object is unchanged."""
+    if cache is None:
+        return derive(j.get(path, accept=accept).text)
+    entry = cache.lookup(kind, oid)
+    headers = {}
+    if entry:
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+    r = j.get(path, accept=accept, headers=headers)
+    if r.status_code == 304 and entry:
+        cache._bump("not_modified"); cache.touch(kind, oid)
+        return entry["facts"]
+    body = r.text
+    content_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    if entry and entry.get("content_hash") == content_hash:
+        cache._bump("hash_hits")
+        facts = entry["facts"]
+    else:
+        cache._bump("misses")
+        facts = derive(body)
+    cache.store(kind, oid, r, body, content_hash, facts)
+    return facts
+
+def derive_policy_facts(j, pid: int, body: str, fallback_name: str = "") -> Dict[str, Any]:
+    try: raw = json.loads(body) or {}
+    except ValueError: raw = {}
+    sc = fetch_policy_scope(j, pid, raw)
+    s_ids, p_ids = collect_policy_refs_from_json(raw)
+    flags = extract_policy_flags(raw)
+    name = fallback_name
     try:
-        payload = f"<package><category><name>{category}</name></category></package>"
-        j.put_xml(f"/JSSResource/packages/id/{package_id}", payload)
+        name = (raw.get("policy", raw).get("general", {}) or {}).get("name", name)
     except Exception:
-        payload = f"<package><category>{category}</category></package>"
-        j.put_xml(f"/JSSResource/packages/id/{package_id}", payload)
-    print(f"[moved] Package {package_id} -> {category}")
+        pass
+    return {"scope": sc, "scripts": sorted(s_ids), "packages": sorted(p_ids), "flags": flags, "name": name}
+
+# ----------------------------- Movers --------------------------------
+
+# object type -> (label, detail path, JSON root key, category payload shapes in preference order)
+ARCHIVE_TARGETS: Dict[str, Tuple[str, str, str, Tuple[str, ...]]] = {
+    "policy":  ("Policy", "/JSSResource/policies/id/{id}", "policy",
+                ("<policy><general><category><name>{cat}</name></category></general></policy>",)),
+    "profile": ("Profile", "/JSSResource/osxconfigurationprofiles/id/{id}", "os_x_configuration_profile",
+                ("<os_x_configuration_profile><general><category><name>{cat}</name></category></general></os_x_configuration_profile>",)),
+    "script":  ("Script", "/JSSResource/scripts/id/{id}", "script",
+                ("<script><category><name>{cat}</name></category></script>",
+                 "<script><category_name>{cat}</category_name></script>")),
+    "package": ("Package", "/JSSResource/packages/id/{id}", "package",
+                ("<package><category><name>{cat}</name></category></package>",
+                 "<package><category>{cat}</category></package>")),
+}
+
+# report key -> object type it archives
+ARCHIVE_REPORTS = {
+    "unscoped_policies": "policy", "unscoped_profiles": "profile",
+    "unused_scripts": "script", "unused_packages": "package",
+}
+
+# a failed fetch in these units makes objects look unscoped/unused, so archive moves are not applied
+ARCHIVE_BLOCKING_UNITS = {"policy_detail": "policies", "profile_scope": "profiles"}
+
+# statuses that mean "this payload shape was rejected", as opposed to throttling/auth
+SHAPE_REJECT_STATUSES = (400, 409, 415, 422)
+
+class PayloadShapes:
+    """Remembers, per object type, which category payload shape the server accepted."""
+    def __init__(self):
+        self._known: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def order(self, kind: str) -> List[int]:
+        n = len(ARCHIVE_TARGETS[kind][3])
+        with self._lock:
+            first = self._known.get(kind)
+        return list(range(n)) if first is None else [first] + [i for i in range(n) if i != first]
+
+    def worked(self, kind: str, idx: int):
+        with self._lock:
+            self._known[kind] = idx
+
+class RateLimiter:
+    """Thread-safe fixed-interval limiter (at most `rate` calls per second across threads)."""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def move_object_to_category(j, kind: str, oid: int, category: str, shapes: Optional[PayloadShapes]=None,
+                            limiter: Optional[RateLimiter]=None) -> int:
+    """PUT the category change, trying the remembered payload shape first. Returns the shape index used."""
+    label, path, _, payloads = ARCHIVE_TARGETS[kind]
+    order = shapes.order(kind) if shapes else list(range(len(payloads)))
+    cat = xml_escape(category)
+    for n, idx in enumerate(order):
+        if limiter: limiter.acquire()
+        try:
+            j.put_xml(path.format(id=oid), payloads[idx].format(cat=cat))
+        except requests.HTTPError as e:
+            if _http_status(e) in SHAPE_REJECT_STATUSES and n + 1 < len(order):
+                continue
+            raise
+        if shapes: shapes.worked(kind, idx)
+        print(f"[moved] {label} {oid} -> {category}")
+        return idx
+    raise RuntimeError(f"no payload shape accepted for {kind} {oid}")
+
+def extract_category(kind: str, raw: Any) -> str:
+    root = raw.get(ARCHIVE_TARGETS[kind][2], raw) if isinstance(raw, dict) else {}
+    if not isinstance(root, dict):
+        return ""
+    cat = (root.get("general") or {}).get("category") if kind in ("policy", "profile") else root.get("category")
+    if isinstance(cat, dict):
+        cat = cat.get("name")
+    return str(cat or "")
+
+def build_archive_plan(j, reports: Dict[str, List[Dict[str, Any]]], category: str, sched: FetchScheduler,
+                       fetch_failures: Optional[Dict[str, List[int]]] = None) -> Dict[str, Any]:
+    """Intended moves for the archive-candidate reports, with each object's current category.
+
+    When a policy or profile detail fetch failed, the plan is marked blocked:
+    an object only that policy/profile uses would otherwise look unused.
+    """
+    items = [(kind, row) for rep, kind in ARCHIVE_REPORTS.items() for row in reports.get(rep, [])]
+    def fetch_category(item):
+        kind, row = item
+        return extract_category(kind, jload(j.get(ARCHIVE_TARGETS[kind][1].format(id=row["id"]))) or {})
+    results, failures = sched.run(items, fetch_category, label="category")
+    original = {(kind, row["id"]): cat for (kind, row), cat in results}
+    for (kind, row), e in failures:
+        print(f"[warn] {kind} {row['id']} category lookup failed; left out of plan: {e}", file=sys.stderr)
+    moves = [{"type": kind, "id": row["id"], "name": row.get("name", ""),
+              "original_category": original[(kind, row["id"])], "target_category": category}
+             for kind, row in items
+             if (kind, row["id"]) in original and original[(kind, row["id"])] != category]
+    plan = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "jamf_url": j.base_url, "archive_category": category, "moves": moves}
+    incomplete = {u: ids for u, ids in (fetch_failures or {}).items() if u in ARCHIVE_BLOCKING_UNITS and ids}
+    if incomplete:
+        plan["incomplete_fetches"] = incomplete
+        plan["blocked"] = ("detail fetch failed for " +
+                           ", ".join(f"{ARCHIVE_BLOCKING_UNITS[u]} (ids {', '.join(map(str, ids[:10]))}"
+                                     f"{', ...' if len(ids) > 10 else ''})" for u, ids in incomplete.items()) +
+                           "; their scripts, packages and scope are unknown, so the moves are not applied")
+    return plan
+
+class MoveJournal:
+    """Append-only JSONL record of applied category changes (one fsync'd line per move)."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, record: Dict[str, Any]):
+        line = json.dumps({"ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), **record}) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line); f.flush(); os.fsync(f.fileno())
+
+    @staticmethod
+    def read(path: str) -> List[Dict[str, Any]]:
+        out = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try: out.append(json.loads(line))
+                    except ValueError: print(f"[warn] skipping unreadable journal line: {line[:80]}", file=sys.stderr)
+        return out
+
+def apply_moves(j, moves: List[Dict[str, Any]], journal: MoveJournal, sched: FetchScheduler,
+                limiter: RateLimiter, action: str = "move") -> Tuple[int, int]:
+    """Apply {type,id,name,from,to} moves concurrently under the rate limit; journal every outcome.
+
+    Each outcome is journaled as soon as it is known, so an interrupted apply
+    still leaves every category change it made on disk for --undo-journal.
+    """
+    shapes = PayloadShapes()
+    def record(m, status, **outcome):
+        journal.append({"action": action, "status": status, "type": m["type"], "id": m["id"], "name": m.get("name", ""),
+                        "from_category": m["from"], "to_category": m["to"], **outcome})
+    def do_move(m):
+        idx = move_object_to_category(j, m["type"], m["id"], m["to"], shapes, limiter)
+        record(m, "ok", shape=idx)
+        return idx
+    def failed(m, e):
+        print(f"[error] {action} {m['type']} {m['id']} failed: {e}", file=sys.stderr)
+        record(m, "failed", error=str(e)[:300])
+    results, failures = sched.run(moves, do_move, label="move", on_failure=failed)
+    return len(results), len(failures)
+
+def plan_to_moves(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"type": m["type"], "id": int(m["id"]), "name": m.get("name", ""),
+             "from": m.get("original_category", ""), "to": m.get("target_category") or plan["archive_category"]}
+            for m in plan.get("moves", []) if m.get("type") in ARCHIVE_TARGETS]
+
+def undo_moves_from_journal(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Restore moves: back to the category each object had before its first journaled move."""
+    first_from: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    last: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for r in records:
+        if r.get("status") != "ok":
+            continue
+        key = (r["type"], int(r["id"]))
+        if r.get("action") == "move" and key not in first_from:
+            first_from[key] = r
+        last[key] = r
+    moves = []
+    for key, r in first_from.items():
+        if last[key].get("action") == "restore":
+            continue
+        if not r.get("from_category"):
+            print(f"[warn] {key[0]} {key[1]} had no recorded category; not restored", file=sys.stderr)
+            continue
+        moves.append({"type": key[0], "id": key[1], "name": r.get("name", ""),
+                      "from": last[key].get("to_category", ""), "to": r["from_category"]})
+    return moves
 
 # ----------------------------- Main ----------------------------------
 
@@ -418,10 +1120,1552 @@ def j_is_scoped(sc: Dict[str, Any]) -> bool:
                 sc.get("targets_buildings") or sc.get("targets_departments") or
                 sc.get("excl_groups") or sc.get("excl_computers"))
 
+# ----------------------------- Effective scope -----------------------
+
+def derive_group_facts(body: str) -> Dict[str, Any]:
+    """Member computer ids and full criteria rows from a /computergroups/id/N JSON detail."""
+    try: raw = json.loads(body) or {}
+    except ValueError: raw = {}
+    root = raw.get("computer_group", raw) if isinstance(raw, dict) else {}
+    criteria = root.get("criteria") or []
+    if isinstance(criteria, dict):
+        criteria = criteria.get("criterion", [])
+        criteria = [criteria] if isinstance(criteria, dict) else criteria
+    return {
+        "is_smart": _truthy(root.get("is_smart")),
+        "members": sorted(set(_scope_ids(root.get("computers") or [], "computer"))),
+        "criteria": [{k: c.get(k) for k in ("name", "priority", "and_or", "search_type", "value",
+                                            "opening_paren", "closing_paren")}
+                     for c in criteria if isinstance(c, dict)],
+    }
+
+def _popcount(bm: int) -> int:
+    return bm.bit_count() if hasattr(bm, "bit_count") else bin(bm).count("1")
+
+class DeviceBitmaps:
+    """Computer-id -> dense bit position; device sets are plain ints used as bitsets."""
+    def __init__(self, computer_ids):
+        self.ids: List[int] = sorted(set(computer_ids))
+        self.pos: Dict[int, int] = {cid: i for i, cid in enumerate(self.ids)}
+        self.all = (1 << len(self.ids)) - 1
+
+    def of(self, ids) -> int:
+        buf = bytearray((len(self.ids) + 7) // 8)
+        pos = self.pos
+        for cid in ids:
+            i = pos.get(cid)
+            if i is not None:
+                buf[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(buf, "little")
+
+class ScopeResolver:
+    """Resolves scope dicts to device bitmaps: (all | groups | computers | buildings | departments) & ~exclusions."""
+    def __init__(self, computers: List[Dict[str, Any]], group_members: Dict[int, List[int]],
+                 buildings: List[Dict[str, Any]] = (), departments: List[Dict[str, Any]] = ()):
+        self.bits = DeviceBitmaps(c["id"] for c in computers)
+        self.groups: Dict[int, int] = {gid: self.bits.of(m) for gid, m in group_members.items()}
+        by_building: Dict[str, List[int]] = {}
+        by_department: Dict[str, List[int]] = {}
+        for c in computers:
+            by_building.setdefault(c.get("building") or "", []).append(c["id"])
+            by_department.setdefault(c.get("department") or "", []).append(c["id"])
+        self.buildings = {b["id"]: self.bits.of(by_building.get(b.get("name") or "", [])) for b in buildings}
+        self.departments = {d["id"]: self.bits.of(by_department.get(d.get("name") or "", [])) for d in departments}
+
+    def _union(self, ids, table: Dict[int, int]) -> Optional[int]:
+        bm = 0
+        for i in ids:
+            if i not in table:
+                return None
+            bm |= table[i]
+        return bm
+
+    def resolve(self, sc: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """(targeted, excluded) bitmaps, or None when a referenced group/building/department is unknown."""
+        parts = [self._union(sc.get("targets_groups", []), self.groups),
+                 self._union(sc.get("targets_buildings", []), self.buildings),
+                 self._union(sc.get("targets_departments", []), self.departments),
+                 self._union(sc.get("excl_groups", []), self.groups)]
+        if any(x is None for x in parts):
+            return None
+        tg, tb, td, eg = parts
+        targeted = self.bits.all if sc.get("all_computers") else (tg | tb | td | self.bits.of(sc.get("targets_computers", [])))
+        return targeted, eg | self.bits.of(sc.get("excl_computers", []))
+
+    def effective(self, sc: Dict[str, Any]) -> Optional[int]:
+        r = self.resolve(sc)
+        return None if r is None else r[0] & ~r[1]
+
+    def effective_count(self, sc: Dict[str, Any]) -> Optional[int]:
+        bm = self.effective(sc)
+        return None if bm is None else _popcount(bm)
+
+def zero_effective_rows(objects: List[Dict[str, Any]], scopes: Dict[int, Dict[str, Any]],
+                        resolver: ScopeResolver) -> List[Dict[str, Any]]:
+    """Scoped objects whose targets minus exclusions reach no device."""
+    rows = []
+    for o in objects:
+        sc = scopes.get(o["id"])
+        if not sc or not j_is_scoped(sc):
+            continue  # already reported as unscoped
+        r = resolver.resolve(sc)
+        if r is None:
+            continue  # membership unknown for a referenced group; don't guess
+        targeted, excluded = r
+        if targeted & ~excluded:
+            continue
+        n = _popcount(targeted)
+        reason = "targets resolve to 0 devices" if not n else f"exclusions cover all {n} targeted device(s)"
+        rows.append({"id": o["id"], "name": o["name"], "targeted": n, "effective": 0, "reason": reason})
+    return rows
+
+# ----------------------------- Object graph --------------------------
+
+Node = Tuple[str, int]   # (object type, id)
+
+# smart-group criteria that reference another group by name
+GROUP_CRITERIA = ("computer group",)
+
+class ObjectGraph:
+    """Typed dependency graph of Jamf objects with forward and reverse adjacency.
+
+    Edge kinds: policy_script, policy_package, policy_group, profile_group,
+    group_group (a smart group's "Computer Group" criterion). Each edge carries
+    a role (target/exclusion for scopes, the criterion search type for groups).
+    """
+    def __init__(self):
+        self.names: Dict[Node, str] = {}
+        self.out: Dict[Node, Set[Tuple[Node, str, str]]] = {}
+        self.inc: Dict[Node, Set[Tuple[Node, str, str]]] = {}
+
+    def add_node(self, node: Node, name: str = ""):
+        if name or node not in self.names:
+            self.names[node] = name
+
+    def add_edge(self, src: Node, dst: Node, kind: str, role: str = ""):
+        self.out.setdefault(src, set()).add((dst, kind, role))
+        self.inc.setdefault(dst, set()).add((src, kind, role))
+
+    def referrers(self, node: Node) -> Set[Tuple[Node, str, str]]:
+        return self.inc.get(node, set())
+
+    def is_referenced(self, node: Node) -> bool:
+        return bool(self.inc.get(node))
+
+    def transitive_referrers(self, node: Node) -> Dict[Node, int]:
+        """Every object that depends on node directly or through nested groups, with its depth."""
+        depth: Dict[Node, int] = {}
+        frontier, d = [node], 0
+        while frontier:
+            d += 1
+            nxt = []
+            for n in frontier:
+                for src, _, _ in self.inc.get(n, ()):
+                    if src not in depth and src != node:
+                        depth[src] = d
+                        nxt.append(src)
+            frontier = nxt
+        return depth
+
+    def describe(self, node: Node) -> Dict[str, Any]:
+        def ref(n: Node, **extra):
+            return {"type": n[0], "id": n[1], "name": self.names.get(n, ""), **extra}
+        return {**ref(node),
+                "referenced_by": sorted((ref(src, edge=kind, role=role) for src, kind, role in self.referrers(node)),
+                                        key=lambda r: (r["type"], r["id"])),
+                "references": sorted((ref(dst, edge=kind, role=role) for dst, kind, role in self.out.get(node, ())),
+                                     key=lambda r: (r["type"], r["id"])),
+                "dependents": sorted((ref(n, depth=dep) for n, dep in self.transitive_referrers(node).items()),
+                                     key=lambda r: (r["depth"], r["type"], r["id"]))}
+
+    def edges(self):
+        for src, outs in self.out.items():
+            for dst, kind, role in outs:
+                yield src, dst, kind, role
+
+    def to_json(self) -> Dict[str, Any]:
+        nodes = sorted(set(self.names) | set(self.out) | set(self.inc))
+        return {"nodes": [{"key": f"{t}:{i}", "type": t, "id": i, "name": self.names.get((t, i), "")} for t, i in nodes],
+                "edges": sorted(({"source": f"{a[0]}:{a[1]}", "target": f"{b[0]}:{b[1]}", "kind": k, "role": r}
+                                 for a, b, k, r in self.edges()), key=lambda e: (e["source"], e["target"], e["kind"]))}
+
+    def write_graphml(self, fh):
+        g = self.to_json()
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                 '  <key id="type" for="node" attr.name="type" attr.type="string"/>\n'
+                 '  <key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+                 '  <key id="kind" for="edge" attr.name="kind" attr.type="string"/>\n'
+                 '  <key id="role" for="edge" attr.name="role" attr.type="string"/>\n'
+                 '  <graph id="jamf" edgedefault="directed">\n')
+        for n in g["nodes"]:
+            fh.write(f'    <node id="{xml_escape(n["key"])}"><data key="type">{n["type"]}</data>'
+                     f'<data key="name">{xml_escape(n["name"] or "")}</data></node>\n')
+        for e in g["edges"]:
+            fh.write(f'    <edge source="{xml_escape(e["source"])}" target="{xml_escape(e["target"])}">'
+                     f'<data key="kind">{e["kind"]}</data><data key="role">{xml_escape(e["role"] or "")}</data></edge>\n')
+        fh.write("  </graph>\n</graphml>\n")
+
+def build_object_graph(data: Dict[str, Any]) -> ObjectGraph:
+    """One graph per run from whatever the planner fetched; reports and --why-* queries share it."""
+    g = ObjectGraph()
+    for kind, key in (("policy", "policies"), ("profile", "profiles"), ("script", "scripts"),
+                      ("package", "packages"), ("group", "groups")):
+        for o in data[key]:
+            g.add_node((kind, o["id"]), o.get("name", ""))
+
+    def scope_edges(src: Node, sc: Dict[str, Any], kind: str):
+        for gid in sc.get("targets_groups", []): g.add_edge(src, ("group", gid), kind, "target")
+        for gid in sc.get("excl_groups", []):    g.add_edge(src, ("group", gid), kind, "exclusion")
+
+    for pid, sc in data["policies_scopes"].items():
+        scope_edges(("policy", pid), sc, "policy_group")
+    for pid, ids in data["policy_scripts"].items():
+        for sid in ids: g.add_edge(("policy", pid), ("script", sid), "policy_script")
+    for pid, ids in data["policy_packages"].items():
+        for kid in ids: g.add_edge(("policy", pid), ("package", kid), "policy_package")
+    for cid, sc in data["profiles_scopes"].items():
+        scope_edges(("profile", cid), sc, "profile_group")
+
+    group_ids_by_name = {gr.get("name"): gr["id"] for gr in data["groups"]}
+    for gid, facts in data["group_facts"].items():
+        for c in facts.get("criteria", []):
+            if str(c.get("name") or "").strip().lower() in GROUP_CRITERIA:
+                ref = group_ids_by_name.get(c.get("value"))
+                if ref is not None:
+                    g.add_edge(("group", gid), ("group", ref), "group_group", str(c.get("search_type") or ""))
+    return g
+
+# ----------------------------- Report planning -----------------------
+
+# report key -> (table title, data it needs). Order here is output order.
+REPORTS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "unscoped_policies":  ("Unscoped Policies", ("policy_detail",)),
+    "unscoped_profiles":  ("Unscoped macOS Configuration Profiles", ("profile_scope",)),
+    "unused_scripts":     ("Unused Scripts", ("scripts", "policy_detail")),
+    "unused_packages":    ("Unused Packages", ("packages", "policy_detail")),
+    "unused_groups":      ("Unused Computer Groups", ("groups", "policy_detail", "profile_scope", "group_detail")),
+    "policies_no_triggers_and_not_selfservice": ("Policies with NO Triggers AND NOT Self Service", ("policy_detail",)),
+    "active_policies_selfservice_enabled":      ("Active Policies with Self Service enabled", ("policy_detail",)),
+    "zero_effective_scope_policies": ("Scoped Policies reaching 0 devices (targets minus exclusions)", ("policy_detail", "group_membership")),
+    "zero_effective_scope_profiles": ("Scoped Profiles reaching 0 devices (targets minus exclusions)", ("profile_scope", "group_membership")),
+    "duplicate_packages": ("Duplicate Packages (by hash), ranked by wasted bytes", ("package_detail", "policy_detail")),
+    "duplicate_scripts":  ("Duplicate Scripts (exact and near), ranked by wasted bytes", ("script_detail", "policy_detail")),
+    "stale_policies":     ("Scoped Policies with no runs in the history window", ("policy_detail", "policy_history")),
+    "policy_load":        ("Estimated Policy Load per day (heaviest first)", ("policy_detail", "group_membership", "package_detail")),
+    "redundant_package_delivery": ("Packages delivered by overlapping policy scopes", ("policy_detail", "group_membership", "package_detail")),
+}
+
+# reports run when --reports is not given (the rest are opt-in: they need extra fetches)
+# reports that make one request per computer: only run when named explicitly
+FLEET_SCAN_REPORTS = ("stale_policies",)
+
+DEFAULT_REPORTS = [
+    "unscoped_policies", "unscoped_profiles", "unused_scripts", "unused_packages", "unused_groups",
+    "policies_no_triggers_and_not_selfservice", "active_policies_selfservice_enabled",
+]
+
+# data unit -> data units it is derived from
+DATA_DEPS: Dict[str, Tuple[str, ...]] = {
+    "policy_detail": ("policies",),
+    "profile_scope": ("profiles",),
+    "group_detail": ("groups",),
+    "package_detail": ("packages",),
+    "script_detail": ("scripts",),
+    "policy_history": ("computers",),
+    "group_membership": ("group_detail", "computers", "buildings", "departments"),
+}
+
+# data every reverse-reference query (--why-script/--why-package/--why-group, --graph-out) needs
+GRAPH_UNITS = ("scripts", "packages", "policy_detail", "profile_scope", "group_detail")
+
+LISTERS = {
+    "policies": list_policies, "profiles": list_profiles, "scripts": list_scripts,
+    "packages": list_packages, "groups": list_groups, "computers": list_computers,
+    "buildings": list_buildings, "departments": list_departments,
+}
+
+def plan_fetch(report_names, extra_units=()) -> Set[str]:
+    """Minimal set of data units (lists + detail phases) the selected reports depend on."""
+    needs: Set[str] = set()
+    todo = [dep for name in report_names for dep in REPORTS[name][1]] + list(extra_units)
+    while todo:
+        unit = todo.pop()
+        if unit not in needs:
+            needs.add(unit)
+            todo.extend(DATA_DEPS.get(unit, ()))
+    return needs
+
+def parse_report_selection(value: Optional[str]) -> List[str]:
+    if not value:
+        return list(DEFAULT_REPORTS)
+    if value.strip().lower() == "all":
+        return [r for r in REPORTS if r not in FLEET_SCAN_REPORTS]
+    picked = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [v for v in picked if v not in REPORTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown report(s): {', '.join(unknown)} (choose from: {', '.join(REPORTS)})")
+    return [r for r in REPORTS if r in picked]
+
+def collect_audit_data(j, needs: Set[str], sched: "FetchScheduler", cache: Optional[DetailCache]=None,
+                       debug=False, history_days: float = 90, checkin_minutes: float = 15) -> Dict[str, Any]:
+    """Fetch only the planned data units. Unfetched lists are left as empty lists."""
+    data: Dict[str, Any] = {k: (LISTERS[k](j, debug) if k in needs else []) for k in LISTERS}
+    data.update({"fetched": needs, "policies_scopes": {}, "policy_flags": {}, "policy_names": {},
+                 "policy_scripts": {}, "policy_packages": {}, "profiles_scopes": {}, "group_facts": {},
+                 "package_facts": {}, "script_facts": {}, "checkin_minutes": checkin_minutes,
+                 "fetch_failures": {}})
+
+    def fetch_policy_info(p):
+        pid = p["id"]
+        facts = fetch_detail_facts(j, cache, "policy", pid, f"/JSSResource/policies/id/{pid}",
+                                   lambda body: derive_policy_facts(j, pid, body, p["name"]))
+        return pid, facts["scope"], set(facts["scripts"]), set(facts["packages"]), facts["flags"], facts["name"]
+
+    def fetch_profile_scope(p):
+        cid = p["id"]
+        sc = fetch_detail_facts(j, cache, "profile_scope", cid, f"/JSSResource/osxconfigurationprofiles/id/{cid}/subset/Scope",
+                                parse_scope_subset, accept="application/xml")
+        return cid, sc
+
+    if "policy_detail" in needs:
+        results, failures = sched.run(data["policies"], fetch_policy_info, label="policy")
+        for _, (pid, sc, s_ids, p_ids, flags, pname) in results:
+            data["policies_scopes"][pid] = Scope(sc)
+            data["policy_flags"][pid] = PolicyFlags(flags)
+            data["policy_names"][pid] = pname
+            data["policy_scripts"][pid] = tuple(sorted(set(int(x) for x in s_ids)))
+            data["policy_packages"][pid] = tuple(sorted(set(int(x) for x in p_ids)))
+        for p, e in failures:
+            print(f"[warn] policy {p['id']} detail failed: {e}", file=sys.stderr)
+        if failures:
+            data["fetch_failures"]["policy_detail"] = sorted(p["id"] for p, _ in failures)
+
+    if "profile_scope" in needs:
+        results, failures = sched.run(data["profiles"], fetch_profile_scope, label="profile")
+        for _, (cid, sc) in results:
+            data["profiles_scopes"][cid] = Scope(sc)
+        for p, e in failures:
+            print(f"[warn] profile {p['id']} detail failed: {e}", file=sys.stderr)
+        if failures:
+            data["fetch_failures"]["profile_scope"] = sorted(p["id"] for p, _ in failures)
+
+    if "group_detail" in needs:
+        def fetch_group(g):
+            gid = g["id"]
+            return gid, fetch_detail_facts(j, cache, "group", gid, f"/JSSResource/computergroups/id/{gid}", derive_group_facts)
+        results, failures = sched.run(data["groups"], fetch_group, label="group")
+        for _, (gid, facts) in results:
+            data["group_facts"][gid] = {**facts, "members": pack_ids(facts.get("members"))}
+        for g, e in failures:
+            print(f"[warn] group {g['id']} detail failed: {e}", file=sys.stderr)
+
+    for unit, key, kind, fetch_facts in (
+            ("package_detail", "packages", "package", fetch_package_facts),
+            ("script_detail", "scripts", "script",
+             lambda j, cache, sid: fetch_detail_facts(j, cache, "script", sid, f"/JSSResource/scripts/id/{sid}",
+                                                      derive_script_facts))):
+        if unit not in needs:
+            continue
+        def fetch_detail(o, fetch_facts=fetch_facts):
+            return o["id"], fetch_facts(j, cache, o["id"])
+        results, failures = sched.run(data[key], fetch_detail, label=kind)
+        for _, (oid, facts) in results:
+            data[f"{kind}_facts"][oid] = facts
+        for o, e in failures:
+            print(f"[warn] {kind} {o['id']} detail failed: {e}", file=sys.stderr)
+
+    if "policy_history" in needs:
+        data["history_days"] = history_days
+        data["policy_runs"] = scan_policy_history(j, data["computers"], sched, history_days)
+
+    if "group_membership" in needs:
+        data["scope_resolver"] = ScopeResolver(
+            data["computers"], {gid: f["members"] for gid, f in data["group_facts"].items()},
+            data["buildings"], data["departments"])
+    return data
+
+def compute_reports(data: Dict[str, Any], selected: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    return dict(iter_reports(data, selected))
+
+def iter_reports(data: Dict[str, Any], selected: List[str]):
+    """Yield (report key, rows) one section at a time, in REPORTS order."""
+    policy_flags = data["policy_flags"]
+    policy_names = data["policy_names"]
+    graph = data.get("graph") or build_object_graph(data)
+    data["graph"] = graph
+    # listing order, not fetch-completion order, so output is stable run to run
+    policy_order = [p["id"] for p in data["policies"] if p["id"] in policy_flags]
+
+    def flag_row(pid):
+        return {"id": pid, "name": policy_names.get(pid, ""), "frequency": policy_flags[pid].get("frequency")}
+
+    builders = {
+        "unscoped_policies": lambda: [{"id": p["id"], "name": p["name"]} for p in data["policies"]
+                                      if not j_is_scoped(data["policies_scopes"].get(p["id"], {}))],
+        "unscoped_profiles": lambda: [{"id": p["id"], "name": p["name"]} for p in data["profiles"]
+                                      if not j_is_scoped(data["profiles_scopes"].get(p["id"], {}))],
+        "unused_scripts":  lambda: [{"id": x.get("id"), "name": x.get("name")} for x in data["scripts"]
+                                    if not graph.is_referenced(("script", x.get("id")))],
+        "unused_packages": lambda: [{"id": x.get("id"), "name": x.get("name")} for x in data["packages"]
+                                    if not graph.is_referenced(("package", x.get("id")))],
+        # groups referenced only through another smart group's "Computer Group" criterion count as used
+        "unused_groups":   lambda: [{"id": g.get("id"), "name": g.get("name"), "is_smart": g.get("is_smart")}
+                                    for g in data["groups"] if not graph.is_referenced(("group", g.get("id")))],
+        "policies_no_triggers_and_not_selfservice": lambda: [
+            flag_row(pid) for pid in policy_order
+            if (not policy_flags[pid].get("any_trigger", False)) and (not policy_flags[pid].get("self_service_enabled", False))],
+        "active_policies_selfservice_enabled": lambda: [
+            flag_row(pid) for pid in policy_order
+            if policy_flags[pid].get("enabled", False) and policy_flags[pid].get("self_service_enabled", False)],
+        "zero_effective_scope_policies": lambda: zero_effective_rows(
+            data["policies"], data["policies_scopes"], data["scope_resolver"]),
+        "zero_effective_scope_profiles": lambda: zero_effective_rows(
+            data["profiles"], data["profiles_scopes"], data["scope_resolver"]),
+        "duplicate_packages": lambda: duplicate_package_rows(data, graph),
+        "duplicate_scripts":  lambda: duplicate_script_rows(data, graph),
+        "policy_load": lambda: policy_load_rows(data, data["checkin_minutes"]),
+        "redundant_package_delivery": lambda: redundant_delivery_rows(data),
+        "stale_policies": lambda: stale_policy_rows(
+            data["policies"], data["policies_scopes"], policy_flags, data["policy_runs"], data["history_days"]),
+    }
+    for name in selected:
+        yield name, builders[name]()
+
+def audit_stats(data: Dict[str, Any]) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {f"{k}_total": len(data[k]) for k in LISTERS if k in data["fetched"]}
+    if "policy_runs" in data:
+        stats["history_scan"] = data["policy_runs"].summary()
+    return stats
+
+# ----------------------------- Output --------------------------------
+
+def open_output(path: Optional[str], compress: bool = False):
+    """Text handle for path (gzip when compress or *.gz); stdout when no path."""
+    if not path:
+        return sys.stdout
+    if compress or path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+class JsonlWriter:
+    """One compact JSON record per line, flushed per section so consumers can ingest incrementally."""
+    def __init__(self, fh):
+        self.fh = fh
+        self.counts: Dict[str, int] = {}
+
+    def write(self, record: Dict[str, Any]):
+        self.fh.write(json.dumps(record, separators=(",", ":"), default=str))
+        self.fh.write("\n")
+
+    def section(self, report: str, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self.write({"record": "finding", "report": report, **row})
+        self.counts[report] = len(rows)
+        self.fh.flush()
+
+    def close(self):
+        self.write({"record": "summary", "counts": self.counts})
+        self.fh.flush()
+        if self.fh is not sys.stdout:
+            self.fh.close()
+
+# ----------------------------- Drift comparison ----------------------
+
+# type -> (lister key, detail path, JSON root key). The lister key doubles as the section title.
+COMPARE_TYPES: Dict[str, Tuple[str, str, str]] = {
+    "policy":  ("policies", "/JSSResource/policies/id/{id}", "policy"),
+    "profile": ("profiles", "/JSSResource/osxconfigurationprofiles/id/{id}", "os_x_configuration_profile"),
+    "script":  ("scripts", "/JSSResource/scripts/id/{id}", "script"),
+    "package": ("packages", "/JSSResource/packages/id/{id}", "package"),
+    "group":   ("groups", "/JSSResource/computergroups/id/{id}", "computer_group"),
+}
+
+# per-instance values that never mean configuration drift
+DRIFT_IGNORED_KEYS = {"id", "uuid", "udid", "mac_address", "alt_mac_address", "serial_number"}
+# top-level keys that hold membership results, not configuration (scope.computers is still compared)
+DRIFT_MEMBERSHIP_KEYS = {"computer_group": ("computers",)}
+_PAYLOAD_UUID = re.compile(r"(<key>PayloadUUID</key>\s*<string>)[^<]*(</string>)")
+
+def normalize_for_compare(obj: Any) -> Any:
+    """Instance-independent form of a detail payload: ids dropped, lists order-insensitive."""
+    if isinstance(obj, dict):
+        return {k: normalize_for_compare(v) for k, v in sorted(obj.items()) if k not in DRIFT_IGNORED_KEYS}
+    if isinstance(obj, list):
+        items = [normalize_for_compare(v) for v in obj]
+        return sorted(items, key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(obj, str) and "PayloadUUID" in obj:
+        return _PAYLOAD_UUID.sub(r"\1\2", obj)
+    return obj
+
+def derive_compare_facts(root_key: str, body: str) -> Dict[str, Any]:
+    try: raw = json.loads(body) or {}
+    except ValueError: raw = {}
+    root = raw.get(root_key, raw) if isinstance(raw, dict) else raw
+    if isinstance(root, dict):
+        root = {k: v for k, v in root.items() if k not in DRIFT_MEMBERSHIP_KEYS.get(root_key, ())}
+    norm = normalize_for_compare(root)
+    canon = json.dumps(norm, sort_keys=True, separators=(",", ":"))
+    return {"hash": hashlib.sha256(canon.encode("utf-8")).hexdigest(), "norm": norm}
+
+def _flatten(obj: Any, prefix: str = "") -> Dict[str, Any]:
+    if isinstance(obj, dict) and obj:
+        out: Dict[str, Any] = {}
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+        return out
+    if isinstance(obj, list) and obj:
+        out = {}
+        for i, v in enumerate(obj):
+            out.update(_flatten(v, f"{prefix}[{i}]"))
+        return out
+    return {prefix: obj}
+
+def field_diffs(left: Any, right: Any, limit: int = 50) -> List[Dict[str, Any]]:
+    a, b = _flatten(left), _flatten(right)
+    diffs = [{"path": k, "left": a.get(k), "right": b.get(k)} for k in sorted(set(a) | set(b)) if a.get(k) != b.get(k)]
+    return diffs[:limit] + ([{"path": "…", "left": None, "right": f"{len(diffs) - limit} more"}] if len(diffs) > limit else [])
+
+def fetch_instance_hashes(j, types: List[str], sched: FetchScheduler, cache: Optional[DetailCache]=None,
+                          debug=False) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """type -> name -> {id, hash, norm}: one list + one detail pass per instance."""
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for kind in types:
+        lister, path, root_key = COMPARE_TYPES[kind]
+        items = LISTERS[lister](j, debug)
+        def fetch(o, path=path, root_key=root_key, kind=kind):
+            return fetch_detail_facts(j, cache, f"compare_{kind}", o["id"], path.format(id=o["id"]),
+                                      lambda body: derive_compare_facts(root_key, body))
+        results, failures = sched.run(items, fetch, label=kind)
+        for o, e in failures:
+            print(f"[warn] {j.base_url}: {kind} {o['id']} detail failed: {e}", file=sys.stderr)
+        by_name: Dict[str, Dict[str, Any]] = {}
+        for o, facts in sorted(results, key=lambda r: r[0]["id"]):
+            key, n = o["name"], 1
+            while key in by_name:   # duplicate names: match them by id order
+                n += 1; key = f"{o['name']} #{n}"
+            by_name[key] = {"id": o["id"], **facts}
+        out[kind] = by_name
+    return out
+
+def compare_instances(left: Dict[str, Dict[str, Dict[str, Any]]], right: Dict[str, Dict[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for kind in left:
+        l, r = left[kind], right.get(kind, {})
+        changed = [{"name": name, "left_id": l[name]["id"], "right_id": r[name]["id"],
+                    "diffs": field_diffs(l[name]["norm"], r[name]["norm"])}
+                   for name in sorted(set(l) & set(r)) if l[name]["hash"] != r[name]["hash"]]
+        report[kind] = {
+            "missing": [{"name": n, "id": l[n]["id"]} for n in sorted(set(l) - set(r))],
+            "extra":   [{"name": n, "id": r[n]["id"]} for n in sorted(set(r) - set(l))],
+            "changed": changed,
+            "identical": len(set(l) & set(r)) - len(changed),
+        }
+    return report
+
+def drift_records(r: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One record per drift item of a compare_instances type section (for --format jsonl)."""
+    return ([{"drift": "missing", **m} for m in r["missing"]] + [{"drift": "extra", **m} for m in r["extra"]] +
+            [{"drift": "changed", **c} for c in r["changed"]])
+
+def print_drift(report: Dict[str, Any], left_url: str, right_url: str):
+    print(f"Jamf Drift — {left_url}  vs  {right_url}")
+    for kind, r in report.items():
+        title = f"{COMPARE_TYPES[kind][0].title()}: {len(r['missing'])} missing, {len(r['extra'])} extra, " \
+                f"{len(r['changed'])} changed, {r['identical']} identical"
+        print("\n" + title); print("=" * len(title))
+        for row in r["missing"]: print(f"  - {row['name']}  (only in {left_url}, id {row['id']})")
+        for row in r["extra"]:   print(f"  + {row['name']}  (only in {right_url}, id {row['id']})")
+        for row in r["changed"]:
+            print(f"  ~ {row['name']}  (ids {row['left_id']} / {row['right_id']})")
+            for d in row["diffs"]:
+                print(f"      {d['path']}: {json.dumps(d['left'], default=str)[:80]} -> {json.dumps(d['right'], default=str)[:80]}")
+
+# ----------------------------- Policy run history --------------------
+
+class PolicyRunStats:
+    """Fold per-computer policy logs into per-policy last run + run counts.
+
+    Only completed runs count as runs; Failed log entries are tallied separately
+    and never make a policy look recently run. Only the aggregate is kept: each
+    computer's history is parsed, folded and dropped by the worker that fetched
+    it, so memory is bounded by (policies × 4 ints) + (in-flight responses), not
+    by fleet history size.
+    """
+    def __init__(self, cutoff_epoch: float):
+        self.cutoff_ms = int(cutoff_epoch * 1000)
+        self.lock = threading.Lock()
+        # policy id -> [last completed run epoch ms, completed runs, completed since cutoff, failed runs]
+        self.runs: Dict[int, List[int]] = {}
+        self.footprint = {"computers_scanned": 0, "requests": 0, "bytes_received": 0,
+                          "largest_response_bytes": 0, "peak_inflight_bytes": 0}
+        self._inflight = 0
+
+    def fold(self, body: bytes):
+        size = len(body)
+        with self.lock:
+            fp = self.footprint
+            fp["requests"] += 1; fp["bytes_received"] += size
+            fp["largest_response_bytes"] = max(fp["largest_response_bytes"], size)
+            self._inflight += size
+            fp["peak_inflight_bytes"] = max(fp["peak_inflight_bytes"], self._inflight)
+        try:
+            entries = {}
+            for log in iter_policy_logs(body):
+                pid, ts = _to_int(log.get("policy_id")), _to_int(log.get("date_completed_epoch")) or 0
+                if pid is None:
+                    continue
+                e = entries.setdefault(pid, [0, 0, 0, 0])
+                if str(log.get("status") or "Completed").strip().lower() != "completed":
+                    e[3] += 1
+                    continue
+                e[0] = max(e[0], ts); e[1] += 1
+                if ts >= self.cutoff_ms: e[2] += 1
+        finally:
+            with self.lock:
+                self._inflight -= size
+        with self.lock:
+            self.footprint["computers_scanned"] += 1
+            for pid, (ts, n, recent, failed) in entries.items():
+                agg = self.runs.setdefault(pid, [0, 0, 0, 0])
+                agg[0] = max(agg[0], ts); agg[1] += n; agg[2] += recent; agg[3] += failed
+
+    def summary(self) -> Dict[str, int]:
+        return {**self.footprint, "policies_seen": len(self.runs), "state_entries": len(self.runs) * 4}
+
+def iter_policy_logs(body: bytes):
+    """policy_logs entries from a computerhistory PolicyLogs subset (JSON)."""
+    try: raw = json.loads(body) or {}
+    except ValueError: raw = {}
+    hist = (raw.get("computer_history") or {}) if isinstance(raw, dict) else {}
+    logs = hist.get("policy_logs") or []
+    if isinstance(logs, dict):           # single entry / XML-to-JSON shape
+        logs = logs.get("policy_log") or [logs]
+        logs = logs if isinstance(logs, list) else [logs]
+    for log in logs:
+        if isinstance(log, dict):
+            yield log
+
+def scan_policy_history(j, computers: List[Dict[str, Any]], sched: "FetchScheduler", days: float) -> PolicyRunStats:
+    """Stream every computer's PolicyLogs subset through the scheduler into a PolicyRunStats."""
+    stats = PolicyRunStats(time.time() - days * 86400)
+    def fetch(c):
+        r = j.get(f"/JSSResource/computerhistory/id/{c['id']}/subset/PolicyLogs")
+        stats.fold(r.content)
+        return None                      # nothing retained per computer
+    _, failures = sched.run(computers, fetch, label="history")
+    for c, e in failures:
+        print(f"[warn] computer {c['id']} history failed: {e}", file=sys.stderr)
+    stats.footprint["failed"] = len(failures)
+    return stats
+
+def stale_policy_rows(policies: List[Dict[str, Any]], scopes: Dict[int, Dict[str, Any]],
+                      flags: Dict[int, Dict[str, Any]], stats: PolicyRunStats, days: float) -> List[Dict[str, Any]]:
+    """Enabled, scoped policies with no completed run in the window; never-run first, then oldest last run."""
+    rows = []
+    for p in policies:
+        pid, sc = p["id"], scopes.get(p["id"])
+        if not sc or not j_is_scoped(sc) or not flags.get(pid, {}).get("enabled", False):
+            continue
+        last, runs, recent, failed = stats.runs.get(pid, (0, 0, 0, 0))
+        if recent:
+            continue
+        last_iso = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(last / 1000)) if last else None
+        failed_note = f", {failed} failed" if failed else ""
+        rows.append({"id": pid, "name": p["name"], "last_run": last_iso, "runs": runs, "failed_runs": failed,
+                     "summary": f"last ran {last_iso[:10]} ({runs} completed runs in history{failed_note})" if last_iso
+                                else f"never completed ({failed} failed runs)" if failed
+                                else "never ran (no policy log entries on any computer)"})
+    return sorted(rows, key=lambda r: (r["last_run"] or "", r["id"]))
+
+# ----------------------------- Policy load ---------------------------
+
+# trigger events per device per day; check-in is derived from --checkin-minutes
+TRIGGER_EVENTS_PER_DAY = {
+    "trigger_startup": 1.0, "trigger_login": 2.0, "trigger_logout": 2.0,
+    "trigger_network_state_changed": 6.0, "trigger_enrollment_complete": 0.0,
+    "trigger_other": 1.0, "custom_triggers": 1.0,
+}
+
+# executions per device per day allowed by the policy frequency (None = every trigger event)
+FREQUENCY_CAP_PER_DAY = {
+    "ongoing": None, "once every day": 1.0, "once every week": 1 / 7, "once every month": 1 / 30,
+    "once per computer": 0.0, "once per user per computer": 0.0, "once per user": 0.0,
+}
+
+def trigger_rates(checkin_minutes: float) -> Dict[str, float]:
+    return {**TRIGGER_EVENTS_PER_DAY, "trigger_checkin": 1440.0 / max(checkin_minutes, 1.0)}
+
+def policy_load_rows(data: Dict[str, Any], checkin_minutes: float) -> List[Dict[str, Any]]:
+    """Estimated daily evaluations/executions/package downloads per policy, heaviest first.
+
+    evaluations = trigger events × devices (the server evaluates the policy on each);
+    executions  = min(events, frequency cap) × devices. "Once per ..." policies are
+    counted as 0 in steady state (they only cost something for newly scoped devices).
+    """
+    rates, resolver = trigger_rates(checkin_minutes), data["scope_resolver"]
+    sizes = {pid: f.get("size") for pid, f in data.get("package_facts", {}).items()}
+    rows = []
+    for p in data["policies"]:
+        pid = p["id"]
+        flags, sc = data["policy_flags"].get(pid, {}), data["policies_scopes"].get(pid)
+        triggers = flags.get("triggers") or []
+        if not flags.get("enabled") or not triggers or not sc:
+            continue
+        devices = resolver.effective_count(sc)
+        if not devices:
+            continue
+        events = sum(rates.get(t, 0.0) for t in triggers)
+        freq = str(flags.get("frequency") or "Once per computer")
+        cap = FREQUENCY_CAP_PER_DAY.get(freq.lower(), 0.0)
+        per_device = events if cap is None else min(events, cap)
+        packages = sorted(data["policy_packages"].get(pid, ()))
+        executions = per_device * devices
+        row = {"id": pid, "name": p["name"], "devices": devices, "triggers": triggers, "frequency": freq,
+               "evaluations_per_day": round(events * devices, 1), "executions_per_day": round(executions, 1),
+               "package_downloads_per_day": round(executions * len(packages), 1)}
+        if packages and all(sizes.get(k) for k in packages):
+            row["download_bytes_per_day"] = int(executions * sum(sizes[k] for k in packages))
+        row["summary"] = (f"{freq}, {devices} devices: ~{row['executions_per_day']:g} runs/day, "
+                          f"{row['package_downloads_per_day']:g} package downloads/day, "
+                          f"{row['evaluations_per_day']:g} evaluations/day")
+        rows.append(row)
+    return sorted(rows, key=lambda r: (-r["executions_per_day"], -r["package_downloads_per_day"],
+                                      -r["evaluations_per_day"], r["id"]))
+
+# ----------------------------- Redundant delivery --------------------
+
+def redundant_delivery_rows(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Packages installed by several enabled policies whose effective scopes overlap.
+
+    Per package, the device bitmaps of its policies are folded once: `multi`
+    collects devices already seen by an earlier policy, and the redundant
+    deliveries are sum(|policy devices|) − |union|. Prefix/suffix unions give
+    each policy's overlap with all the others without pairwise comparisons.
+    """
+    resolver, flags = data["scope_resolver"], data["policy_flags"]
+    names = {p["id"]: p["name"] for p in data["policies"]}
+    pkg_names = {p["id"]: p["name"] for p in data["packages"]}
+    sizes = {pid: f.get("size") for pid, f in data.get("package_facts", {}).items()}
+    effective: Dict[int, int] = {}
+    by_package: Dict[int, List[int]] = {}
+    for pid, pkgs in data["policy_packages"].items():
+        sc = data["policies_scopes"].get(pid)
+        if not pkgs or not sc or not flags.get(pid, {}).get("enabled"):
+            continue
+        bm = resolver.effective(sc)
+        if not bm:
+            continue                 # unresolvable or reaches nobody
+        effective[pid] = bm
+        for k in pkgs:
+            by_package.setdefault(k, []).append(pid)
+    rows = []
+    for k, pids in by_package.items():
+        if len(pids) < 2:
+            continue
+        pids.sort()
+        bms = [effective[pid] for pid in pids]
+        seen = multi = 0
+        for bm in bms:
+            multi |= seen & bm
+            seen |= bm
+        if not multi:
+            continue
+        prefix, suffix = [0] * (len(bms) + 1), [0] * (len(bms) + 1)
+        for i, bm in enumerate(bms):
+            prefix[i + 1] = prefix[i] | bm
+        for i in range(len(bms) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] | bms[i]
+        extra = sum(_popcount(bm) for bm in bms) - _popcount(seen)
+        size = sizes.get(k)
+        row = {"id": k, "name": pkg_names.get(k, f"package {k}"), "devices_reached_more_than_once": _popcount(multi),
+               "redundant_deliveries": extra, "size": size, "redundant_bytes": size * extra if size else None,
+               "policies": [{"id": pid, "name": names.get(pid, ""), "devices": _popcount(bm),
+                             "overlapping_devices": _popcount(bm & (prefix[i] | suffix[i + 1]))}
+                            for i, (pid, bm) in enumerate(zip(pids, bms))]}
+        row["summary"] = (f"{len(pids)} policies, {row['devices_reached_more_than_once']} devices reached more than once, "
+                          f"{extra} redundant downloads" + (f" ({_fmt_bytes(row['redundant_bytes'])})" if size else ""))
+        rows.append(row)
+    return sorted(rows, key=lambda r: (-(r["redundant_bytes"] or 0), -r["redundant_deliveries"], r["id"]))
+
+# ----------------------------- Duplicate content ---------------------
+
+def _to_size(val) -> Optional[int]:
+    if isinstance(val, (int, float)) and not isinstance(val, bool):
+        return int(val)
+    if isinstance(val, str):
+        m = re.match(r"^\s*([\d.]+)\s*([KMGT]?B)?\s*$", val, re.I)
+        if m:
+            mult = {"": 1, "B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}[(m.group(2) or "").upper()]
+            try: return int(float(m.group(1)) * mult)
+            except ValueError: return None
+    return None
+
+def derive_package_facts(body: str) -> Dict[str, Any]:
+    """Filename, size and the hash Jamf recorded for the package (Jamf Pro record or Classic detail)."""
+    try: raw = json.loads(body) or {}
+    except ValueError: raw = {}
+    pkg = raw.get("package", raw) if isinstance(raw, dict) else {}
+    hash_type = str(pkg.get("hash_type") or pkg.get("hashType") or "").upper()
+    hash_value = str(pkg.get("hash_value") or pkg.get("hashValue") or "").lower()
+    if not hash_value:
+        for k in ("sha512", "sha256", "md5"):
+            if pkg.get(k):
+                hash_type, hash_value = k.upper(), str(pkg[k]).lower(); break
+    return {"filename": pkg.get("filename") or pkg.get("fileName") or "",
+            "size": _to_size(pkg.get("size")), "hash_type": hash_type, "hash_value": hash_value}
+
+def fetch_package_facts(j, cache: Optional[DetailCache], pid: int) -> Dict[str, Any]:
+    """Package facts from the Jamf Pro record, which carries the file size Classic usually omits.
+
+    Servers without /api/v1/packages (404) fall back to the Classic detail.
+    """
+    try:
+        return fetch_detail_facts(j, cache, "package", pid, f"/api/v1/packages/{pid}", derive_package_facts)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            raise
+    return fetch_detail_facts(j, cache, "package", pid, f"/JSSResource/packages/id/{pid}", derive_package_facts)
+
+_COMMENT_LINE = re.compile(r"^\s*#(?!!)")
+
+def normalize_script(text: str) -> str:
+    """Whitespace/comment-insensitive form: drops comment lines (keeps the shebang) and blank lines."""
+    lines = []
+    for i, line in enumerate(text.replace("\r\n", "\n").split("\n")):
+        if _COMMENT_LINE.match(line) and not (i == 0 and line.startswith("#!")):
+            continue
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+def derive_script_facts(body: str) -> Dict[str, Any]:
+    try: raw = json.loads(body) or {}
+    except ValueError: raw = {}
+    sc = raw.get("script", raw) if isinstance(raw, dict) else {}
+    text = sc.get("script_contents") or ""
+    if not text and sc.get("script_contents_encoded"):
+        try: text = base64.b64decode(sc["script_contents_encoded"]).decode("utf-8", "replace")
+        except Exception: text = ""
+    data = text.encode("utf-8")
+    return {"size": len(data), "sha256": hashlib.sha256(data).hexdigest(),
+            "norm_sha256": hashlib.sha256(normalize_script(text).encode("utf-8")).hexdigest()}
+
+def _fmt_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return "size unknown"
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+    return str(n)
+
+def duplicate_groups(objects: List[Dict[str, Any]], facts: Dict[int, Dict[str, Any]], kind: str, key_fn,
+                     graph: ObjectGraph, basis: str) -> List[Dict[str, Any]]:
+    """Group objects sharing key_fn(facts), ranked by wasted bytes.
+
+    wasted = size × (copies − 1). The copy kept is the most-referenced one, and
+    reclaimable counts only the other copies that no policy references. Both are
+    None when no copy has a known size; those rows sort last.
+    """
+    buckets: Dict[Any, List[Dict[str, Any]]] = {}
+    for o in objects:
+        f = facts.get(o["id"])
+        key = key_fn(f) if f else None
+        if key:
+            refs = sorted(src[1] for src, _, _ in graph.referrers((kind, o["id"])))
+            buckets.setdefault(key, []).append({"id": o["id"], "name": o["name"], "size": f.get("size"), "policies": refs})
+    rows = []
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda m: (-len(m["policies"]), m["id"]))
+        keep, extra = members[0], members[1:]
+        size = max((m["size"] or 0) for m in members) or None
+        wasted = size * len(extra) if size else None
+        reclaimable = size * sum(1 for m in extra if not m["policies"]) if size else None
+        summary = (f"{len(members)} copies ({basis}), {_fmt_bytes(wasted)} duplicated, "
+                   f"{_fmt_bytes(reclaimable)} in unreferenced copies" if size else
+                   f"{len(members)} copies ({basis}), size unknown, "
+                   f"{sum(1 for m in extra if not m['policies'])} unreferenced copies")
+        rows.append({"id": keep["id"], "name": keep["name"], "basis": basis, "copies": len(members),
+                     "wasted_bytes": wasted, "reclaimable_bytes": reclaimable, "members": members,
+                     "summary": summary})
+    return sorted(rows, key=_wasted_order)
+
+def _wasted_order(r: Dict[str, Any]):
+    # most wasted bytes first; rows whose size is unknown last, by copy count
+    return (r["wasted_bytes"] is None, -(r["wasted_bytes"] or 0), -r["copies"], r["id"])
+
+def duplicate_package_rows(data: Dict[str, Any], graph: ObjectGraph) -> List[Dict[str, Any]]:
+    facts = data["package_facts"]
+    by_hash = duplicate_groups(data["packages"], facts, "package",
+                               lambda f: f["hash_value"] and (f["hash_type"], f["hash_value"]), graph, "same hash")
+    hashed = {m["id"] for r in by_hash for m in r["members"]} | {pid for pid, f in facts.items() if f["hash_value"]}
+    # no hash recorded: fall back to identical filename + size
+    unhashed = [p for p in data["packages"] if p["id"] not in hashed]
+    by_file = duplicate_groups(unhashed, facts, "package",
+                               lambda f: f["filename"] and f["size"] and (f["filename"], f["size"]), graph, "same filename+size")
+    return sorted(by_hash + by_file, key=_wasted_order)
+
+def duplicate_script_rows(data: Dict[str, Any], graph: ObjectGraph) -> List[Dict[str, Any]]:
+    facts = data["script_facts"]
+    exact = duplicate_groups(data["scripts"], facts, "script", lambda f: f["size"] and f["sha256"], graph, "identical")
+    near = duplicate_groups(data["scripts"], facts, "script", lambda f: f["size"] and f["norm_sha256"], graph,
+                            "identical ignoring whitespace/comments")
+    exact_sets = {frozenset(m["id"] for m in r["members"]) for r in exact}
+    near = [r for r in near if frozenset(m["id"] for m in r["members"]) not in exact_sets]
+    return sorted(exact + near, key=_wasted_order)
+
+# ----------------------------- Query server --------------------------
+
+class AuditService:
+    """Keeps the last complete audit dataset in memory and rebuilds it in the background.
+
+    Queries always read an immutable snapshot (swapped atomically under a lock),
+    so they never wait on Jamf; a failed refresh keeps serving the previous one.
+    """
+    def __init__(self, build_snapshot, interval: float = 900.0):
+        self.build_snapshot = build_snapshot
+        self.interval = interval
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.refreshing = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def refresh(self):
+        with self._lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        t0 = time.time()
+        try:
+            snap = self.build_snapshot()
+            snap["built_at"] = time.time()
+            snap["build_seconds"] = round(time.time() - t0, 2)
+            with self._lock:
+                self.snapshot, self.last_error = snap, None
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[serve] refresh failed, keeping previous snapshot: {self.last_error}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self.refreshing = False
+
+    def start_background(self):
+        def loop():
+            while not self._stop.is_set():
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                if not self._stop.is_set():
+                    self.refresh()
+        threading.Thread(target=loop, name="audit-refresh", daemon=True).start()
+
+    def trigger(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set(); self._wake.set()
+
+    def health(self) -> Dict[str, Any]:
+        snap = self.snapshot
+        return {"ready": snap is not None, "refreshing": self.refreshing, "last_error": self.last_error,
+                "interval_seconds": self.interval,
+                "built_at": snap and time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(snap["built_at"])),
+                "age_seconds": snap and round(time.time() - snap["built_at"], 1),
+                "build_seconds": snap and snap["build_seconds"],
+                "stats": snap and audit_stats(snap["data"])}
+
+    def query(self, path: str) -> Tuple[int, Any]:
+        parts = [p for p in urlparse(path).path.split("/") if p]
+        if parts == ["health"]:
+            return 200, self.health()
+        snap = self.snapshot
+        if snap is None:
+            return 503, {"error": "audit snapshot not built yet", "health": self.health()}
+        data, reports, graph = snap["data"], snap["reports"], snap["data"]["graph"]
+        if parts == ["reports"]:
+            return 200, {name: len(rows) for name, rows in reports.items()}
+        if len(parts) == 2 and parts[0] in ("reports", "unused"):
+            name = parts[1] if parts[0] == "reports" else f"unused_{parts[1]}"
+            if name in reports:
+                return 200, reports[name]
+            return 404, {"error": f"unknown report {name}", "available": list(reports)}
+        if len(parts) == 3 and parts[0] in ("why", "inspect") and parts[2].lstrip("-").isdigit():
+            kind, oid = parts[1], int(parts[2])
+            if kind == "policy" and oid in data["policies_scopes"]:
+                body = {"policy_id": oid, "scope": as_plain(data["policies_scopes"][oid]),
+                        "flags": as_plain(data["policy_flags"].get(oid)),
+                        "scripts_found": sorted(data["policy_scripts"].get(oid, ())),
+                        "packages_found": sorted(data["policy_packages"].get(oid, ()))}
+            elif kind == "profile" and oid in data["profiles_scopes"]:
+                body = {"profile_id": oid, "scope": as_plain(data["profiles_scopes"][oid])}
+            elif kind in ("script", "package", "group") and (kind, oid) in graph.names:
+                body = {}
+            else:
+                return 404, {"error": f"{kind} {oid} not in snapshot"}
+            if parts[0] == "why":
+                body.update(graph.describe((kind, oid)))
+                body["flagged_in"] = [name for name, rows in reports.items() if any(r.get("id") == oid for r in rows)
+                                      and ARCHIVE_REPORTS.get(name, REPORT_KINDS.get(name)) == kind]
+            return 200, body
+        return 404, {"error": "unknown endpoint",
+                     "endpoints": ["/health", "/reports", "/reports/<name>", "/unused/<scripts|packages|groups>",
+                                   "/why/<policy|profile|script|package|group>/<id>", "/inspect/<policy|profile>/<id>",
+                                   "POST /refresh"]}
+
+# report key -> object type its rows refer to (for "flagged_in" on why-queries)
+REPORT_KINDS = {
+    "unused_groups": "group", "policies_no_triggers_and_not_selfservice": "policy",
+    "active_policies_selfservice_enabled": "policy",
+    "zero_effective_scope_policies": "policy", "zero_effective_scope_profiles": "profile",
+    "duplicate_packages": "package", "duplicate_scripts": "script", "redundant_package_delivery": "package",
+}
+
+def make_query_server(service: AuditService, host: str, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: Any):
+            raw = json.dumps(body, separators=(",", ":"), default=str).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            self._send(*service.query(self.path))
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") == "/refresh":
+                service.trigger()
+                return self._send(202, {"refresh": "scheduled", "health": service.health()})
+            self._send(404, {"error": "unknown endpoint"})
+
+        def log_message(self, fmt, *a):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+# ----------------------------- Self-test -----------------------------
+
+# Recorded fixtures: the same policy as returned by /policies/id/N (JSON) and /subset/Scope (XML)
+SELFTEST_POLICY_XML = """
+<policy><scope>
+  <all_computers>false</all_computers>
+  <computers><computer><id>501</id><name>mac-01</name></computer></computers>
+  <computer_groups>
+    <computer_group><id>10</id><name>Pilot</name></computer_group>
+    <computer_group><id>11</id><name>Finance</name></computer_group>
+  </computer_groups>
+  <buildings><building><id>3</id><name>HQ</name></building></buildings>
+  <departments/>
+  <exclusions>
+    <computers/>
+    <computer_groups><computer_group><id>12</id><name>Kiosks</name></computer_group></computer_groups>
+  </exclusions>
+</scope></policy>
+"""
+
+SELFTEST_POLICY_JSON = {"policy": {
+    "general": {"id": 77, "name": "Install Box Tools", "enabled": True, "trigger_checkin": True,
+                "frequency": "Once per computer"},
+    "scope": {
+        "all_computers": False,
+        "computers": [{"id": 501, "name": "mac-01"}],
+        "computer_groups": [{"id": 10, "name": "Pilot"}, {"id": "11", "name": "Finance"}],
+        "buildings": [{"id": 3, "name": "HQ"}],
+        "departments": [],
+        "exclusions": {"computers": [], "computer_groups": [{"id": 12, "name": "Kiosks"}]},
+    },
+    "scripts": [{"id": 5, "name": "postinstall"}],
+    "package_configuration": {"packages": [{"id": 9, "name": "BoxTools.pkg"}]},
+    "self_service": {"use_for_self_service": False},
+}}
+
+SELFTEST_ALL_COMPUTERS_XML = """
+<os_x_configuration_profile><scope>
+  <all_computers>true</all_computers>
+  <computers/><computer_groups/><buildings/><departments/>
+  <exclusions><computers><computer><id>900</id></computer></computers></exclusions>
+</scope></os_x_configuration_profile>
+"""
+
+SELFTEST_ALL_COMPUTERS_JSON = {"os_x_configuration_profile": {"scope": {
+    "all_computers": "true",
+    "computers": [], "computer_groups": [], "buildings": [], "departments": [],
+    "exclusions": {"computers": {"computer": {"id": "900"}}},
+}}}
+
+def synthetic_policy(pid: int, n_scripts: int = 50, n_packages: int = 50, n_computers: int = 200) -> Dict[str, Any]:
+    return {"policy": {
+        "general": {"id": pid, "name": f"Policy {pid}", "enabled": True, "trigger_checkin": pid % 2 == 0,
+                    "frequency": "Once per computer", "category": {"id": 1, "name": "Apps"},
+                    "date_time_limitations": {"no_execute_on": [], "no_execute_start": "", "no_execute_end": ""},
+                    "network_limitations": {"minimum_network_connection": "No Minimum"}},
+        "scope": {"all_computers": False,
+                  "computers": [{"id": c, "name": f"mac-{c}", "udid": f"{c:08d}-0000"} for c in range(n_computers)],
+                  "computer_groups": [{"id": g, "name": f"Group {g}"} for g in range(20)],
+                  "buildings": [], "departments": [],
+                  "exclusions": {"computers": [], "computer_groups": [{"id": 99, "name": "Kiosks"}]}},
+        "self_service": {"use_for_self_service": False, "self_service_categories": [{"id": 3, "name": "Utilities"}]},
+        "package_configuration": {"packages": [
+            {"id": 1000 + n, "name": f"pkg-{n}.pkg", "action": "Install", "fut": False, "feu": False}
+            for n in range(n_packages)]},
+        "scripts": [
+            {"id": str(2000 + n), "name": f"script-{n}.sh", "priority": "After",
+             "parameter4": str(n), "parameter5": "", "parameter6": "--flag"}
+            for n in range(n_scripts)],
+        "maintenance": {"recon": True, "reset_name": False},
+        "files_processes": {"search_by_path": "", "run_command": ""},
+    }}
+
+def synthetic_state(n_objects: int, compact: bool, seed: int = 7) -> Dict[str, Any]:
+    """Audit state for a synthetic tenant of ~n_objects, as collect_audit_data would hold it.
+
+    Every object is generated as the dicts/lists the listers and parsers return;
+    compact=False keeps them as-is (the pre-record layout), compact=True stores
+    them the way collect_audit_data does now. Same seed, same tenant.
+    """
+    rng = random.Random(seed)
+    n_comp, n_pol, n_prof = n_objects * 40 // 100, n_objects * 30 // 100, n_objects * 10 // 100
+    n_scr, n_pkg, n_grp = n_objects * 8 // 100, n_objects * 8 // 100, n_objects * 4 // 100
+    def ref(oid, name, **extra):
+        d = {"id": oid, "name": name, **extra}
+        if not compact: return d
+        if "is_smart" in extra: return GroupRef(oid, name, extra["is_smart"])
+        if "building" in extra: return ComputerRef(oid, name, extra["building"], extra["department"])
+        return ObjRef(oid, name)
+    def ids(n, hi):
+        return [rng.randrange(1, hi + 1) for _ in range(n)]
+    def scope():
+        sc = _empty_scope()
+        sc["all_computers"] = rng.random() < 0.05
+        sc["targets_groups"] = sorted(set(ids(rng.randint(0, 3), n_grp)))
+        sc["targets_computers"] = ids(rng.choice((0, 0, 0, 5, 40)), n_comp)
+        sc["targets_buildings"] = ids(rng.choice((0, 0, 1)), 20)
+        sc["excl_groups"] = ids(rng.choice((0, 0, 1)), n_grp)
+        sc["excl_computers"] = ids(rng.choice((0, 0, 0, 3)), n_comp)
+        return Scope(sc) if compact else sc
+    data: Dict[str, Any] = {
+        "computers": [ref(c, f"Mac-{c:06d}", building=f"Building {c % 20}", department=f"Dept {c % 15}")
+                      for c in range(1, n_comp + 1)],
+        "buildings": [ref(b, f"Building {b}") for b in range(20)],
+        "departments": [ref(d, f"Dept {d}") for d in range(15)],
+        "policies": [ref(i, f"Policy {i}") for i in range(1, n_pol + 1)],
+        "profiles": [ref(i, f"Profile {i}") for i in range(1, n_prof + 1)],
+        "scripts": [ref(i, f"script-{i}.sh") for i in range(1, n_scr + 1)],
+        "packages": [ref(i, f"Package-{i}.pkg") for i in range(1, n_pkg + 1)],
+        "groups": [ref(g, f"Group {g}", is_smart=g % 3 != 0) for g in range(1, n_grp + 1)],
+        "policies_scopes": {}, "policy_flags": {}, "policy_names": {}, "policy_scripts": {},
+        "policy_packages": {}, "profiles_scopes": {}, "group_facts": {}, "package_facts": {}, "script_facts": {},
+        "checkin_minutes": 15,
+    }
+    data["fetched"] = {k for k in LISTERS}
+    freqs = ("Once per computer", "Ongoing", "Once every day", "Once every week")
+    for p in data["policies"]:
+        pid = p["id"]
+        trig = [t for t in TRIGGER_KEYS[:5] if rng.random() < 0.3]
+        flags = {"enabled": rng.random() < 0.9, "any_trigger": bool(trig), "self_service_enabled": rng.random() < 0.2,
+                 "name": f"Policy {pid}", "frequency": rng.choice(freqs), "triggers": trig}
+        s_ids, p_ids = set(ids(rng.randint(0, 3), n_scr)), set(ids(rng.randint(0, 3), n_pkg))
+        data["policies_scopes"][pid] = scope()
+        data["policy_flags"][pid] = PolicyFlags(flags) if compact else flags
+        data["policy_names"][pid] = flags["name"]
+        data["policy_scripts"][pid] = tuple(sorted(s_ids)) if compact else s_ids
+        data["policy_packages"][pid] = tuple(sorted(p_ids)) if compact else p_ids
+    for p in data["profiles"]:
+        data["profiles_scopes"][p["id"]] = scope()
+    for g in data["groups"]:
+        members = sorted(set(ids(rng.choice((0, 10, 50, 200)), n_comp)))
+        facts = {"is_smart": g["is_smart"], "members": members, "criteria": []}
+        data["group_facts"][g["id"]] = {**facts, "members": pack_ids(members)} if compact else facts
+    data["scope_resolver"] = ScopeResolver(data["computers"], {gid: f["members"] for gid, f in data["group_facts"].items()},
+                                           data["buildings"], data["departments"])
+    return data
+
+def run_memory_benchmark(n_objects: int = 50000) -> int:
+    """tracemalloc peak/retained size and a full gc pass, dict layout vs records; reports must match."""
+    print(f"\naudit state: synthetic tenant, {n_objects} objects")
+    outputs = {}
+    for label, compact in (("dicts (per-object dict/list/set)", False), ("records (__slots__ + packed ids)", True)):
+        gc.collect()
+        tracemalloc.start()
+        data = synthetic_state(n_objects, compact)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        t0 = time.perf_counter(); gc.collect(); gc_ms = (time.perf_counter() - t0) * 1000
+        reports = compute_reports(data, [r for r in REPORTS if r not in FLEET_SCAN_REPORTS])
+        outputs[label] = json.dumps(reports, sort_keys=True)
+        print(f"  {label:34} retained {current / 1048576:7.1f} MB   peak {peak / 1048576:7.1f} MB   gc {gc_ms:6.1f} ms")
+        del data, reports
+    same = len(set(outputs.values())) == 1
+    print(f"  report JSON identical: {'yes' if same else 'NO'}")
+    return 0 if same else 1
+
+def run_benchmark() -> int:
+    payloads = [synthetic_policy(i, n_scripts=200, n_packages=200, n_computers=500) for i in range(100)]
+    def timed(fn):
+        best = None
+        for _ in range(3):
+            t0 = time.perf_counter()
+            for raw in payloads:
+                fn(raw)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        return best
+    for raw in payloads[:5]:
+        if collect_policy_refs_from_json(raw) != _collect_policy_refs_walk(raw):
+            print("[FAIL] streaming extractor disagrees with reference _walk scan"); return 1
+    old_t = timed(_collect_policy_refs_walk)
+    new_t = timed(collect_policy_refs_from_json)
+    print(f"policy refs: {len(payloads)} synthetic policies (200 scripts, 200 packages, 500 scoped computers)")
+    print(f"  _walk reference scan  {old_t*1000:9.1f} ms")
+    print(f"  streaming extractor   {new_t*1000:9.1f} ms   ({old_t/new_t:.1f}x)")
+    return run_memory_benchmark()
+
+def run_self_test() -> int:
+    failures = 0
+    def check(label, ok):
+        nonlocal failures
+        print(f"[{'ok' if ok else 'FAIL'}] {label}")
+        if not ok: failures += 1
+
+    check("policy scope: JSON parser matches XML subset",
+          parse_scope_json(SELFTEST_POLICY_JSON) == parse_scope_subset(SELFTEST_POLICY_XML))
+    check("profile scope (all computers + wrapped exclusion): JSON parser matches XML subset",
+          parse_scope_json(SELFTEST_ALL_COMPUTERS_JSON) == parse_scope_subset(SELFTEST_ALL_COMPUTERS_XML))
+    check("missing JSON scope falls back (None)", parse_scope_json({"policy": {"general": {}}}) is None)
+    s_ids, p_ids = collect_policy_refs_from_json(SELFTEST_POLICY_JSON)
+    check("policy refs: scripts/packages", 5 in s_ids and 9 in p_ids)
+    flags = extract_policy_flags(SELFTEST_POLICY_JSON)
+    check("policy flags: enabled + check-in trigger", flags["enabled"] and flags["any_trigger"])
+
+    def http_error(status, retry_after=None):
+        resp = requests.Response()
+        resp.status_code = status
+        if retry_after is not None:
+            resp.headers["Retry-After"] = retry_after
+        return requests.HTTPError(f"{status}", response=resp)
+    seen: Dict[int, int] = {}
+    def flaky(n):
+        seen[n] = seen.get(n, 0) + 1
+        if n == 3:
+            raise http_error(404)
+        if seen[n] == 1 and n % 2 == 0:
+            raise http_error(429, "0")
+        return n * 10
+    sched = FetchScheduler(min_concurrency=1, max_concurrency=4, start=4, max_retries=2)
+    ok, failed = sched.run(list(range(6)), flaky)
+    check("scheduler: throttled items retried, 404 not retried",
+          sorted(v for _, v in ok) == [0, 10, 20, 40, 50] and [n for n, _ in failed] == [3] and seen[3] == 1)
+    check("scheduler: 429 halves concurrency", sched.stats["throttled"] == 3 and sched.limit < 4)
+    seen.clear()
+    def broken(n):
+        seen[n] = seen.get(n, 0) + 1
+        if n == 0:
+            raise ValueError("unparseable detail")
+        if seen[n] == 1:
+            raise requests.ConnectionError("reset by peer") if n == 1 else requests.Timeout("read timed out")
+        return n
+    ok, failed = FetchScheduler(min_concurrency=1, max_concurrency=4, max_retries=2).run([0, 1, 2], broken)
+    check("scheduler: connection errors and timeouts retried, other exceptions not",
+          sorted(v for _, v in ok) == [1, 2] and [n for n, _ in failed] == [0] and seen[0] == 1)
+    burst = FetchScheduler(min_concurrency=1, max_concurrency=8, start=8)
+    burst._decrease(0.5, "429"); burst._decrease(0.5, "429")
+    cut_once = burst.limit == 4.0
+    burst._since_cut += 4
+    burst._decrease(0.5, "429")
+    check("scheduler: at most one cut per window of completions", cut_once and burst.limit == 2.0)
+
+    jc = JamfClient("https://selftest.invalid", "id", "secret", None, None)
+    def fake_auth():
+        time.sleep(0.05)
+        jc._set_token(f"tok{jc.token_refreshes}", 1200)
+        return 200
+    jc._auth_with_client_credentials = fake_auth
+    threads = [threading.Thread(target=jc.ensure_token) for _ in range(16)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    check("token: 16 concurrent callers, one refresh", jc.token_refreshes == 1)
+    stale = jc.token
+    for _ in range(4):
+        jc.invalidate_token(stale)   # several threads reporting 401 for the same token
+        jc.ensure_token()
+    check("token: repeated 401s for one stale token refresh once", jc.token_refreshes == 2)
+    jc.token_refresh_epoch = time.time() - 1
+    check("token: proactive refresh before expiry", jc.ensure_token() != stale and jc.token_refreshes == 3)
+    auth_calls = []
+    def failing_auth():
+        auth_calls.append(1)
+        raise requests.ConnectionError("auth endpoint down")
+    jc._auth_with_client_credentials = failing_auth
+    jc.token_refresh_epoch = time.time() - 1
+    kept = jc.token
+    check("token: failed early refresh keeps the token and backs off",
+          all(jc.ensure_token() == kept for _ in range(5)) and len(auth_calls) == 1
+          and jc.token_refresh_epoch > time.time())
+
+    class _FakeJamf:
+        def __init__(self): self.body, self.etag = "", None
+        def get(self, path, params=None, accept=None, headers=None):
+            resp = requests.Response()
+            if self.etag and (headers or {}).get("If-None-Match") == self.etag:
+                resp.status_code = 304; resp._content = b""
+            else:
+                resp.status_code = 200; resp._content = self.body.encode()
+                if self.etag: resp.headers["ETag"] = self.etag
+            return resp
+    derived = []
+    def derive(body):
+        derived.append(body)
+        return {"len": len(body)}
+    with tempfile.TemporaryDirectory() as tmp:
+        fj, cache = _FakeJamf(), DetailCache(tmp)
+        fj.body = SELFTEST_POLICY_XML
+        fetch_detail_facts(fj, cache, "profile_scope", 1, "/x", derive)
+        facts = fetch_detail_facts(fj, cache, "profile_scope", 1, "/x", derive)
+        check("cache: unchanged body (content hash) skips derive", len(derived) == 1 and facts == {"len": len(fj.body)})
+        fj.etag = '"v1"'
+        fetch_detail_facts(fj, cache, "profile_scope", 2, "/y", derive)
+        fetch_detail_facts(fj, cache, "profile_scope", 2, "/y", derive)
+        check("cache: 304 Not Modified reuses facts", len(derived) == 2 and cache.stats["not_modified"] == 1)
+        fj.body += " "
+        fetch_detail_facts(fj, cache, "profile_scope", 1, "/x", derive)
+        check("cache: changed body re-derives", len(derived) == 3)
+        cache.max_bytes = os.path.getsize(cache._path("profile_scope", 1))
+        os.utime(cache._path("profile_scope", 2), (1, 1))
+        cache.prune()
+        check("cache: LRU prune evicts the least recently used entry",
+              os.path.exists(cache._path("profile_scope", 1)) and not os.path.exists(cache._path("profile_scope", 2)))
+
+    edge = {"policy": {"scripts": [{"id": "7"}, {"name": "42"}, 8], "Package_Configuration": {"packages": {"package": {"id": 3}}},
+                       "general": {"id": 1, "name": "12"}, "script_and_package": [True, "x", 5.0]}}
+    check("policy refs: streaming extractor matches reference _walk scan",
+          all(collect_policy_refs_from_json(r) == _collect_policy_refs_walk(r)
+              for r in (SELFTEST_POLICY_JSON, edge, synthetic_policy(1, 5, 5, 5), {}, [], None)))
+
+    check("planner: unscoped_profiles needs only profile list + scopes",
+          plan_fetch(["unscoped_profiles"]) == {"profiles", "profile_scope"})
+    check("planner: unused_groups pulls groups (with criteria), policy detail and profile scopes",
+          plan_fetch(["unused_groups"]) == {"groups", "group_detail", "policies", "policy_detail", "profiles", "profile_scope"})
+    check("planner: policy_load fetches package details for download_bytes_per_day",
+          {"package_detail", "packages"} <= plan_fetch(["policy_load"]))
+
+    journal = [
+        {"action": "move", "status": "ok", "type": "script", "id": 4, "from_category": "Tools", "to_category": "z_Archive"},
+        {"action": "move", "status": "failed", "type": "script", "id": 5, "from_category": "Tools", "to_category": "z_Archive"},
+        {"action": "move", "status": "ok", "type": "policy", "id": 9, "from_category": "Apps", "to_category": "z_Archive"},
+        {"action": "restore", "status": "ok", "type": "policy", "id": 9, "from_category": "z_Archive", "to_category": "Apps"},
+    ]
+    undo = undo_moves_from_journal(journal)
+    check("journal: undo restores successful moves only, once",
+          [(m["type"], m["id"], m["to"]) for m in undo] == [("script", 4, "Tools")])
+    with tempfile.TemporaryDirectory() as tmp:
+        mj = MoveJournal(os.path.join(tmp, "moves.jsonl"))
+        puts: List[Tuple[str, int]] = []
+        class _PutJamf:
+            def put_xml(self, path, body):
+                lines = len(MoveJournal.read(mj.path)) if os.path.exists(mj.path) else 0
+                puts.append((path, lines))
+                if path.endswith("/2") and sum(p == path for p, _ in puts) == 1:
+                    raise http_error(500)
+                if path.endswith("/3"):
+                    raise http_error(404)
+        moves = [{"type": "script", "id": i, "name": f"S{i}", "from": "Tools", "to": "z_Archive"} for i in (1, 2, 3)]
+        counts = apply_moves(_PutJamf(), moves, mj, FetchScheduler(min_concurrency=1, max_concurrency=1, start=1),
+                             RateLimiter(0))
+        logged = MoveJournal.read(mj.path)
+    check("journal: each move is journaled before the next PUT starts",
+          counts == (2, 1) and [n for _, n in puts] == [0, 1, 1, 2] and
+          [(r["id"], r["status"]) for r in logged] == [(1, "ok"), (3, "failed"), (2, "ok")])
+    check("movers: a 500 is retried with the same payload shape, not taken as a rejected shape",
+          all(r.get("shape", 0) == 0 for r in logged))
+    class _PlanJamf:
+        base_url = "https://selftest.invalid"
+    plan_sched = FetchScheduler(min_concurrency=1, max_concurrency=1, start=1)
+    blocked = build_archive_plan(_PlanJamf(), {}, "z_Archive", plan_sched, {"policy_detail": [7], "group_detail": [3]})
+    clean = build_archive_plan(_PlanJamf(), {}, "z_Archive", plan_sched, {"group_detail": [3]})
+    check("archive plan: blocked when a policy/profile detail fetch failed",
+          blocked.get("incomplete_fetches") == {"policy_detail": [7]} and "policies (ids 7)" in blocked["blocked"]
+          and "blocked" not in clean)
+    shapes = PayloadShapes()
+    shapes.worked("script", 1)
+    check("movers: remembered payload shape is tried first", shapes.order("script") == [1, 0])
+    check("movers: category read from script/policy detail",
+          extract_category("script", {"script": {"category": "Tools"}}) == "Tools" and
+          extract_category("policy", SELFTEST_POLICY_JSON) == "")
+
+    resolver = ScopeResolver(
+        [{"id": c, "building": "HQ" if c < 3 else "", "department": ""} for c in range(1, 6)],
+        {10: [1, 2], 11: [], 12: [1, 2, 9]}, [{"id": 3, "name": "HQ"}], [])
+    scoped = lambda **kw: {**_empty_scope(), **kw}
+    check("effective scope: group minus exclusion", resolver.effective_count(scoped(targets_groups=[10], excl_computers=[2])) == 1)
+    check("effective scope: building + all_computers", resolver.effective_count(scoped(targets_buildings=[3])) == 2 and
+          resolver.effective_count(scoped(all_computers=True, excl_groups=[10])) == 3)
+    zero = zero_effective_rows([{"id": 1, "name": "empty"}, {"id": 2, "name": "covered"}, {"id": 3, "name": "ok"},
+                                {"id": 4, "name": "unknown group"}],
+                               {1: scoped(targets_groups=[11]), 2: scoped(targets_groups=[10], excl_groups=[12]),
+                                3: scoped(targets_computers=[5]), 4: scoped(targets_groups=[99])}, resolver)
+    check("effective scope: zero-reach policies reported, unknown groups skipped", [r["id"] for r in zero] == [1, 2])
+
+    gdata = {"policies": [{"id": 1, "name": "P"}], "profiles": [{"id": 2, "name": "C"}], "scripts": [{"id": 5, "name": "s"}],
+             "packages": [], "groups": [{"id": 10, "name": "Pilot"}, {"id": 11, "name": "Pilot Macs"}, {"id": 12, "name": "Lone"}],
+             "policies_scopes": {1: {**_empty_scope(), "targets_groups": [10]}}, "policy_scripts": {1: {5}},
+             "policy_packages": {1: set()}, "profiles_scopes": {2: _empty_scope()},
+             "group_facts": {10: {"criteria": [{"name": "Computer Group", "search_type": "member of", "value": "Pilot Macs"}]},
+                             11: {"criteria": [{"name": "Operating System Version", "search_type": "like", "value": "15"}]},
+                             12: {"criteria": []}}}
+    graph = build_object_graph(gdata)
+    check("graph: group referenced only via another group's criterion is used",
+          graph.is_referenced(("group", 11)) and not graph.is_referenced(("group", 12)))
+    check("graph: nested-group dependents carry depth",
+          graph.transitive_referrers(("group", 11)) == {("group", 10): 1, ("policy", 1): 2})
+
+    def snapshot():
+        sdata = {**gdata, "fetched": {"policies", "groups"}, "policy_flags": {}, "policy_names": {}}
+        return {"data": sdata, "reports": compute_reports(sdata, ["unused_scripts", "unused_groups"])}
+    service = AuditService(snapshot, interval=3600)
+    httpd = make_query_server(service, "127.0.0.1", 0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        not_ready = requests.get(f"{base}/why/group/11", timeout=5).status_code
+        service.refresh()
+        why = requests.get(f"{base}/why/group/11", timeout=5).json()
+        unused = requests.get(f"{base}/unused/groups", timeout=5).json()
+        check("serve: 503 before first snapshot, then why/unused answered from memory",
+              not_ready == 503 and [d["id"] for d in why["dependents"]] == [10, 1] and [g["id"] for g in unused] == [12])
+    finally:
+        httpd.shutdown(); httpd.server_close()
+
+    prod = derive_compare_facts("policy", json.dumps({"policy": {"general": {"id": 4, "name": "Zoom", "enabled": True},
+        "scripts": [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}], "payloads": "<key>PayloadUUID</key><string>AAA</string>"}}))
+    stage = derive_compare_facts("policy", json.dumps({"policy": {"general": {"id": 90, "name": "Zoom", "enabled": True},
+        "scripts": [{"id": 7, "name": "b"}, {"id": 8, "name": "a"}], "payloads": "<key>PayloadUUID</key><string>BBB</string>"}}))
+    check("drift: ids, list order and PayloadUUIDs do not count as drift", prod["hash"] == stage["hash"])
+    scoped_to = lambda macs: derive_compare_facts("policy", json.dumps({"policy": {"general": {"name": "Zoom"},
+        "scope": {"computers": [{"id": 1, "name": m} for m in macs]}}}))["hash"]
+    members = lambda macs: derive_compare_facts("computer_group", json.dumps({"computer_group": {"name": "G",
+        "computers": [{"id": 1, "name": m} for m in macs]}}))["hash"]
+    check("drift: direct computer scoping counts, smart-group membership does not",
+          scoped_to(["mac1"]) != scoped_to(["mac2"]) and members(["mac1"]) == members(["mac2"]))
+    drift = compare_instances({"policy": {"Zoom": {"id": 4, **prod}, "Old": {"id": 5, **prod}}},
+                              {"policy": {"Zoom": {"id": 90, **derive_compare_facts("policy", json.dumps(
+                                  {"policy": {"general": {"name": "Zoom", "enabled": False}}}))}}})
+    check("drift: missing + field-level diff",
+          [m["name"] for m in drift["policy"]["missing"]] == ["Old"] and
+          {"path": "general.enabled", "left": True, "right": False} in drift["policy"]["changed"][0]["diffs"])
+    with tempfile.TemporaryDirectory() as tmp:
+        dpath = os.path.join(tmp, "drift.jsonl")
+        dwriter = JsonlWriter(open_output(dpath))
+        dwriter.section("drift_policy", drift_records(drift["policy"]))
+        dwriter.close()
+        with open(dpath) as f:
+            drift_lines = [json.loads(line) for line in f]
+    check("drift: jsonl is one record per drift item",
+          [(r.get("report"), r.get("drift"), r.get("name")) for r in drift_lines] ==
+          [("drift_policy", "missing", "Old"), ("drift_policy", "changed", "Zoom"), (None, None, None)])
+
+    dgraph = ObjectGraph()
+    dgraph.add_edge(("policy", 1), ("package", 2), "policy_package")
+    ddata = {"packages": [{"id": i, "name": f"Office {i}.pkg"} for i in (1, 2, 3, 4)],
+             "package_facts": {1: {"filename": "Office.pkg", "size": 100, "hash_type": "MD5", "hash_value": "ab"},
+                               2: {"filename": "Office copy.pkg", "size": 100, "hash_type": "MD5", "hash_value": "ab"},
+                               3: {"filename": "Office.pkg", "size": 100, "hash_type": "MD5", "hash_value": "ab"},
+                               4: {"filename": "Other.pkg", "size": 50, "hash_type": "MD5", "hash_value": "cd"}},
+             "scripts": [{"id": 7, "name": "a.sh"}, {"id": 8, "name": "b.sh"}],
+             "script_facts": {7: derive_script_facts(json.dumps({"script": {"script_contents": "#!/bin/sh\n# v1\necho  hi\n"}})),
+                              8: derive_script_facts(json.dumps({"script": {"script_contents": "#!/bin/sh\n\necho hi\n# v2"}}))}}
+    dup = duplicate_package_rows(ddata, dgraph)
+    check("duplicates: packages grouped by hash, referenced copy kept, unreferenced copies reclaimable",
+          len(dup) == 1 and dup[0]["id"] == 2 and dup[0]["wasted_bytes"] == 200 and dup[0]["reclaimable_bytes"] == 200)
+    ddata["packages"] += [{"id": 5, "name": "NoSize.pkg"}, {"id": 6, "name": "NoSize copy.pkg"}]
+    ddata["package_facts"].update({5: {"filename": "NoSize.pkg", "size": None, "hash_type": "MD5", "hash_value": "ef"},
+                                   6: {"filename": "NoSize.pkg", "size": None, "hash_type": "MD5", "hash_value": "ef"}})
+    dup = duplicate_package_rows(ddata, dgraph)
+    check("duplicates: unknown size stays None and ranks after sized rows",
+          [r["id"] for r in dup] == [2, 5] and dup[1]["wasted_bytes"] is None and dup[1]["reclaimable_bytes"] is None
+          and "size unknown" in dup[1]["summary"])
+    check("duplicates: Jamf Pro package record gives the size",
+          derive_package_facts(json.dumps({"id": "5", "fileName": "A.pkg", "size": "2048", "hashType": "SHA_512",
+                                           "hashValue": "AB"}))
+          == {"filename": "A.pkg", "size": 2048, "hash_type": "SHA_512", "hash_value": "ab"})
+    dup = duplicate_script_rows(ddata, dgraph)
+    check("duplicates: near-duplicate scripts after whitespace/comment normalization",
+          len(dup) == 1 and dup[0]["basis"].startswith("identical ignoring"))
+
+    lflags = extract_policy_flags({"policy": {"general": {"enabled": True, "frequency": "Ongoing",
+                                                          "trigger_checkin": True, "trigger_login": True}}})
+    ldata = {"policies": [{"id": 1, "name": "Inventory"}, {"id": 2, "name": "Once"}],
+             "policy_flags": {1: lflags, 2: {**lflags, "frequency": "Once per computer"}},
+             "policies_scopes": {1: {**_empty_scope(), "all_computers": True}, 2: {**_empty_scope(), "all_computers": True}},
+             "policy_packages": {1: {5}, 2: set()}, "package_facts": {5: {"size": 1000}},
+             "scope_resolver": ScopeResolver([{"id": i, "name": f"m{i}"} for i in range(10)], {}, [], [])}
+    load = policy_load_rows(ldata, 30)
+    check("policy load: (48 check-ins + 2 logins)/day × 10 devices, 'Once per computer' ≈ 0 runs",
+          load[0]["id"] == 1 and load[0]["executions_per_day"] == 500 and load[0]["download_bytes_per_day"] == 500000
+          and load[1]["executions_per_day"] == 0 and load[1]["evaluations_per_day"] == 500)
+
+    rres = ScopeResolver([{"id": i, "name": f"m{i}"} for i in range(10)], {1: [0, 1, 2, 3], 2: [2, 3, 4], 3: [8]}, [], [])
+    rscope = lambda g: {**_empty_scope(), "targets_groups": [g]}
+    rdata = {"policies": [{"id": i, "name": f"P{i}"} for i in (1, 2, 3)], "packages": [{"id": 9, "name": "Zoom.pkg"}],
+             "policy_flags": {i: {"enabled": True} for i in (1, 2, 3)},
+             "policies_scopes": {1: rscope(1), 2: rscope(2), 3: rscope(3)},
+             "policy_packages": {1: {9}, 2: {9}, 3: {9}}, "package_facts": {9: {"size": 100}}, "scope_resolver": rres}
+    red = redundant_delivery_rows(rdata)
+    check("redundant delivery: overlap of group scopes via bitmaps",
+          len(red) == 1 and red[0]["devices_reached_more_than_once"] == 2 and red[0]["redundant_bytes"] == 200
+          and [p["overlapping_devices"] for p in red[0]["policies"]] == [2, 2, 0])
+
+    rec_scope = parse_scope_json(SELFTEST_POLICY_JSON)
+    rec_scope["targets_computers"] = list(range(100, 140))   # long enough to be packed into array('i')
+    packed = Scope(rec_scope)
+    check("records: packed Scope reads like the dict and round-trips to identical JSON",
+          isinstance(packed.targets_computers, array) and packed.get("excl_groups") == tuple(rec_scope["excl_groups"])
+          and j_is_scoped(packed) and as_plain(packed) == rec_scope and ObjRef(3, "x")["name"] == "x")
+    small = [synthetic_state(2000, compact) for compact in (False, True)]
+    small_reports = [json.dumps(compute_reports(d, DEFAULT_REPORTS + ["zero_effective_scope_policies", "policy_load"]),
+                                sort_keys=True) for d in small]
+    check("records: reports on a synthetic tenant match the dict layout", small_reports[0] == small_reports[1])
+
+    now_ms = int(time.time() * 1000)
+    runs = PolicyRunStats(time.time() - 30 * 86400)
+    for c in range(3):
+        runs.fold(json.dumps({"computer_history": {"policy_logs": [
+            {"policy_id": 1, "date_completed_epoch": now_ms - 86400000, "status": "Completed"},
+            {"policy_id": 2, "date_completed_epoch": now_ms - 40 * 86400000},
+            {"policy_id": 2, "date_completed_epoch": now_ms - 86400000, "status": "Failed"},
+            {"policy_id": 4, "date_completed_epoch": now_ms - 86400000, "status": "Failed"}]}}).encode())
+    scoped = {"all_computers": True}
+    rows = stale_policy_rows([{"id": i, "name": f"P{i}"} for i in (1, 2, 3, 4)], {i: scoped for i in (1, 2, 3, 4)},
+                             {i: {"enabled": True} for i in (1, 2, 3, 4)}, runs, 30)
+    check("history: per-policy fold, stale = no run in window (never-run first)",
+          [r["id"] for r in rows] == [3, 4, 2] and rows[2]["runs"] == 3 and runs.summary()["computers_scanned"] == 3)
+    check("history: failed runs are counted separately and never count as a recent run",
+          rows[2]["failed_runs"] == 3 and rows[1]["runs"] == 0 and rows[1]["failed_runs"] == 3
+          and rows[1]["summary"] == "never completed (3 failed runs)")
+    return 1 if failures else 0
+
+def make_scheduler(args) -> FetchScheduler:
+    return FetchScheduler(min_concurrency=args.min_concurrency, max_concurrency=args.max_concurrency,
+                          max_retries=args.max_retries, debug=args.debug_list)
+
+def run_moves(j, moves: List[Dict[str, Any]], args, sched: FetchScheduler, journal_path: Optional[str]=None,
+              action: str = "move"):
+    if not moves:
+        print(f"[{action}] nothing to do", file=sys.stderr); return
+    journal_path = journal_path or args.journal or time.strftime("jamf-archive-%Y%m%d-%H%M%S.journal.jsonl")
+    ok, failed = apply_moves(j, moves, MoveJournal(journal_path), sched, RateLimiter(args.rate_limit), action=action)
+    print(f"[{action}] {ok} ok, {failed} failed; journal: {journal_path}", file=sys.stderr)
+
 def main():
     ap = argparse.ArgumentParser(description="Jamf Pro cleanup audit — v13.0")
-    ap.add_argument("--format", choices=["table","json"], default="table")
-    ap.add_argument("--out", help="Write JSON to file when --format json")
+    ap.add_argument("--format", choices=["table","json","jsonl"], default="table")
+    ap.add_argument("--out", help="Write JSON to file when --format json; with jsonl, records go only to this file")
+    ap.add_argument("--gzip", action="store_true", help="gzip --out (implied when --out ends in .gz)")
     ap.add_argument("--insecure", action="store_true")
     ap.add_argument("--timeout", type=int, default=30)
     ap.add_argument("--debug-auth", action="store_true")
@@ -431,13 +2675,60 @@ def main():
     ap.add_argument("--inspect-scope", action="store_true")
     ap.add_argument("--why-policy", type=int)
     ap.add_argument("--why-profile", type=int)
+    ap.add_argument("--why-script", type=int, help="Objects that reference this script (dependency graph)")
+    ap.add_argument("--why-package", type=int, help="Objects that reference this package (dependency graph)")
+    ap.add_argument("--why-group", type=int, help="Direct and nested-group dependents of this computer group")
+    ap.add_argument("--compare-url", default=os.environ.get("JAMF_COMPARE_URL"),
+                    help="Compare JAMF_URL against this second instance (creds: JAMF_COMPARE_* env, else the primary's)")
+    ap.add_argument("--compare-types", default=",".join(COMPARE_TYPES),
+                    help="Object types to compare (default: " + ",".join(COMPARE_TYPES) + ")")
+    ap.add_argument("--serve", metavar="[HOST:]PORT",
+                    help="Run a local HTTP/JSON query server over an in-memory audit snapshot (e.g. 127.0.0.1:8765)")
+    ap.add_argument("--serve-interval", type=float, default=900,
+                    help="Seconds between background snapshot refreshes in --serve mode (default: 900)")
+    ap.add_argument("--graph-out", help="Export the object dependency graph (.graphml → GraphML, otherwise JSON)")
+    ap.add_argument("--self-test", action="store_true", help="Run parser parity checks on recorded fixtures without Jamf access")
+    ap.add_argument("--benchmark", action="store_true", help="Time parsers and measure audit-state memory on synthetic data without Jamf access")
+
+    ap.add_argument("--reports", type=parse_report_selection, default=list(DEFAULT_REPORTS),
+                    help="Comma-separated reports to run, or 'all' (default: the cleanup reports); only the data "
+                         "they need is fetched. Choices: " + ", ".join(REPORTS))
+    ap.add_argument("--history-days", type=float, default=90,
+                    help="stale_policies: a policy is stale when it has not run in this many days (default: 90)")
+    ap.add_argument("--checkin-minutes", type=float, default=15,
+                    help="policy_load: client check-in interval in minutes (default: 15)")
+
+    # fetch scheduling
+    ap.add_argument("--max-concurrency", type=int, default=16,
+                    help="Upper bound for adaptive detail-fetch concurrency (default: 16)")
+    ap.add_argument("--min-concurrency", type=int, default=2,
+                    help="Lower bound for adaptive detail-fetch concurrency (default: 2)")
+    ap.add_argument("--max-retries", type=int, default=3,
+                    help="Retries per object on 429/5xx/network errors (default: 3)")
+
+    # detail cache
+    ap.add_argument("--cache-dir", help="Enable the on-disk detail cache in this directory")
+    ap.add_argument("--cache-max-mb", type=float, default=256, help="Cache size cap, LRU-evicted (default: 256)")
+    ap.add_argument("--cache-max-age", type=float, default=168, help="Ignore cache entries older than N hours (default: 168)")
+    ap.add_argument("--refresh", action="store_true", help="Bypass cached entries for this run (cache is rewritten)")
 
     # archive controls
     ap.add_argument("--move-to-archive", action="store_true",
                     help="Move unscoped policies/profiles and unused scripts/packages to z_Archive (or --archive-category)")
     ap.add_argument("--archive-category", default="z_Archive",
                     help="Category name to move items into (default: z_Archive)")
+    ap.add_argument("--plan-out", help="Write the intended archive moves (with original categories) to this JSON file")
+    ap.add_argument("--apply-plan", help="Apply a plan written by --plan-out (no audit is run)")
+    ap.add_argument("--undo-journal", help="Restore original categories recorded in a move journal")
+    ap.add_argument("--journal", help="Append-only move journal path (default: <plan>.journal.jsonl, "
+                                      "or jamf-archive-<timestamp>.journal.jsonl for --move-to-archive)")
+    ap.add_argument("--rate-limit", type=float, default=5.0,
+                    help="Max category PUTs per second when moving (default: 5, 0 = unlimited)")
     args = ap.parse_args()
+    if args.self_test:
+        sys.exit(run_self_test())
+    if args.benchmark:
+        sys.exit(run_benchmark())
 
     base_url = os.environ.get("JAMF_URL")
     client_id = os.environ.get("JAMF_CLIENT_ID")
@@ -456,8 +2747,7 @@ def main():
             pid = args.inspect_policy or args.why_policy
             rj = j.get(f"/JSSResource/policies/id/{pid}")
             raw = jload(rj) or {}
-            rx = j.get(f"/JSSResource/policies/id/{pid}/subset/Scope", accept="application/xml")
-            sc = parse_scope_subset(rx.text)
+            sc = fetch_policy_scope(j, pid, raw)
             flags = extract_policy_flags(raw)
             s_ids, p_ids = collect_policy_refs_from_json(raw)
             print(json.dumps({"policy_id": pid, "scope": sc, "flags": flags,
@@ -470,113 +2760,155 @@ def main():
             print(json.dumps({"profile_id": cid, "scope": sc}, indent=2))
         return
 
-    # Lists
-    policies = list_policies(j, args.debug_list)
-    profiles = list_profiles(j, args.debug_list)
-    scripts = list_scripts(j, args.debug_list)
-    packages = list_packages(j, args.debug_list)
-    groups = list_groups(j, args.debug_list)
+    if args.undo_journal:
+        moves = undo_moves_from_journal(MoveJournal.read(args.undo_journal))
+        run_moves(j, moves, args, make_scheduler(args), journal_path=args.undo_journal, action="restore")
+        return
+    if args.apply_plan:
+        with open(args.apply_plan) as f:
+            plan = json.load(f)
+        if plan.get("jamf_url") and plan["jamf_url"].rstrip("/") != j.base_url:
+            print(f"ERROR: plan was generated for {plan['jamf_url']}, not {j.base_url}", file=sys.stderr); sys.exit(2)
+        if plan.get("blocked"):
+            print(f"ERROR: plan is blocked: {plan['blocked']}. Re-run the audit to build a complete plan.",
+                  file=sys.stderr); sys.exit(2)
+        run_moves(j, plan_to_moves(plan), args, make_scheduler(args),
+                  journal_path=args.journal or args.apply_plan + ".journal.jsonl")
+        return
 
-    used_script_ids: Set[int] = set()
-    used_package_ids: Set[int] = set()
-    used_group_ids: Set[int] = set()
+    if args.compare_url:
+        other = JamfClient(args.compare_url, os.environ.get("JAMF_COMPARE_CLIENT_ID", client_id),
+                           os.environ.get("JAMF_COMPARE_CLIENT_SECRET", client_secret),
+                           os.environ.get("JAMF_COMPARE_USER", user), os.environ.get("JAMF_COMPARE_PASSWORD", password),
+                           timeout=args.timeout, verify_tls=(not args.insecure), debug_auth=args.debug_auth)
+        types = [t.strip() for t in args.compare_types.split(",") if t.strip()]
+        unknown = [t for t in types if t not in COMPARE_TYPES]
+        if unknown:
+            print(f"ERROR: unknown --compare-types {unknown}; choose from {list(COMPARE_TYPES)}", file=sys.stderr); sys.exit(2)
+        # cache entries are keyed by object id, so each instance gets its own subdirectory
+        caches = [DetailCache(os.path.join(args.cache_dir, hashlib.sha1(c.base_url.encode()).hexdigest()[:12]),
+                              max_bytes=int(args.cache_max_mb * 1024 * 1024 / 2),
+                              max_age=args.cache_max_age * 3600, refresh=args.refresh) if args.cache_dir else None
+                  for c in (j, other)]
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            futs = [ex.submit(fetch_instance_hashes, c, types, make_scheduler(args), cc, args.debug_list)
+                    for c, cc in zip((j, other), caches)]
+            left, right = (f.result() for f in futs)
+        for cc in caches:
+            if cc: cc.prune()
+        drift = compare_instances(left, right)
+        if args.format == "jsonl":
+            writer = JsonlWriter(open_output(args.out, args.gzip))
+            writer.write({"record": "stats", "left": j.base_url, "right": other.base_url,
+                          "identical": {kind: r["identical"] for kind, r in drift.items()}})
+            for kind, r in drift.items():
+                writer.section(f"drift_{kind}", drift_records(r))
+            writer.close()
+            if args.out:
+                print(f"[jsonl] {sum(writer.counts.values())} drift item(s) written to {args.out}", file=sys.stderr)
+        elif args.format == "json":
+            text = json.dumps({"left": j.base_url, "right": other.base_url, "types": drift}, indent=2, default=str)
+            if args.out:
+                with open_output(args.out, args.gzip) as f:
+                    f.write(text)
+            print(text)
+        else:
+            print_drift(drift, j.base_url, other.base_url)
+        return
 
-    # Fetch details
-    def fetch_policy_info(p):
-        pid = p["id"]
-        rj = j.get(f"/JSSResource/policies/id/{pid}")
-        raw = jload(rj) or {}
-        rx = j.get(f"/JSSResource/policies/id/{pid}/subset/Scope", accept="application/xml")
-        sc = parse_scope_subset(rx.text)
-        s_ids, p_ids = collect_policy_refs_from_json(raw)
-        flags = extract_policy_flags(raw)
-        # policy name fallback
-        name = p["name"]
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        serve_reports = ([r for r in REPORTS if r not in FLEET_SCAN_REPORTS]
+                         if args.reports == DEFAULT_REPORTS else args.reports)
+        serve_needs = plan_fetch(serve_reports, GRAPH_UNITS)
+        cache = None
+        if args.cache_dir:
+            cache = DetailCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 1024 * 1024),
+                                max_age=args.cache_max_age * 3600, refresh=args.refresh)
+        def build_snapshot():
+            data = collect_audit_data(j, serve_needs, make_scheduler(args), cache, debug=args.debug_list,
+                                      history_days=args.history_days, checkin_minutes=args.checkin_minutes)
+            if cache: cache.prune()
+            return {"data": data, "reports": compute_reports(data, serve_reports)}
+        service = AuditService(build_snapshot, interval=args.serve_interval)
+        httpd = make_query_server(service, host or "127.0.0.1", int(port))
+        threading.Thread(target=service.refresh, name="audit-initial", daemon=True).start()
+        service.start_background()
+        print(f"[serve] listening on http://{httpd.server_address[0]}:{httpd.server_address[1]} "
+              f"(refresh every {int(args.serve_interval)}s)", file=sys.stderr)
         try:
-            name = (raw.get("policy", raw).get("general", {}) or {}).get("name", name)
-        except Exception:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
             pass
-        return pid, sc, s_ids, p_ids, flags, name
+        finally:
+            service.stop(); httpd.server_close()
+        return
 
-    def fetch_profile_scope(p):
-        cid = p["id"]
-        rx = j.get(f"/JSSResource/osxconfigurationprofiles/id/{cid}/subset/Scope", accept="application/xml")
-        sc = parse_scope_subset(rx.text)
-        return cid, sc
+    why_nodes = [(kind, oid) for kind, oid in (("script", args.why_script), ("package", args.why_package),
+                                               ("group", args.why_group)) if oid]
+    selected = [] if why_nodes else args.reports
+    if args.move_to_archive:
+        # archive candidates come from these reports even when they are not printed
+        archive_reports = ["unscoped_policies", "unscoped_profiles", "unused_scripts", "unused_packages"]
+        computed = [r for r in REPORTS if r in selected or r in archive_reports]
+    else:
+        computed = selected
+    needs = plan_fetch(computed, GRAPH_UNITS if (why_nodes or args.graph_out) else ())
+    if args.debug_list:
+        print(f"[plan] reports={','.join(computed)} fetch={','.join(sorted(needs))}", file=sys.stderr)
 
-    policies_scopes: Dict[int, Dict[str,Any]] = {}
-    policy_flags: Dict[int, Dict[str,Any]] = {}
-    policy_names: Dict[int, str] = {}
+    cache = None
+    if args.cache_dir:
+        cache = DetailCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 1024 * 1024),
+                            max_age=args.cache_max_age * 3600, refresh=args.refresh)
+    sched = make_scheduler(args)
 
-    with ThreadPoolExecutor(max_workers=8) as ex:
-        futs = {ex.submit(fetch_policy_info, p): p["id"] for p in policies}
-        for fut in as_completed(futs):
-            pid = futs[fut]
-            try:
-                pid, sc, s_ids, p_ids, flags, pname = fut.result()
-                used_script_ids |= set(int(x) for x in s_ids)
-                used_package_ids |= set(int(x) for x in p_ids)
-                policies_scopes[pid] = sc
-                policy_flags[pid] = flags
-                policy_names[pid] = pname
-                for gid in (sc["targets_groups"] + sc["excl_groups"]):
-                    used_group_ids.add(gid)
-            except Exception as e:
-                print(f"[warn] policy {pid} detail failed: {e}", file=sys.stderr)
-
-    profiles_scopes: Dict[int, Dict[str,Any]] = {}
-    with ThreadPoolExecutor(max_workers=8) as ex:
-        futs = {ex.submit(fetch_profile_scope, p): p["id"] for p in profiles}
-        for fut in as_completed(futs):
-            cid = futs[fut]
-            try:
-                cid, sc = fut.result()
-                profiles_scopes[cid] = sc
-                for gid in (sc["targets_groups"] + sc["excl_groups"]):
-                    used_group_ids.add(gid)
-            except Exception as e:
-                print(f"[warn] profile {cid} detail failed: {e}", file=sys.stderr)
-
-    # Compute sets
-    def is_scoped(sc: Dict[str, Any]) -> bool:
-        return bool(sc.get("all_computers") or sc.get("targets_groups") or sc.get("targets_computers") or
-                    sc.get("targets_buildings") or sc.get("targets_departments") or
-                    sc.get("excl_groups") or sc.get("excl_computers"))
-
-    unscoped_policies = [{"id": p["id"], "name": p["name"]} for p in policies if not is_scoped(policies_scopes.get(p["id"], {}))]
-    unscoped_profiles = [{"id": p["id"], "name": p["name"]} for p in profiles  if not is_scoped(profiles_scopes.get(p["id"], {}))]
-    unused_scripts   = [s for s in scripts  if s.get("id") not in used_script_ids]
-    unused_packages  = [p for p in packages if p.get("id") not in used_package_ids]
-    unused_groups    = [g for g in groups   if g.get("id") not in used_group_ids]
-
-    # NEW reports
-    policies_no_triggers_and_not_ss = [
-        {"id": pid, "name": policy_names.get(pid, ""), "frequency": policy_flags[pid].get("frequency")}
-        for pid in policy_flags
-        if (not policy_flags[pid].get("any_trigger", False)) and (not policy_flags[pid].get("self_service_enabled", False))
-    ]
+    data = collect_audit_data(j, needs, sched, cache, debug=args.debug_list, history_days=args.history_days,
+                              checkin_minutes=args.checkin_minutes)
+    if args.debug_list:
+        print(f"[fetch] {sched.stats}", file=sys.stderr)
+    if cache:
+        cache.prune()
+        if args.debug_list:
+            print(f"[cache] {cache.stats}", file=sys.stderr)
 
-    active_self_service_policies = [
-        {"id": pid, "name": policy_names.get(pid, ""), "frequency": policy_flags[pid].get("frequency")}
-        for pid in policy_flags
-        if policy_flags[pid].get("enabled", False) and policy_flags[pid].get("self_service_enabled", False)
-    ]
+    writer = None
+    if args.format == "jsonl" and not why_nodes:
+        writer = JsonlWriter(open_output(args.out, args.gzip))
+        writer.write({"record": "stats", "jamf_url": j.base_url, **audit_stats(data)})
+    reports: Dict[str, List[Dict[str, Any]]] = {}
+    for name, rows in iter_reports(data, computed):
+        reports[name] = rows
+        if writer and name in selected:
+            writer.section(name, rows)
+    if writer:
+        writer.close()
+        if args.out:
+            print(f"[jsonl] {sum(writer.counts.values())} finding(s) written to {args.out}", file=sys.stderr)
 
-    # Optional archive moves
-    if args.move_to_archive:
-        cat = args.archive_category
-        for item in unscoped_policies:
-            try: move_policy_to_category(j, item["id"], cat)
-            except Exception as e: print(f"[error] move policy {item['id']} failed: {e}", file=sys.stderr)
-        for item in unscoped_profiles:
-            try: move_profile_to_category(j, item["id"], cat)
-            except Exception as e: print(f"[error] move profile {item['id']} failed: {e}", file=sys.stderr)
-        for item in unused_scripts:
-            try: move_script_to_category(j, item["id"], cat)
-            except Exception as e: print(f"[error] move script {item['id']} failed: {e}", file=sys.stderr)
-        for item in unused_packages:
-            try: move_package_to_category(j, item["id"], cat)
-            except Exception as e: print(f"[error] move package {item['id']} failed: {e}", file=sys.stderr)
+    if args.graph_out:
+        with open(args.graph_out, "w") as f:
+            if args.graph_out.lower().endswith(".graphml"):
+                data["graph"].write_graphml(f)
+            else:
+                json.dump(data["graph"].to_json(), f, indent=2)
+        print(f"[graph] written to {args.graph_out}", file=sys.stderr)
+    if why_nodes:
+        out = [data["graph"].describe(n) for n in why_nodes]
+        print(json.dumps(out[0] if len(out) == 1 else out, indent=2))
+        return
+
+    # Archive plan / moves
+    if args.plan_out or args.move_to_archive:
+        plan = build_archive_plan(j, reports, args.archive_category, sched, data.get("fetch_failures"))
+        if args.plan_out:
+            with open(args.plan_out, "w") as f:
+                json.dump(plan, f, indent=2)
+            print(f"[plan] {len(plan['moves'])} move(s) written to {args.plan_out}", file=sys.stderr)
+        if args.move_to_archive and plan.get("blocked"):
+            print(f"ERROR: --move-to-archive not applied: {plan['blocked']}", file=sys.stderr)
+        elif args.move_to_archive:
+            run_moves(j, plan_to_moves(plan), args, sched)
 
     # Output
     def print_section(title, rows):
@@ -590,49 +2922,28 @@ def main():
                 rid, name = r
             else:
                 rid, name = r.get('id'), r.get('name')
+                detail = r.get('summary') or r.get('reason')
+                if detail:
+                    name = f"{name}  — {detail}"
             print(f"{rid:>8}  {name}")
 
+    if args.format == "jsonl":
+        return
     if args.format == "json":
-        outj = {
-            "stats": {
-                "policies_total": len(policies),
-                "profiles_total": len(profiles),
-                "scripts_total": len(scripts),
-                "packages_total": len(packages),
-                "groups_total": len(groups),
-            },
-            "unscoped_policies": unscoped_policies,
-            "unscoped_profiles": unscoped_profiles,
-            "unused_scripts": [{"id": s.get("id"), "name": s.get("name")} for s in unused_scripts],
-            "unused_packages": [{"id": p.get("id"), "name": p.get("name")} for p in unused_packages],
-            "unused_groups": [{"id": g.get("id"), "name": g.get("name"), "is_smart": g.get("is_smart")} for g in unused_groups],
-            "policies_no_triggers_and_not_selfservice": policies_no_triggers_and_not_ss,
-            "active_policies_selfservice_enabled": active_self_service_policies,
-        }
+        outj = {"stats": audit_stats(data)}
+        outj.update({name: reports[name] for name in selected})
+        text = json.dumps(outj, indent=2)   # serialized once, written to both targets
         if args.out:
-            with open(args.out, "w") as f:
-                json.dump(outj, f, indent=2)
-        print(json.dumps(outj, indent=2))
+            with open_output(args.out, args.gzip) as f:
+                f.write(text)
+        print(text)
         return
 
     print(f"Jamf Cleanup Audit — {j.base_url}")
-    print("Totals:", {
-        "policies_total": len(policies),
-        "profiles_total": len(profiles),
-        "scripts_total": len(scripts),
-        "packages_total": len(packages),
-        "groups_total": len(groups),
-    })
-
-    print_section("Unscoped Policies", [(x["id"], x["name"]) for x in unscoped_policies])
-    print_section("Unscoped macOS Configuration Profiles", [(x["id"], x["name"]) for x in unscoped_profiles])
-    print_section("Unused Scripts", [(x["id"], x["name"]) for x in unused_scripts])
-    print_section("Unused Packages", [(x["id"], x["name"]) for x in unused_packages])
-    print_section("Unused Computer Groups", [(x["id"], x["name"]) for x in unused_groups])
-
-    # NEW sections
-    print_section("Policies with NO Triggers AND NOT Self Service", policies_no_triggers_and_not_ss)
-    print_section("Active Policies with Self Service enabled", active_self_service_policies)
+    print("Totals:", audit_stats(data))
+
+    for name in selected:
+        print_section(REPORTS[name][0], reports[name])
 
 if __name__ == "__main__":
     try: